@@ -0,0 +1,22 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    # The file shows up under `path` complete or not at all: it is written
+    # next to it under a temporary name, synced and then renamed over it. If
+    # writing fails, the old file stays and the temporary one is removed.
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,272 @@
+import inspect
+import shlex
+import time
+
+from Address_Book import contacts_io, sort, validation
+from Address_Book.classes import Address, Birthday, Email, Name, Note, Phone, Record
+from Address_Book.metrics import METRICS
+
+
+# Argument-taking variants of the interactive commands. Every handler gets the
+# address book, the notebook and the arguments of its line, returns the text
+# to print and raises ValueError or KeyError for a line that cannot be run.
+
+def _phone(value):
+    phone = validation.normalize_phone(value)
+    if phone is None:
+        raise ValueError(f"Invalid phone number '{value}'")
+    return phone
+
+
+def _birthday(value):
+    if not validation.is_valid_birthday(value):
+        raise ValueError(f"Incorrect birthday '{value}'. Please use the format DD.MM.YYYY")
+    return value
+
+
+def _contact(address_book, name):
+    record = address_book.get(name)
+    if record is None:
+        raise KeyError(f"No contact '{name}' in address book")
+    return record
+
+
+def _notes_text(notes):
+    return "\n".join(f"Note: {note.text}" for note in notes) or "No notes found."
+
+
+def add_contact(address_book, notebook, name, phone="", birthday="", address="", email=""):
+    if name in address_book:
+        raise ValueError(f"Contact '{name}' already exists")
+    if email and not validation.is_valid_email(email):
+        raise ValueError(f"Invalid e-mail address '{email}'")
+    record = Record(Name(name),
+                    Phone(_phone(phone)) if phone else None,
+                    Birthday(_birthday(birthday)) if birthday else None,
+                    Address(address) if address else None,
+                    Email(email) if email else None)
+    address_book.add_record(record)
+    return f"Contact '{name}' successfully added."
+
+
+def add_phone(address_book, notebook, name, phone):
+    phone = _phone(phone)
+    _contact(address_book, name).add_phone(Phone(phone))
+    return f"Phone number '{phone}' added to contact '{name}'."
+
+
+def _phone_of(record, value):
+    # the contact's own Phone for a number, however it was written when added
+    phone = _phone(value)
+    for field in record.phones:
+        if validation.normalize_phone(field.value) == phone:
+            return field
+    raise ValueError(f"Phone number '{value}' is not one of contact '{record.name}'")
+
+
+def del_phone(address_book, notebook, name, phone):
+    record = _contact(address_book, name)
+    return record.del_phone(_phone_of(record, phone))
+
+
+def change_phone(address_book, notebook, name, old_phone, new_phone):
+    record = _contact(address_book, name)
+    field, new_phone = _phone_of(record, old_phone), _phone(new_phone)
+    field.value = new_phone
+    return f"Phone number '{old_phone}' of contact '{name}' changed to '{new_phone}'."
+
+
+def add_birthday(address_book, notebook, name, birthday):
+    _contact(address_book, name).add_birthday(Birthday(_birthday(birthday)))
+    return f"Birthday updated for contact '{name}'."
+
+
+def delete_contact(address_book, notebook, name):
+    _contact(address_book, name)
+    address_book.delete_record(name)
+    return f"Contact '{name}' removed."
+
+
+def days_to_birthday(address_book, notebook, name):
+    days = _contact(address_book, name).days_to_birthday()
+    if days is None:
+        return f"The birthday of contact '{name}' is not specified."
+    return f"Contact '{name}' birthday is in '{days}' days."
+
+
+def show_birthday(address_book, notebook, days):
+    records = address_book.birthdays_on(int(days))
+    return "\n".join(str(record) for record in records) or f"No contacts have birthdays {days} days from now."
+
+
+def week_birthdays(address_book, notebook):
+    upcoming = address_book.upcoming_birthdays(7)
+    lines = [f"{day.strftime('%A %d.%m')}: {', '.join(str(r.name) for r in records)}"
+             for day, records in upcoming.items()]
+    return "\n".join(lines) or "No birthdays in the next 7 days."
+
+
+def show_all(address_book, notebook):
+    return str(address_book) or "The address book is empty."
+
+
+def search_by_name(address_book, notebook, query):
+    return "\n".join(str(r) for r in address_book.search_by_name(query)) or "No contacts found for the given name."
+
+
+def search_similar(address_book, notebook, query, max_distance="2"):
+    records = address_book.search_by_name_fuzzy(query, int(max_distance))
+    return "\n".join(str(r) for r in records) or "No contacts with a similar name."
+
+
+def search_by_phone(address_book, notebook, query):
+    return "\n".join(str(r) for r in address_book.search_by_phone(query)) or "No contacts found for the given phone."
+
+
+def check_contacts(address_book, notebook):
+    problems = validation.find_invalid((key, record.to_dict()) for key, record in address_book.items())
+    return "\n".join(f"{key}: {reason}" for key, reason in problems) or "All contacts are valid."
+
+
+def add_note(address_book, notebook, text, *tags):
+    notebook.add_note(Note(text, list(dict.fromkeys(tags))))
+    return f"Note '{text}' added."
+
+
+def add_tag(address_book, notebook, text, tag):
+    note = notebook.get_note_by_text(text)
+    if note is None:
+        raise KeyError(f"Note with text '{text}' not found.")
+    note.add_tag(tag)
+    return f"Tag '{tag}' added to note with text '{text}'."
+
+
+def change_note(address_book, notebook, old_text, new_text):
+    return notebook.edit_note(old_text, new_text)
+
+
+def del_note(address_book, notebook, text):
+    return notebook.delete_note_by_text(text)
+
+
+def search_note(address_book, notebook, word):
+    return _notes_text(notebook.search_notes_by_word(word))
+
+
+def search_note_by_tag(address_book, notebook, *tags):
+    return _notes_text(notebook.search_notes_by_tags(tags))
+
+
+def show_notes(address_book, notebook):
+    return str(notebook) or "No notes found."
+
+
+def sort_folder(address_book, notebook, path):
+    return sort.sort_folder(path)
+
+
+def import_contacts(address_book, notebook, path, fmt=None):
+    try:
+        return str(contacts_io.import_contacts(path, address_book, fmt))
+    except OSError as error:
+        raise ValueError(f"Cannot read '{path}': {error.strerror}")
+
+
+def export_contacts(address_book, notebook, path, fmt=None):
+    try:
+        count = contacts_io.export_contacts(path, address_book, fmt)
+    except OSError as error:
+        raise ValueError(f"Cannot write '{path}': {error.strerror}")
+    return f"Exported {count} contacts to {path}."
+
+
+COMMANDS = {
+    "add": add_contact,
+    "add phone": add_phone,
+    "edit phone": add_phone,
+    "del phone": del_phone,
+    "change phone": change_phone,
+    "add birthday": add_birthday,
+    "edit birthday": add_birthday,
+    "del contact": delete_contact,
+    "days to birthday": days_to_birthday,
+    "show birthday": show_birthday,
+    "week birthdays": week_birthdays,
+    "show all": show_all,
+    "search by name": search_by_name,
+    "search by phone": search_by_phone,
+    "search similar": search_similar,
+    "check contacts": check_contacts,
+    "add note": add_note,
+    "add tag": add_tag,
+    "change note": change_note,
+    "del note": del_note,
+    "search note": search_note,
+    "search note by tag": search_note_by_tag,
+    "show notes": show_notes,
+    "sort folder": sort_folder,
+    "import contacts": import_contacts,
+    "export contacts": export_contacts,
+}
+LONGEST_COMMAND = max(len(name.split()) for name in COMMANDS)
+_signatures = {}
+
+
+def accepts(handler, *args) -> bool:
+    # whether the handler can be called with these arguments; checked before
+    # the call, so a TypeError raised inside a handler is not mistaken for
+    # a wrong number of arguments
+    signature = _signatures.get(handler)
+    if signature is None:
+        signature = _signatures[handler] = inspect.signature(handler)
+    try:
+        signature.bind(*args)
+    except TypeError:
+        return False
+    return True
+
+
+def parse_line(line):
+    # 'search note by tag work urgent' -> ('search note by tag', ['work', 'urgent'])
+    words = shlex.split(line, comments=True)
+    for size in range(min(LONGEST_COMMAND, len(words)), 0, -1):
+        name = " ".join(words[:size]).lower()
+        if name in COMMANDS:
+            return name, words[size:]
+    raise ValueError(f"Unknown command '{line.strip()}'")
+
+
+class BatchReport:
+    def __init__(self):
+        self.executed = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def __str__(self):
+        rate = self.executed / self.elapsed if self.elapsed else 0.0
+        return (f"Executed {self.executed} commands ({self.failed} failed) in {self.elapsed:.2f}s"
+                f" ({rate:.0f} commands/s).")
+
+
+def run_script(lines, address_book, notebook, out=print, quiet=False):
+    report = BatchReport()
+    for number, line in enumerate(lines, start=1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        report.executed += 1
+        try:
+            name, args = parse_line(line)
+            command = COMMANDS[name]
+            if not accepts(command, address_book, notebook, *args):
+                raise ValueError(f"wrong number of arguments for '{line.strip()}'")
+            with METRICS.timed(f"command.{name}"):
+                result = command(address_book, notebook, *args)
+        except (KeyError, ValueError) as error:
+            report.failed += 1
+            out(f"line {number}: {error.args[0] if error.args else error}")
+        else:
+            if not quiet and result:
+                out(result)
+    report.elapsed = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,69 @@
+from bisect import bisect_left, insort
+from calendar import isleap
+from datetime import date, timedelta
+
+from Address_Book.metrics import METRICS
+
+
+def occurrence(year: int, month: int, day: int) -> date:
+    # 29 February is celebrated on 28 February in non-leap years
+    if month == 2 and day == 29 and not isleap(year):
+        return date(year, 2, 28)
+    return date(year, month, day)
+
+
+def next_birthday(born: date, today: date) -> date:
+    upcoming = occurrence(today.year, born.month, born.day)
+    if upcoming < today:
+        upcoming = occurrence(today.year + 1, born.month, born.day)
+    return upcoming
+
+
+def calendar_segments(start: date, days: int):
+    # Splits the dates start..start + days into (year, (month, day), (month, day))
+    # ranges that do not cross a new year.
+    end = start + timedelta(days=days)
+    while start <= end:
+        last = min(end, date(start.year, 12, 31))
+        upper = (last.month, last.day)
+        if upper == (2, 28) and not isleap(last.year):
+            upper = (2, 29)
+        yield start.year, (start.month, start.day), upper
+        start = last + timedelta(days=1)
+
+
+# one (month, day) tuple per calendar day, shared by every BirthdayIndex
+MONTH_DAYS = {}
+
+
+class BirthdayIndex:
+    def __init__(self):
+        self.entries = []
+        self.days = {}
+
+    def add(self, key, born: date = None) -> None:
+        self.remove(key)
+        if born is None:
+            return
+        month_day = self.days[key] = MONTH_DAYS.setdefault((born.month, born.day), (born.month, born.day))
+        insort(self.entries, (*month_day, key))
+
+    def remove(self, key) -> None:
+        month_day = self.days.pop(key, None)
+        if month_day is not None:
+            del self.entries[bisect_left(self.entries, (*month_day, key))]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.days.clear()
+
+    def within(self, today: date, days: int) -> list:
+        found = []
+        for year, lower, upper in calendar_segments(today, days):
+            start = bisect_left(self.entries, lower)
+            end = bisect_left(self.entries, (upper[0], upper[1] + 1))
+            for month, day, key in self.entries[start:end]:
+                found.append((occurrence(year, month, day), key))
+        if METRICS.enabled:
+            METRICS.observe("scanned.BirthdayIndex", len(found))
+        return found
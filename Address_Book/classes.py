@@ -1,99 +1,185 @@
-from collections import UserDict
-from datetime import datetime
+from collections import UserDict, defaultdict
+from datetime import date, datetime, timedelta
+from functools import partial
+import heapq
+from itertools import islice
 import pickle
-import re
+
+from Address_Book import paging, query, validation
+from Address_Book.atomic import atomic_write
+from Address_Book.birthdays import BirthdayIndex, next_birthday
+from Address_Book.indexes import DomainIndex, FuzzyNameIndex, KeyIds, NameIndex, NoteTextIndex, PhoneIndex
+from Address_Book.metrics import METRICS
 
 
 class Field:
+    # Subclasses may keep their value in a more compact form: _pack turns a
+    # value into what is stored and _unpack turns it back. _record is the
+    # Record holding the field, told when the value is set.
+    __slots__ = ("_value", "_record")
+
     def __init__(self, value=None):
-        self._value = value
+        self._value = self._pack(value)
+
+    @classmethod
+    def _restore(cls, stored):
+        field = cls.__new__(cls)
+        field._value = stored
+        return field
+
+    @staticmethod
+    def _pack(value):
+        return value
+
+    @staticmethod
+    def _unpack(stored):
+        return stored
 
     @property
     def value(self):
-        return self._value
+        return self._unpack(self._value)
 
     @value.setter
     def value(self, new_value):
         self.validate(new_value)
-        self._value = new_value
+        self._value = self._pack(new_value)
+        record = getattr(self, "_record", None)
+        if record is not None:
+            record._changed()
 
     def validate(self, value):
         pass
 
+    def __getstate__(self):
+        return {"_value": self.value}
+
+    def __setstate__(self, state):
+        # also reads fields pickled before they had slots
+        self._value = self._pack(state.get("_value"))
+
     def __str__(self):
-        return str(self._value)
+        return str(self.value)
 
     def __repr__(self):
-        return str(self._value)
+        return str(self.value)
 
 
 class Name(Field):
+    __slots__ = ()
+
     def validate(self, value):  # LS -->
         if not value or not isinstance(value, str):  # LS -->
             raise ValueError("The name must be a non-empty string.")
 
 
 class Phone(Field):
+    # A number of digits, with or without a leading "+", is kept as one int:
+    # its digits behind a marker digit, 2 for "+" and 1 otherwise, so leading
+    # zeros survive.
+    __slots__ = ()
+
+    @staticmethod
+    def _pack(value):
+        if isinstance(value, str):
+            plus = value.startswith("+")
+            digits = value[1:] if plus else value
+            if digits.isascii() and digits.isdigit():
+                return int(("2" if plus else "1") + digits)
+        return value
+
+    @staticmethod
+    def _unpack(stored):
+        if isinstance(stored, int):
+            text = str(stored)
+            return ("+" if text[0] == "2" else "") + text[1:]
+        return stored
+
     @staticmethod
     def validate_phone(value: str):
-        correct = ("(", ")", "-", " ")
-        format_value = value
-        for i in correct:
-            format_value = format_value.replace(i, "")
-        if len(format_value) == 13 and format_value.startswith('+380'):
-            return format_value
-        elif len(format_value) == 12 and format_value.startswith('380'):
-            return f"+{format_value}"
-        elif len(format_value) == 11 and value.startswith('80'):
-            return f"+3{format_value}"
-        elif len(format_value) == 10 and format_value.startswith('0'):
-            return f"+38{format_value}"
-        else:
+        phone = validation.normalize_phone(value)
+        if phone is None:
             print("Invalid phone number. Please enter a new number.")
-            return f'Number {format_value} is not correct'
+            return f'Number {validation.strip_phone(value)} is not correct'
+        return phone
 
 
 class Birthday(Field):
+    # A valid date is kept as its ordinal; anything else is kept as given.
+    __slots__ = ()
+
+    @staticmethod
+    def _pack(value):
+        born = validation.parse_birthday(value)
+        if born is not None and validation.format_birthday(born) == value:
+            return born.toordinal()
+        return value
+
+    @staticmethod
+    def _unpack(stored):
+        if isinstance(stored, int):
+            return validation.format_birthday(date.fromordinal(stored))
+        return stored
+
     def validate(self, value):
-        if value:
-            try:
-                datetime.strptime(value, "%d.%m.%Y")
-            except ValueError:
-                raise ValueError("Incorrect birthday format. Please use the format DD.MM.YYYY")
+        if value and not validation.is_valid_birthday(value):
+            raise ValueError("Incorrect birthday format. Please use the format DD.MM.YYYY")
 
     def to_datetime(self):
+        born = self.to_date()
+        if born:
+            return datetime(born.year, born.month, born.day)
+
+    def to_date(self):
+        if isinstance(self._value, int):
+            return date.fromordinal(self._value)
         if self._value:
-            return datetime.strptime(self._value, "%d.%m.%Y")
+            born = validation.parse_birthday(self._value)
+            if born is None:
+                raise ValueError(f"Incorrect birthday '{self._value}'")
+            return born
 
 
 class Address(Field):
-    pass
+    __slots__ = ()
 
 
 class Email(Field):
+    __slots__ = ()
+
     @staticmethod
     def input_correct_email(value):
-        while len(value) != 0:
-            def analyze_email(email):
-                pattern = r"(^[a-zA-Z0-9_.+-]{2,}@([a-zA-Z0-9-]{2,}\." \
-                          r"[a-zA-Z0-9]+$|[a-zA-Z0-9-]{2,}\.[a-zA-Z0-9]+\.[a-zA-Z0-9]+$))"
-                return re.match(pattern, email) is not None
-            if analyze_email(value):
-                return f"Your email '{value}' is correct"
-            else:
-                value = input("Invalid e-mail address. Enter the email, or leave empty: ")
-            return value
+        # asks again until the address is valid or left empty
+        while value and not validation.is_valid_email(value):
+            value = input("Invalid e-mail address. Enter the email, or leave empty: ")
         return value
 
 
 class Note:
+    # _id identifies the note within its notebook: its number in a NoteBook,
+    # the row id in SQLite
+    __slots__ = ("_text", "tags", "_notebook", "_id", "__weakref__")
+
     def __init__(self, text, tags=None):
-        self.text = text
+        self._text = text
         self.tags = tags if tags is not None else []
+        self._notebook = None
+        self._id = None
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        old_text, self._text = self._text, text
+        if self._notebook is not None and text != old_text:
+            self._notebook._text_changed(self, old_text)
 
     def add_tag(self, tag=None):
         if tag not in self.tags:
             self.tags.append(tag)
+            if self._notebook is not None:
+                self._notebook._tag_added(self, tag)
 
     def __str__(self):
         return "Tags: " + ", ".join(self.tags) + "\n" + "Note: " + self.text
@@ -104,10 +190,53 @@ class Note:
 
 class NoteBook:
     def __init__(self):
-        self.notes = []
+        self._notes = {}
+        self._by_text = {}
+        self._tags = defaultdict(set)
+        self.text_index = NoteTextIndex()
+        self._order = {}
+        self._next_order = 0
+        self._listeners = []
+        self.version = 0
+
+    @property
+    def notes(self):
+        return list(self._notes.values())
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, *args):
+        # every change goes through here, so storages compare `version` with
+        # the one they last wrote to tell whether there is anything to save
+        self.version += 1
+        for listener in self._listeners:
+            listener(event, *args)
 
     def add_note(self, note):
-        self.notes.append(note)
+        key = id(note)
+        self._notes[key] = note
+        self._order[key] = note._id = self._next_order
+        self._next_order += 1
+        self._by_text.setdefault(note.text, []).append(key)
+        self.text_index.add(key, [note.text])
+        for tag in note.tags:
+            self._tags[tag].add(key)
+        note._notebook = self
+        self._notify("add", note)
+
+    def _tag_added(self, note, tag):
+        self._tags[tag].add(id(note))
+        self._notify("tag", note, tag)
+
+    def _unlink_text(self, key, text):
+        keys = self._by_text[text]
+        keys.remove(key)
+        if not keys:
+            del self._by_text[text]
+
+    def _ordered(self, keys):
+        return [self._notes[key] for key in sorted(keys, key=self._order.__getitem__)]
     
     def add_tag_to_note(self, word, tag):
         matching_notes = self.search_notes_by_word(word)
@@ -132,39 +261,60 @@ class NoteBook:
             return "Invalid choice. Tag not added."
 
     def get_note_by_text(self, text):
-        for note in self.notes:
-            if note.text == text:
-                return note
-        return None
+        keys = self._by_text.get(text)
+        return self._notes[keys[0]] if keys else None
     
     def delete_note_by_text(self, text):
-        for note in self.notes:
-            if note.text == text:
-                self.notes.remove(note)
-                return f"Note with text '{text}' removed."
-        return f"Note with text '{text}' not found."
+        note = self.get_note_by_text(text)
+        if note is None:
+            return f"Note with text '{text}' not found."
+        key = id(note)
+        del self._notes[key]
+        del self._order[key]
+        self._unlink_text(key, text)
+        self.text_index.remove(key)
+        for tag in note.tags:
+            self._tags[tag].discard(key)
+            if not self._tags[tag]:
+                del self._tags[tag]
+        note._notebook = None
+        self._notify("delete", note)
+        return f"Note with text '{text}' removed."
 
     def edit_note(self, old_text, new_text):
-        for note in self.notes:
-            if note.text == old_text:
-                note.text = new_text
-                return f"Note updated from '{old_text}' to '{new_text}'."
-        return f"Note with text '{old_text}' not found."
+        note = self.get_note_by_text(old_text)
+        if note is None:
+            return f"Note with text '{old_text}' not found."
+        note.text = new_text
+        return f"Note updated from '{old_text}' to '{new_text}'."
+
+    def _text_changed(self, note, old_text):
+        key = id(note)
+        self._unlink_text(key, old_text)
+        # keep the per-text lists in insertion order
+        keys = self._by_text.setdefault(note.text, [])
+        keys.append(key)
+        keys.sort(key=self._order.__getitem__)
+        self.text_index.add(key, [note.text])
+        self._notify("edit", note, old_text)
     
     def search_notes_by_word(self, word):
-        results = [note for note in self.notes if word.lower() in note.text.lower()]
-        return results
+        return self._ordered(self.text_index.contains(word))
     
     def search_notes_by_tag(self, tag):
-        results = [note for note in self.notes if tag in note.tags]
-        return results
+        return self._ordered(self._tags.get(tag, set()))
 
     def search_notes_by_tags(self, tags):
-        results = [note for note in self.notes if all(tag in note.tags for tag in tags)]
-        return results
+        postings = [self._tags.get(tag, set()) for tag in set(tags)]
+        if not postings:
+            return self.notes
+        postings.sort(key=len)
+        if METRICS.enabled:
+            METRICS.observe("scanned.NoteTags", len(postings[0]))
+        return self._ordered(postings[0].intersection(*postings[1:]))
 
     def to_dict(self):
-        notes_data = [{'text': note.text, 'tags': note.tags} for note in self.notes]
+        notes_data = [{'id': note._id, 'text': note.text, 'tags': note.tags} for note in self.notes]
         return {'notes': notes_data}
 
     @classmethod
@@ -172,6 +322,8 @@ class NoteBook:
         notebook = cls()
         notes_data = data.get('notes', [])
         for note_data in notes_data:
+            # notes keep their ids, which the journal refers to
+            notebook._next_order = note_data.get('id', notebook._next_order)
             note = Note(note_data['text'], note_data['tags'])
             notebook.add_note(note)
         return notebook
@@ -184,22 +336,54 @@ class NoteBook:
 
 
 class Record:
+    _fields = ("name", "phones", "birthday", "address", "email")
+    __slots__ = _fields + ("_book", "_key", "__weakref__")
+
     def __init__(self, name: Name,
                  phone: Phone = None,
                  birthday: Birthday = None,
                  address: Address = None,
                  email: Email = None):
+        self._book = None
+        self._key = None
         self.name = name
         self.phones = []
         if phone:
-            self.phones.append(phone)
+            self.add_phone(phone)
         self.birthday = birthday
         self.address = address
         self.email = email
 
+    def __setattr__(self, name, value):
+        # a field set from outside the methods below reaches the book too
+        object.__setattr__(self, name, value)
+        if name in self._fields:
+            for field in (value or ()) if name == "phones" else (value,):
+                if field is not None:
+                    field._record = self
+            self._changed()
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+    def __setstate__(self, state):
+        # also reads records pickled before they had slots
+        self._book = None
+        self._key = None
+        for name in self._fields:
+            setattr(self, name, state.get(name))
+        if self.phones is None:
+            self.phones = []
+
+    def _changed(self):
+        if self._book is not None:
+            self._book._record_changed(self)
+
     def add_phone(self, phone=None, birthday=None):
         if phone and phone.value not in [p.value for p in self.phones]:
             self.phones.append(phone)
+            phone._record = self
+            self._changed()
         if birthday:
             while not self.is_valid_birthday_format(birthday.value):
                 print("Incorrect birthday format. Please use the format DD.MM.YYYY")
@@ -214,16 +398,13 @@ class Record:
 
     @staticmethod
     def is_valid_birthday_format(value):
-        try:
-            datetime.strptime(value, "%d.%m.%Y")
-            return True
-        except ValueError:
-            return False
+        return validation.is_valid_birthday(value)
 
     def del_phone(self, phone: Phone):
         for p in self.phones:
             if p.value == phone.value:
                 self.phones.remove(p)
+                self._changed()
                 return f"phone {phone} removed from contact {self.name}"
         return f"{phone} not present in phones of contact {self.name}"
 
@@ -234,86 +415,259 @@ class Record:
                 return f"old phone {old_phone} change to {new_phone}"
             return f"{old_phone} not present in phones of contact {self.name}"
 
-    def days_to_birthday(self):
+    def days_to_birthday(self, today=None):
         if self.birthday:
-            today = datetime.now()
-            next_birthday = self.birthday.to_datetime().replace(year=today.year)
-            if next_birthday < today:
-                next_birthday = next_birthday.replace(year=today.year + 1)
-            days_remaining = (next_birthday - today).days
-            return days_remaining
+            today = today or date.today()
+            return (next_birthday(self.birthday.to_date(), today) - today).days
         return None
 
+    def birth_date(self):
+        try:
+            return self.birthday.to_date() if self.birthday else None
+        except ValueError:
+            return None
+
+    def to_dict(self):
+        return {
+            'name': str(self.name),
+            'phones': [str(p) for p in self.phones],
+            'birthday': self.birthday.value if self.birthday else None,
+            'address': self.address.value if self.address else None,
+            'email': self.email.value if self.email else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(Name(data['name']),
+                     birthday=Birthday(data['birthday']) if data.get('birthday') else None,
+                     address=Address(data['address']) if data.get('address') else None,
+                     email=Email(data['email']) if data.get('email') else None)
+        record.phones = [Phone(p) for p in data.get('phones', [])]
+        return record
+
     def __str__(self):
         phones_str = ", ".join(str(p) for p in self.phones)
         return f"Name: {self.name}, Phones: {phones_str}"
 
 
+# what each search index of an AddressBook keeps of a record
+INDEXED = {
+    "name_index": lambda record: [str(record.name)],
+    "fuzzy_index": lambda record: str(record.name),
+    "phone_index": lambda record: [str(phone) for phone in record.phones],
+    "birthday_index": lambda record: record.birth_date(),
+    "domain_index": lambda record: record.email.value if record.email else None,
+}
+
+
 class AddressBook(UserDict):
+    def __init__(self, *args, **kwargs):
+        # one id per contact for all of the substring and fuzzy indexes
+        self.key_ids = KeyIds()
+        self.name_index = NameIndex(self.key_ids)
+        self.fuzzy_index = FuzzyNameIndex(self.key_ids)
+        self.phone_index = PhoneIndex(self.key_ids)
+        self.birthday_index = BirthdayIndex()
+        self.domain_index = DomainIndex()
+        # the indexes kept up to date as records change
+        self._indexed = INDEXED
+        self._order = {}
+        self._next_order = 0
+        self._orderings = {}
+        self._listeners = []
+        self.version = 0
+        super().__init__(*args, **kwargs)
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, *args):
+        # see NoteBook._notify
+        self.version += 1
+        for listener in self._listeners:
+            listener(event, *args)
+
+    def __setitem__(self, key, record):
+        old = self.data.get(key)
+        if old is not None and old is not record:
+            self._detach(old)
+        if key not in self._order:
+            self._order[key] = self._next_order
+            self._next_order += 1
+        self.data[key] = record
+        record._book = self
+        record._key = key
+        self._index(key, record)
+        self._notify("put", key, record)
+
+    def __delitem__(self, key):
+        record = self.data.pop(key)
+        self._detach(record)
+        self._unindex(key)
+        self._notify("delete", key)
+
+    def _detach(self, record):
+        if record._book is self:
+            record._book = None
+            record._key = None
+
+    def _index(self, key, record):
+        for name in self._indexed:
+            getattr(self, name).add(key, INDEXED[name](record))
+        for ordering in self._orderings.values():
+            ordering.add(key, self._order[key], record)
+
+    def _unindex(self, key):
+        for name in self._indexed:
+            getattr(self, name).remove(key)
+        self.key_ids.free(key)
+        for ordering in self._orderings.values():
+            ordering.remove(key)
+        del self._order[key]
+
+    def _record_changed(self, record):
+        if self.data.get(record._key) is record:
+            self._index(record._key, record)
+            self._notify("put", record._key, record)
+
+    def _ordered(self, keys):
+        return [self.data[key] for key in sorted(keys, key=self._order.__getitem__)]
+
     def add_record(self, record: Record):
-        self.data[str(record.name)] = record
+        self[str(record.name)] = record
         return f"Contact {record} add success"
 
     def delete_record(self, name):
-        del self.data[name]
+        del self[name]
 
     def edit_record(self, name, new_record):
-        self.data[name] = new_record
+        self[name] = new_record
+
+    def query(self, where=None, order="insertion", limit=None, today=None):
+        # see query.py: book.query(field("name").contains("ann")).limit(5).all()
+        return query.Query(self, where, order, limit, today)
 
     def search_records(self, **kwargs):
-        results = []
-        for record in self.data.values():
-            match = True
-            for key, value in kwargs.items():
-                if key == "name":
-                    if str(record.name).lower() != value.lower():
-                        match = False
-                        break
-                elif key == "phone":
-                    phone_match = False
-                    for phone in record.phones:
-                        if str(phone).lower() == value.lower():
-                            phone_match = True
-                            break
-                    if not phone_match:
-                        match = False
-                        break
-            if match:
-                results.append(record)
-        return results
+        # contacts whose fields equal all the given values, ignoring case
+        return self.query(query.equal_to(**kwargs)).all()
+
+    def _lookup(self, field, operator, args, today):
+        # contacts that may match one condition of a query, from the index
+        # for it (query.INDEXED lists which there are)
+        if field == "name" and operator == "equals":
+            keys = self.name_index.equal(args[0])
+        elif field == "phone" and operator == "equals":
+            keys = self.phone_index.equal(args[0])
+        elif field == "domain":
+            keys = self.domain_index.equal(args[0])
+        elif field == "name" and operator == "similar":
+            keys = [key for _, key in self.fuzzy_index.similar(args[0], args[1])]
+        elif field == "birthday":
+            keys = [key for _, key in self.birthday_index.within(args[1] or today, args[0])]
+        else:
+            index = self.name_index if field == "name" else self.phone_index
+            keys = index.contains(args[0])
+        return [self[key] for key in keys]
+
+    def _positions(self, keys):
+        # insertion numbers by key, of at least the given keys
+        return self._order
 
     def search_by_name(self, name_query):
-        results = []
-        for record in self.data.values():
-            if name_query.lower() in str(record.name).lower():
-                results.append(record)
-        return results
+        return self._ordered(self.name_index.contains(name_query))
 
     def search_by_phone(self, phone_query):
-        results = []
-        for record in self.data.values():
-            for phone in record.phones:
-                if phone_query in str(phone):
-                    results.append(record)
-                    break
-        return results
+        return self._ordered(self.phone_index.contains(phone_query))
+
+    def search_by_name_fuzzy(self, name_query, max_distance=2, limit=10):
+        # the closest names first, contacts added earlier first among equals
+        found = self.fuzzy_index.similar(name_query, max_distance, limit)
+        nearest = heapq.nsmallest(limit, found, key=lambda item: (item[0], self._order[item[1]]))
+        return [self[key] for _, key in nearest]
+
+    def birthdays_within(self, days, today=None):
+        today = today or date.today()
+        found = self.birthday_index.within(today, days)
+        found.sort(key=lambda item: (item[0], self._order[item[1]]))
+        return [(when, self.data[key]) for when, key in found]
+
+    def birthdays_on(self, days, today=None):
+        if days < 0:
+            return []
+        today = today or date.today()
+        day = today + timedelta(days=days)
+        # past a year ahead only the next occurrence counts
+        return [record for _, record in self.birthdays_within(0, day)
+                if next_birthday(record.birth_date(), today) == day]
+
+    def upcoming_birthdays(self, days=7, today=None):
+        report = {}
+        for when, record in self.birthdays_within(days - 1, today):
+            report.setdefault(when, []).append(record)
+        return report
 
     def save_to_file(self, file_path):
-        with open(file_path, 'wb') as f:
+        with atomic_write(file_path) as f:
             pickle.dump(self.data, f)
 
     def load_from_file(self, file_path):
         try:
             with open(file_path, 'rb') as f:
-                self.data = pickle.load(f)
+                data = pickle.load(f)
         except FileNotFoundError:
-            self.data = {}
+            data = {}
+        self.clear()
+        for key, record in data.items():
+            self[key] = record
+
+    def clear(self):
+        for record in self.data.values():
+            self._detach(record)
+        self.data = {}
+        self._clear_indexes()
+
+    def _drop_indexes(self):
+        # for a book searched elsewhere (see sharded.py): only the insertion
+        # order and the orderings of pages are kept from now on
+        self._indexed = ()
+        for name in INDEXED:
+            getattr(self, name).clear()
+        self.key_ids.clear()
+
+    def _clear_indexes(self):
+        self.name_index.clear()
+        self.fuzzy_index.clear()
+        self.phone_index.clear()
+        self.birthday_index.clear()
+        self.domain_index.clear()
+        self.key_ids.clear()
+        self._order = {}
+        self._orderings = {}
 
     def iterator(self, batch_size, page_number):
-        data_values = list(self.data.values())
-        start_idx = page_number * batch_size
-        end_idx = min((page_number + 1) * batch_size, len(data_values))
-        return data_values[start_idx:end_idx]
+        start = page_number * batch_size
+        return list(islice(self.data.values(), start, start + batch_size))
+
+    def _ordering(self, order):
+        # kept up to date from the first time a cursor asks for it
+        ordering = self._orderings.get(order)
+        if ordering is None:
+            ordering = paging.SortedKeys(order, ((key, self._order[key], self[key]) for key in self.data))
+            self._orderings[order] = ordering
+        return ordering
+
+    def _fetch_page(self, order, lower, upper, after, count):
+        found = self._ordering(order).between(lower, upper, after, count)
+        return [(position, self[position[-1]]) for position in found]
+
+    def pages(self, size, order="insertion", today=None):
+        # pages of `size` contacts in insertion, name or next birthday order
+        if order not in paging.ORDERS:
+            raise ValueError(f"Unknown order '{order}', expected one of: {', '.join(paging.ORDERS)}")
+        if size < 1:
+            raise ValueError("Page size must be at least 1")
+        fetch = partial(self._fetch_page, order)
+        return paging.pages(fetch, size, paging.laps(order, today or date.today()))
 
     def __str__(self) -> str:
         return "\n".join(str(r) for r in self.data.values())
@@ -0,0 +1,95 @@
+import json
+import socket
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+
+def parse_address(address: str):
+    # "unix:/path", "/path" or "./path" -> ("unix", path);
+    # "host:port" or "port" -> ("tcp", host, port)
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if "/" in address:
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", host or "127.0.0.1", int(port)
+
+
+class BookClient:
+    # Thin blocking client for `book --serve`. Every call is one JSON line
+    # ["op", args...] answered by one line {"ok": ..., "result"/"error": ...};
+    # pipeline() sends many requests before reading any answer.
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float = None):
+        kind, *where = parse_address(address)
+        if kind == "unix":
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(where[0])
+        else:
+            self.socket = socket.create_connection(tuple(where), timeout=timeout)
+        self.file = self.socket.makefile("rwb")
+
+    def _send(self, op, args):
+        self.file.write(json.dumps([op, *args], ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def _receive(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The book server closed the connection")
+        response = json.loads(line)
+        if response["ok"]:
+            return response["result"]
+        return ValueError(response["error"])
+
+    def call(self, op, *args):
+        self._send(op, args)
+        self.file.flush()
+        result = self._receive()
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
+    def pipeline(self, requests) -> list:
+        # requests: (op, args...) tuples; failed ones come back as ValueError
+        requests = list(requests)
+        for op, *args in requests:
+            self._send(op, args)
+        self.file.flush()
+        return [self._receive() for _ in requests]
+
+    def get(self, name):
+        return self.call("get", name)
+
+    def add_contact(self, name, phone="", birthday="", address="", email=""):
+        return self.call("add", name, phone, birthday, address, email)
+
+    def search_by_name(self, query):
+        return self.call("search name", query)
+
+    def search_by_phone(self, query):
+        return self.call("search phone", query)
+
+    def search_similar(self, query, max_distance=2, limit=10):
+        return self.call("search similar", query, max_distance, limit)
+
+    def birthdays_within(self, days):
+        return self.call("birthdays", days)
+
+    def add_note(self, text, *tags):
+        return self.call("add note", text, *tags)
+
+    def search_notes(self, word):
+        return self.call("search notes", word)
+
+    def search_notes_by_tags(self, *tags):
+        return self.call("search notes by tags", *tags)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
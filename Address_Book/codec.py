@@ -0,0 +1,275 @@
+import struct
+import zlib
+from datetime import date
+
+from Address_Book.atomic import atomic_write
+from Address_Book.classes import Address, Birthday, Email, Name, Note, Phone, Record
+
+# A file is the header (magic, schema version, compression) followed by
+# blocks of up to BLOCK_SIZE items of one kind:
+#   kind (1 byte), item count, payload length, payload
+# and ends with a block of kind END. Counts and lengths are varints; the
+# payload is compressed as a whole when the header says so, so a block can
+# be decoded without reading the rest of the file.
+MAGIC = b"ABKB"
+VERSION = 1
+HEADER = struct.Struct("<4sBB")
+END, RECORDS, NOTES = 0, 1, 2
+BLOCK_SIZE = 1024
+COMPRESSIONS = {None: 0, "zlib": 1, "zstd": 2}
+CORRUPT = "Corrupt address book file"
+# birthdays are stored as date ordinals
+MAX_ORDINAL = date.max.toordinal()
+
+# flags byte of a record: which optional fields follow
+KEY_IS_NAME, HAS_BIRTHDAY, HAS_ADDRESS, HAS_EMAIL = 1, 2, 4, 8
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the 'zstandard' package") from None
+    return zstandard
+
+
+def compress(payload: bytes, method: int) -> bytes:
+    if method == 1:
+        return zlib.compress(payload)
+    if method == 2:
+        return _zstd().ZstdCompressor().compress(payload)
+    return payload
+
+
+def decompress(payload: bytes, method: int) -> bytes:
+    # a payload that does not decompress is reported as ValueError
+    if method == 1:
+        try:
+            return zlib.decompress(payload)
+        except zlib.error:
+            raise ValueError(CORRUPT) from None
+    if method == 2:
+        zstandard = _zstd()
+        try:
+            return zstandard.ZstdDecompressor().decompress(payload)
+        except zstandard.ZstdError:
+            raise ValueError(CORRUPT) from None
+    return payload
+
+
+def put_varint(out: bytearray, n: int) -> None:
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def get_varint(data, pos: int):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def put_str(out: bytearray, text: str) -> None:
+    raw = text.encode("utf-8")
+    put_varint(out, len(raw))
+    out += raw
+
+
+def get_str(data, pos: int):
+    size, pos = get_varint(data, pos)
+    return data[pos:pos + size].decode("utf-8"), pos + size
+
+
+def put_value(out: bytearray, stored) -> None:
+    # the stored form of a field: an int (packed phone, birthday ordinal) as
+    # 2n, a string as 2 * its length + 1 followed by its bytes
+    if isinstance(stored, int):
+        put_varint(out, stored << 1)
+    else:
+        raw = str(stored).encode("utf-8")
+        put_varint(out, len(raw) << 1 | 1)
+        out += raw
+
+
+def get_value(data, pos: int):
+    n, pos = get_varint(data, pos)
+    if not n & 1:
+        return n >> 1, pos
+    size = n >> 1
+    return data[pos:pos + size].decode("utf-8"), pos + size
+
+
+def _present(field) -> bool:
+    # an empty field is dropped, as Record.to_dict/from_dict drop it
+    return field is not None and field._value not in (None, "")
+
+
+def encode_record(out: bytearray, key: str, record: Record) -> None:
+    name = record.name.value
+    flags = ((KEY_IS_NAME if key == name else 0) | (HAS_BIRTHDAY if _present(record.birthday) else 0)
+             | (HAS_ADDRESS if _present(record.address) else 0) | (HAS_EMAIL if _present(record.email) else 0))
+    out.append(flags)
+    put_str(out, key)
+    if not flags & KEY_IS_NAME:
+        put_str(out, name)
+    put_varint(out, len(record.phones))
+    for phone in record.phones:
+        put_value(out, phone._value)
+    for flag, field in ((HAS_BIRTHDAY, record.birthday), (HAS_ADDRESS, record.address), (HAS_EMAIL, record.email)):
+        if flags & flag:
+            put_value(out, field._value)
+
+
+def decode_record(data, pos: int):
+    # fields are restored from their stored form without validating again
+    flags = data[pos]
+    key, pos = get_str(data, pos + 1)
+    name = key
+    if not flags & KEY_IS_NAME:
+        name, pos = get_str(data, pos)
+    count, pos = get_varint(data, pos)
+    phones = []
+    for _ in range(count):
+        stored, pos = get_value(data, pos)
+        phones.append(Phone._restore(stored))
+    record = Record(Name._restore(name))
+    record.phones = phones
+    for flag, field, attribute in ((HAS_BIRTHDAY, Birthday, "birthday"), (HAS_ADDRESS, Address, "address"),
+                                   (HAS_EMAIL, Email, "email")):
+        if flags & flag:
+            stored, pos = get_value(data, pos)
+            # of these only a birthday is ever stored as a number
+            if isinstance(stored, int) and (field is not Birthday or not 1 <= stored <= MAX_ORDINAL):
+                raise ValueError(CORRUPT)
+            setattr(record, attribute, field._restore(stored))
+    return key, record, pos
+
+
+def encode_note(out: bytearray, note: Note) -> None:
+    put_str(out, note.text)
+    put_varint(out, len(note.tags))
+    for tag in note.tags:
+        put_str(out, tag)
+
+
+def decode_note(data, pos: int):
+    text, pos = get_str(data, pos)
+    count, pos = get_varint(data, pos)
+    tags = []
+    for _ in range(count):
+        tag, pos = get_str(data, pos)
+        tags.append(tag)
+    return Note(text, tags), pos
+
+
+def _write_blocks(file, kind, items, encode, method, block_size):
+    payload = bytearray()
+    count = 0
+    for item in items:
+        encode(payload, *item)
+        count += 1
+        if count == block_size:
+            _write_block(file, kind, count, payload, method)
+            payload = bytearray()
+            count = 0
+    if count:
+        _write_block(file, kind, count, payload, method)
+
+
+def _write_block(file, kind, count, payload, method):
+    body = compress(bytes(payload), method)
+    head = bytearray([kind])
+    put_varint(head, count)
+    put_varint(head, len(body))
+    file.write(head)
+    file.write(body)
+
+
+def dump(file, records, notes=(), compression=None, block_size=BLOCK_SIZE) -> None:
+    # records yields (key, record); neither they nor notes are held in memory
+    # beyond one block
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of zlib, zstd")
+    method = COMPRESSIONS[compression]
+    if method == 2:
+        _zstd()
+    file.write(HEADER.pack(MAGIC, VERSION, method))
+    _write_blocks(file, RECORDS, records, encode_record, method, block_size)
+    _write_blocks(file, NOTES, ((note,) for note in notes), encode_note, method, block_size)
+    file.write(bytes([END]))
+
+
+def _read_varint(file) -> int:
+    n = shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            raise ValueError("Truncated address book file")
+        n |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return n
+        shift += 7
+
+
+def load(file):
+    # yields (RECORDS, (key, record)) and (NOTES, note) in file order, one
+    # block in memory at a time; a malformed file raises ValueError
+    header = file.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("Not an address book file")
+    magic, version, method = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not an address book file")
+    if version != VERSION:
+        raise ValueError(f"Unsupported address book file version {version}")
+    if method not in COMPRESSIONS.values():
+        raise ValueError(CORRUPT)
+    while True:
+        kind = file.read(1)
+        if not kind:
+            raise ValueError("Truncated address book file")
+        kind = kind[0]
+        if kind == END:
+            return
+        count = _read_varint(file)
+        size = _read_varint(file)
+        body = file.read(size)
+        if len(body) != size:
+            raise ValueError("Truncated address book file")
+        if kind not in (RECORDS, NOTES):
+            raise ValueError(f"Unknown block kind {kind}")
+        data = decompress(body, method)
+        pos = 0
+        for _ in range(count):
+            try:
+                if kind == RECORDS:
+                    key, record, pos = decode_record(data, pos)
+                    item = key, record
+                else:
+                    item, pos = decode_note(data, pos)
+            except (IndexError, UnicodeDecodeError):
+                raise ValueError(CORRUPT) from None
+            yield kind, item
+        if pos != len(data):
+            raise ValueError(CORRUPT)
+
+
+def save(path, address_book, notebook, compression=None) -> None:
+    with atomic_write(path) as file:
+        dump(file, address_book.items(), notebook.get_notes(), compression)
+
+
+def read_into(path, address_book, notebook):
+    with open(path, "rb") as file:
+        for kind, item in load(file):
+            if kind == RECORDS:
+                address_book[item[0]] = item[1]
+            else:
+                notebook.add_note(item)
+    return address_book, notebook
@@ -0,0 +1,124 @@
+import pickle
+import sys
+from collections.abc import MutableMapping
+from itertools import islice
+from weakref import WeakValueDictionary
+
+from Address_Book.atomic import atomic_write
+from Address_Book.classes import Address, AddressBook, Birthday, Email, Name, Phone, Record
+
+# marks a field the record does not have
+MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _stored(field, intern=False):
+    if field is None:
+        return MISSING
+    return _intern(field._value) if intern else field._value
+
+
+def _restore(cls, stored):
+    return None if stored is MISSING else cls._restore(stored)
+
+
+class ColumnarRecords(MutableMapping):
+    # Contacts kept as parallel lists, one per field, of the stored form of
+    # every Field: strings, packed phone numbers and birthday ordinals.
+    # Addresses are interned, as many contacts share one; names and emails
+    # are mostly unique, and interning them would only grow the interned
+    # table. A Record is built when it is accessed and shared while
+    # something still holds it; rows of removed contacts are reused.
+    def __init__(self, book):
+        self.book = book
+        self.rows = {}
+        self.free = []
+        self.names = []
+        self.phones = []
+        self.birthdays = []
+        self.addresses = []
+        self.emails = []
+        self.cache = WeakValueDictionary()
+
+    def __getitem__(self, key):
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+        row = self.rows[key]
+        record = Record(_restore(Name, self.names[row]),
+                        birthday=_restore(Birthday, self.birthdays[row]),
+                        address=_restore(Address, self.addresses[row]),
+                        email=_restore(Email, self.emails[row]))
+        phones = self.phones[row]
+        record.phones = [Phone._restore(phone) for phone in (phones if isinstance(phones, tuple) else (phones,))]
+        record._book = self.book
+        record._key = key
+        self.cache[key] = record
+        return record
+
+    def __setitem__(self, key, record):
+        row = self.rows.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                row = len(self.names)
+                for column in (self.names, self.phones, self.birthdays, self.addresses, self.emails):
+                    column.append(MISSING)
+            self.rows[key] = row
+        self.names[row] = _stored(record.name)
+        # a single phone is kept bare, without a tuple around it
+        phones = tuple(phone._value for phone in record.phones)
+        self.phones[row] = phones[0] if len(phones) == 1 else phones
+        self.birthdays[row] = _stored(record.birthday)
+        self.addresses[row] = _stored(record.address, intern=True)
+        self.emails[row] = _stored(record.email)
+        self.cache[key] = record
+
+    def __delitem__(self, key):
+        row = self.rows.pop(key)
+        for column in (self.names, self.phones, self.birthdays, self.addresses, self.emails):
+            column[row] = MISSING
+        self.free.append(row)
+        self.cache.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ColumnarAddressBook(AddressBook):
+    # AddressBook for very large books: contacts live in ColumnarRecords
+    # instead of one Record object each, with the same Record API.
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.data = ColumnarRecords(self)
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def _record_changed(self, record):
+        if record._key in self.data and self.data[record._key] is record:
+            self.data[record._key] = record
+            super()._record_changed(record)
+
+    def clear(self):
+        for record in list(self.data.cache.values()):
+            self._detach(record)
+        self.data = ColumnarRecords(self)
+        self._clear_indexes()
+
+    def save_to_file(self, file_path):
+        with atomic_write(file_path) as f:
+            pickle.dump(dict(self.data.items()), f)
+
+    def iterator(self, batch_size, page_number):
+        start = page_number * batch_size
+        return [self.data[key] for key in islice(self.data, start, start + batch_size)]
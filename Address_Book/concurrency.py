@@ -0,0 +1,207 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    # Many readers or one writer. A waiting writer holds back new readers, so
+    # a steady stream of searches cannot starve updates, and as many readers
+    # as waited for a writer go before the next one, so a steady stream of
+    # updates cannot starve searches either. The thread holding the write lock
+    # may take either lock again, and a reader may nest reads; a reader cannot
+    # upgrade to the write lock.
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._readers_waiting = 0
+        self._readers_admitted = 0
+        self._writer = None
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        if self._writer == threading.get_ident():
+            yield
+            return
+        depth = getattr(self._local, "reads", 0)
+        if not depth:
+            with self._condition:
+                self._readers_waiting += 1
+                while self._writer is not None or (self._writers_waiting and not self._readers_admitted):
+                    self._condition.wait()
+                self._readers_waiting -= 1
+                if self._readers_admitted:
+                    self._readers_admitted -= 1
+                self._readers += 1
+        self._local.reads = depth + 1
+        try:
+            yield
+        finally:
+            self._local.reads = depth
+            if not depth:
+                with self._condition:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        if getattr(self._local, "reads", 0):
+            raise RuntimeError("Cannot take the write lock while holding the read lock")
+        with self._condition:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers or self._readers_admitted:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = None
+                self._readers_admitted = self._readers_waiting
+                self._condition.notify_all()
+
+
+class Shared:
+    # Thread-safe front for a book shared between threads: the methods named
+    # in `reads` run under the read lock, the ones in `writes` under the write
+    # lock, everything else is left to the wrapped object. Records and notes
+    # handed out stay live; change them inside `write()` (or `change()`), and
+    # hold `read()` to look at several of them as one consistent view.
+    reads = frozenset()
+    writes = frozenset()
+
+    def __init__(self, target, lock: RWLock = None):
+        self.target = target
+        self.lock = lock or RWLock()
+
+    def read(self):
+        return self.lock.read()
+
+    def write(self):
+        return self.lock.write()
+
+    def __getattr__(self, name):
+        method = getattr(self.target, name)
+        if name in self.reads:
+            guard = self.lock.read
+        elif name in self.writes:
+            guard = self.lock.write
+        else:
+            return method
+
+        def guarded(*args, **kwargs):
+            with guard():
+                return method(*args, **kwargs)
+        return guarded
+
+    def __len__(self):
+        with self.lock.read():
+            return len(self.target)
+
+    def __str__(self):
+        with self.lock.read():
+            return str(self.target)
+
+
+class SharedAddressBook(Shared):
+    reads = frozenset({
+        "get", "search_records", "search_by_name", "search_by_phone", "search_by_name_fuzzy",
+        "birthdays_within", "birthdays_on", "upcoming_birthdays", "iterator", "save_to_file",
+    })
+    writes = frozenset({
+        "add_record", "delete_record", "edit_record", "clear", "load_from_file", "pop", "update",
+    })
+
+    def __getitem__(self, key):
+        with self.lock.read():
+            return self.target[key]
+
+    def __contains__(self, key):
+        with self.lock.read():
+            return key in self.target
+
+    def __setitem__(self, key, record):
+        with self.lock.write():
+            self.target[key] = record
+
+    def __delitem__(self, key):
+        with self.lock.write():
+            del self.target[key]
+
+    def __iter__(self):
+        # over the keys there were when it started
+        return iter(self.keys())
+
+    def keys(self):
+        with self.lock.read():
+            return list(self.target.keys())
+
+    def values(self):
+        with self.lock.read():
+            return list(self.target.values())
+
+    def items(self):
+        with self.lock.read():
+            return list(self.target.items())
+
+    def query(self, *args, **kwargs):
+        return SharedQuery(self.target.query(*args, **kwargs), self.lock)
+
+    def pages(self, *args, **kwargs):
+        # each page is read under the lock, not the whole walk
+        with self.lock.read():
+            cursor = self.target.pages(*args, **kwargs)
+        while True:
+            with self.lock.read():
+                page = next(cursor, None)
+            if page is None:
+                return
+            yield page
+
+    @contextmanager
+    def change(self, key):
+        # one record under the write lock, for updates that touch several
+        # fields and must be seen all at once or not at all
+        with self.lock.write():
+            yield self.target[key]
+
+
+class SharedQuery(Shared):
+    # A query of a shared book runs under the read lock, and so do the
+    # queries made from it.
+    reads = frozenset({"all", "explain"})
+
+    def where(self, predicate):
+        return SharedQuery(self.target.where(predicate), self.lock)
+
+    def order_by(self, order):
+        return SharedQuery(self.target.order_by(order), self.lock)
+
+    def limit(self, count):
+        return SharedQuery(self.target.limit(count), self.lock)
+
+    def __iter__(self):
+        return iter(self.all())
+
+
+class SharedNoteBook(Shared):
+    reads = frozenset({
+        "get_note_by_text", "search_notes_by_word", "search_notes_by_tag", "search_notes_by_tags",
+        "get_notes", "to_dict",
+    })
+    writes = frozenset({
+        "add_note", "delete_note_by_text", "edit_note", "add_tag_to_note",
+    })
+
+    @property
+    def notes(self):
+        with self.lock.read():
+            return self.target.notes
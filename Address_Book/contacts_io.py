@@ -0,0 +1,274 @@
+import csv
+import gzip
+import json
+import re
+from datetime import datetime
+from itertools import islice
+
+from Address_Book import validation
+from Address_Book.classes import Address, Birthday, Email, Name, Phone, Record
+
+FORMATS = ("csv", "jsonl", "vcf")
+CSV_FIELDS = ["name", "phones", "birthday", "address", "email"]
+BATCH_SIZE = 1000
+KEPT_ERRORS = 100
+# a backslash and the character it escapes in a vCard value
+VCF_ESCAPE = re.compile(r"\\(.)")
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for fmt, suffixes in (("csv", (".csv",)), ("jsonl", (".jsonl", ".ndjson", ".json")), ("vcf", (".vcf", ".vcard"))):
+        if name.endswith(suffixes):
+            return fmt
+    raise ValueError(f"Unknown contacts format for '{path}'. Use .csv, .jsonl or .vcf (optionally .gz)")
+
+
+def open_text(path: str, mode: str = "r"):
+    # gzip is recognised by its magic bytes when reading and by ".gz" when writing
+    if "r" in mode:
+        with open(path, "rb") as probe:
+            compressed = probe.read(2) == b"\x1f\x8b"
+    else:
+        compressed = path.lower().endswith(".gz")
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+# Readers yield (line number, row) where row is a dict in the Record.to_dict
+# shape with raw, not yet validated values.
+
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        phones = row.get("phones") or row.get("phone") or ""
+        yield reader.line_num, {
+            "name": row.get("name") or "",
+            "phones": [p for p in phones.split(";") if p.strip()],
+            "birthday": row.get("birthday") or None,
+            "address": row.get("address") or None,
+            "email": row.get("email") or None,
+        }
+
+
+def read_jsonl(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield number, None
+            continue
+        if not isinstance(row, dict):
+            yield number, None
+            continue
+        # values are passed on as they are; validate_batch rejects the ones
+        # of the wrong type
+        phones = row.get("phones", row.get("phone")) or []
+        yield number, {
+            "name": row.get("name") or "",
+            "phones": [phones] if isinstance(phones, str) else phones,
+            "birthday": row.get("birthday"),
+            "address": row.get("address"),
+            "email": row.get("email"),
+        }
+
+
+def _vcard_birthday(value):
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%d.%m.%Y"):
+        try:
+            return validation.format_birthday(datetime.strptime(value, fmt).date())
+        except ValueError:
+            continue
+    return value
+
+
+def _vcf_unescape(value):
+    # one pass, so an escaped backslash is never read as the start of
+    # another escape
+    return VCF_ESCAPE.sub(lambda match: "\n" if match[1] in "nN" else match[1], value)
+
+
+def read_vcf(lines):
+    card, start = None, 0
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and card is not None and card["_last"]:
+            # folded continuation of the previous property
+            card[card["_last"]][-1] += line[1:]
+            continue
+        key, _, value = line.partition(":")
+        prop = key.split(";")[0].upper()
+        if prop == "BEGIN" and value.upper() == "VCARD":
+            card, start = {"_last": None}, number
+        elif prop == "END" and card is not None:
+            name = card["FN"][0] if card.get("FN") else " ".join(card.get("N", [""])[0].split(";")[::-1])
+            yield start, {
+                "name": _vcf_unescape(name).strip(),
+                "phones": card.get("TEL", []),
+                "birthday": _vcard_birthday(card["BDAY"][0]) if card.get("BDAY") else None,
+                "address": _vcf_unescape(" ".join(p for p in card["ADR"][0].split(";") if p))
+                if card.get("ADR") else None,
+                "email": card["EMAIL"][0] if card.get("EMAIL") else None,
+            }
+            card = None
+        elif card is not None and prop:
+            card.setdefault(prop, []).append(value)
+            card["_last"] = prop
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "vcf": read_vcf}
+
+
+def _type_error(row):
+    # what is wrong with the types of a row (JSON Lines can hold anything),
+    # or None
+    if not isinstance(row["name"], str):
+        return "name must be a string"
+    phones = row["phones"]
+    if not isinstance(phones, list) or not all(isinstance(phone, str) for phone in phones):
+        return "phones must be a string or a list of strings"
+    for field in ("birthday", "address", "email"):
+        if row[field] is not None and not isinstance(row[field], str):
+            return f"{field} must be a string"
+    return None
+
+
+def validate_batch(rows):
+    # Works column by column over one batch; returns (records, rejects) where
+    # rejects are (line number, reason).
+    rejects = []
+    good = []
+    for number, row in rows:
+        reason = "not a contact record" if row is None else _type_error(row)
+        if reason is not None:
+            rejects.append((number, reason))
+        elif not row["name"].strip():
+            rejects.append((number, "name is required"))
+        else:
+            good.append((number, row))
+
+    phones = iter(validation.normalize_phones(p.strip() for _, row in good for p in row["phones"]))
+    phone_lists = [[next(phones) for _ in row["phones"]] for _, row in good]
+    births = validation.parse_birthdays(row["birthday"] for _, row in good)
+    birthdays_ok = [not row["birthday"] or born is not None for (_, row), born in zip(good, births)]
+    emails = validation.validate_emails(row["email"] or "" for _, row in good)
+    emails_ok = [not row["email"] or valid for (_, row), valid in zip(good, emails)]
+
+    records = []
+    for (number, row), phones, birthday_ok, email_ok in zip(good, phone_lists, birthdays_ok, emails_ok):
+        if None in phones:
+            bad = row["phones"][phones.index(None)]
+            rejects.append((number, f"invalid phone number '{bad}'"))
+        elif not birthday_ok:
+            rejects.append((number, f"invalid birthday '{row['birthday']}'"))
+        elif not email_ok:
+            rejects.append((number, f"invalid e-mail address '{row['email']}'"))
+        else:
+            record = Record(Name(row["name"].strip()),
+                            birthday=Birthday(row["birthday"]) if row["birthday"] else None,
+                            address=Address(row["address"]) if row["address"] else None,
+                            email=Email(row["email"]) if row["email"] else None)
+            record.phones = [Phone(p) for p in dict.fromkeys(phones)]
+            records.append((number, record))
+    return records, rejects
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, number, reason):
+        self.rejected += 1
+        if len(self.errors) < KEPT_ERRORS:
+            self.errors.append((number, reason))
+
+    def __str__(self):
+        lines = [f"Imported {self.imported} contacts, rejected {self.rejected}."]
+        lines += [f"line {number}: {reason}" for number, reason in self.errors[:10]]
+        if self.rejected > 10:
+            lines.append(f"... and {self.rejected - 10} more")
+        return "\n".join(lines)
+
+
+def import_contacts(path, address_book, fmt=None, batch_size=BATCH_SIZE, rejects=None):
+    # rejects: optional writable text stream receiving "line<TAB>reason" rows
+    fmt = fmt or detect_format(path)
+    report = ImportReport()
+    with open_text(path) as lines:
+        rows = READERS[fmt](lines)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            records, rejected = validate_batch(batch)
+            for number, record in records:
+                if str(record.name) in address_book:
+                    rejected.append((number, f"contact '{record.name}' already exists"))
+                    continue
+                address_book.add_record(record)
+                report.imported += 1
+            for number, reason in sorted(rejected):
+                report.reject(number, reason)
+                if rejects is not None:
+                    rejects.write(f"{number}\t{reason}\n")
+    return report
+
+
+def write_csv(records, out):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record in records:
+        data = record.to_dict()
+        data["phones"] = ";".join(data["phones"])
+        writer.writerow(data)
+
+
+def write_jsonl(records, out):
+    for record in records:
+        out.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+
+
+def _vcf_escape(value):
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+
+def write_vcf(records, out):
+    for record in records:
+        data = record.to_dict()
+        out.write("BEGIN:VCARD\r\nVERSION:3.0\r\n")
+        out.write(f"FN:{_vcf_escape(data['name'])}\r\nN:{_vcf_escape(data['name'])};;;;\r\n")
+        for phone in data["phones"]:
+            out.write(f"TEL;TYPE=CELL:{phone}\r\n")
+        born = validation.parse_birthday(data["birthday"])
+        if born is not None:
+            out.write(f"BDAY:{born.strftime('%Y-%m-%d')}\r\n")
+        if data["address"]:
+            out.write(f"ADR:;;{_vcf_escape(data['address'])};;;;\r\n")
+        if data["email"]:
+            out.write(f"EMAIL:{data['email']}\r\n")
+        out.write("END:VCARD\r\n")
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "vcf": write_vcf}
+
+
+def export_contacts(path, address_book, fmt=None):
+    fmt = fmt or detect_format(path)
+    count = 0
+
+    def records():
+        nonlocal count
+        for record in address_book.values():
+            count += 1
+            yield record
+
+    with open_text(path, "w") as out:
+        WRITERS[fmt](records(), out)
+    return count
@@ -0,0 +1,58 @@
+def edit_distance(a: str, b: str, limit: int = None) -> int:
+    # Levenshtein distance. With a limit, stops as soon as the distance is
+    # known to exceed it and returns limit + 1.
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    # Burkhard-Keller tree over edit distance: a search for words within d of
+    # a query only descends into children whose edge distance is within d of
+    # the distance to their parent.
+    def __init__(self, words=()):
+        self.root = None
+        self.order = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if word in self.order:
+            return
+        self.order[word] = len(self.order)
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, query: str, max_distance: int) -> list:
+        # (distance, word) pairs, closest first, then in the order added
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            word, children = stack.pop()
+            distance = edit_distance(query, word)
+            if distance <= max_distance:
+                found.append((distance, word))
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda item: (item[0], self.order[item[1]]))
+        return found
@@ -0,0 +1,388 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from Address_Book.fuzzy import edit_distance
+from Address_Book.metrics import METRICS
+
+GRAM_SIZE = 3
+# array type code of key ids: unsigned, at least 4 bytes
+ID_TYPE = "I"
+# ids of removed keys allowed, beyond the live ones, before a renumbering
+SLACK = 1024
+# joins the texts of one key; no text may contain it
+SEPARATOR = "\0"
+
+
+def grams(text: str, size: int = GRAM_SIZE, smallest: int = 1) -> set:
+    result = set()
+    for n in range(smallest, size + 1):
+        for i in range(len(text) - n + 1):
+            result.add(text[i:i + n])
+    return result
+
+
+def only_digits(text: str) -> str:
+    return "".join(ch for ch in text if ch.isdigit())
+
+
+# Ukrainian (and the extra Russian) letters to Latin, close to the official
+# Ukrainian transliteration, so both spellings of a name can be compared
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ie", "ж": "zh",
+    "з": "z", "и": "y", "і": "i", "ї": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ю": "iu", "я": "ia", "'": "", "’": "",
+    "ё": "e", "ы": "y", "э": "e", "ъ": "",
+})
+
+
+def latin(text: str) -> str:
+    return text.lower().translate(TRANSLIT)
+
+
+class KeyIds:
+    # Small int ids for keys, handed out in increasing order, so a posting
+    # can be an ascending array of 4-byte ids instead of a set of keys. The
+    # indexes of one book share them: a key has one id in all of them, freed
+    # by the book once the key is gone from every index. Ids of freed keys
+    # are renumbered away, in every index, once they pile up.
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+        self.indexes = []
+
+    def get(self, key) -> int:
+        id_ = self.ids.get(key)
+        if id_ is None:
+            id_ = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return id_
+
+    def free(self, key) -> None:
+        id_ = self.ids.pop(key, None)
+        if id_ is None:
+            return
+        self.keys[id_] = None
+        if len(self.keys) > 2 * len(self.ids) + SLACK:
+            self._renumber()
+
+    def _renumber(self) -> None:
+        live = [id_ for id_, key in enumerate(self.keys) if key is not None]
+        new_ids = {old: new for new, old in enumerate(live)}
+        for index in self.indexes:
+            index._renumber(live, new_ids)
+        self.keys = [self.keys[id_] for id_ in live]
+        self.ids = {key: id_ for id_, key in enumerate(self.keys)}
+
+    def clear(self) -> None:
+        self.ids.clear()
+        self.keys.clear()
+
+
+def _at(values: list, id_: int):
+    return values[id_] if id_ < len(values) else None
+
+
+def _put(values: list, id_: int, value) -> None:
+    if id_ >= len(values):
+        values.extend([None] * (id_ + 1 - len(values)))
+    values[id_] = value
+
+
+class PostingIndex:
+    # Postings of key ids (see KeyIds) by gram, and whatever else the index
+    # keeps per key in lists indexed by id. Without shared ids an index has
+    # its own and frees a key when it is removed.
+    def __init__(self, ids: KeyIds = None):
+        self.owns_ids = ids is None
+        self.key_ids = KeyIds() if ids is None else ids
+        self.key_ids.indexes.append(self)
+        self.postings = {}
+
+    def add(self, key, value) -> None:
+        if not value:
+            # nothing to index, e.g. a contact without phones
+            self.remove(key)
+            return
+        id_ = self.key_ids.get(key)
+        self._unlink(id_)
+        self._link(id_, value)
+
+    def remove(self, key) -> None:
+        id_ = self.key_ids.ids.get(key)
+        if id_ is not None and self._unlink(id_) and self.owns_ids:
+            self.key_ids.free(key)
+
+    def _link(self, id_, value) -> None:
+        raise NotImplementedError
+
+    def _unlink(self, id_) -> bool:
+        # False when the index holds nothing for this id
+        raise NotImplementedError
+
+    def _renumber(self, live: list, new_ids: dict) -> None:
+        # live: the old ids still in use, in order; new_ids: old id -> new
+        for gram, ids in self.postings.items():
+            self.postings[gram] = array(ID_TYPE, [new_ids[id_] for id_ in ids])
+
+    def _keys(self, ids) -> set:
+        keys = self.key_ids.keys
+        return {keys[id_] for id_ in ids}
+
+    def clear(self) -> None:
+        self.postings.clear()
+        if self.owns_ids:
+            self.key_ids.clear()
+
+    @staticmethod
+    def _insert(lists, gram, id_) -> None:
+        ids = lists.get(gram)
+        if ids is None:
+            lists[gram] = array(ID_TYPE, (id_,))
+            return
+        if ids[-1] < id_:
+            # a new key has the largest id
+            ids.append(id_)
+            return
+        i = bisect_left(ids, id_)
+        if i == len(ids) or ids[i] != id_:
+            ids.insert(i, id_)
+
+    @staticmethod
+    def _remove(lists, gram, id_) -> None:
+        ids = lists.get(gram)
+        if ids is None:
+            return
+        i = bisect_left(ids, id_)
+        if i < len(ids) and ids[i] == id_:
+            del ids[i]
+            if not ids:
+                del lists[gram]
+
+
+class SubstringIndex(PostingIndex):
+    # Keeps the grams of one to GRAM_SIZE characters of the indexed texts. A
+    # query of up to GRAM_SIZE characters is answered by its own posting,
+    # longer ones from the keys holding both of their two rarest trigrams,
+    # and every candidate is checked against the stored text afterwards; so
+    # are lookups of a whole text. Only a query with nothing to index (say a
+    # lone "+" for phones) checks every stored text. The texts of a key are
+    # stored as one string, joined by SEPARATOR.
+    def __init__(self, ids: KeyIds = None):
+        super().__init__(ids)
+        self.texts = []
+
+    def normalize(self, text: str) -> str:
+        return text.lower()
+
+    def prepare(self, text: str) -> str:
+        return text.lower()
+
+    def needle(self, query: str) -> str:
+        return query.lower()
+
+    def _grams(self, text: str) -> set:
+        return set().union(*(grams(self.normalize(part)) for part in text.split(SEPARATOR)))
+
+    def _link(self, id_, texts) -> None:
+        text = SEPARATOR.join(self.prepare(text) for text in texts)
+        _put(self.texts, id_, text)
+        for gram in self._grams(text):
+            self._insert(self.postings, gram, id_)
+
+    def _unlink(self, id_) -> bool:
+        text = _at(self.texts, id_)
+        if text is None:
+            return False
+        self.texts[id_] = None
+        for gram in self._grams(text):
+            self._remove(self.postings, gram, id_)
+        return True
+
+    def _renumber(self, live: list, new_ids: dict) -> None:
+        super()._renumber(live, new_ids)
+        self.texts = [_at(self.texts, id_) for id_ in live]
+
+    def clear(self) -> None:
+        super().clear()
+        self.texts.clear()
+
+    def equal(self, value: str) -> set:
+        value = value.lower()
+        if SEPARATOR in value:
+            return set()
+        texts = self.texts
+        return self._keys(id_ for id_ in self._candidates(self.normalize(value))
+                          if value in texts[id_].lower().split(SEPARATOR))
+
+    def contains(self, query: str) -> set:
+        needle = self.needle(query)
+        if SEPARATOR in needle:
+            return set()
+        candidates = self._candidates(self.normalize(query))
+        if METRICS.enabled:
+            METRICS.observe(f"scanned.{type(self).__name__}", len(candidates))
+        texts = self.texts
+        return self._keys(id_ for id_ in candidates if needle in texts[id_])
+
+    def _candidates(self, query: str):
+        # ids of the keys that may hold the query
+        if not query:
+            return [id_ for id_, text in enumerate(self.texts) if text is not None]
+        if len(query) <= GRAM_SIZE:
+            return self.postings.get(query, ())
+        postings = []
+        for i in range(len(query) - GRAM_SIZE + 1):
+            posting = self.postings.get(query[i:i + GRAM_SIZE])
+            if not posting:
+                return set()
+            postings.append(posting)
+        # the two rarest trigrams leave few candidates to check
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:2])
+
+
+class NameIndex(SubstringIndex):
+    pass
+
+
+class PhoneIndex(SubstringIndex):
+    # Grams are built over the digits only; the check against the raw text
+    # keeps the results identical to a plain substring test on str(phone).
+    def normalize(self, text: str) -> str:
+        return only_digits(text)
+
+    def prepare(self, text: str) -> str:
+        return text
+
+    def needle(self, query: str) -> str:
+        return query
+
+
+class DomainIndex:
+    # Keys by the lowercase domain of their email address. There are few
+    # domains, so plain sets of keys do.
+    def __init__(self):
+        self.domains = {}
+        self.keys = defaultdict(set)
+
+    def add(self, key, email: str = None) -> None:
+        self.remove(key)
+        if not email:
+            return
+        domain = sys.intern(email.rpartition("@")[2].lower())
+        self.domains[key] = domain
+        self.keys[domain].add(key)
+
+    def remove(self, key) -> None:
+        domain = self.domains.pop(key, None)
+        if domain is not None:
+            keys = self.keys[domain]
+            keys.discard(key)
+            if not keys:
+                del self.keys[domain]
+
+    def clear(self) -> None:
+        self.domains.clear()
+        self.keys.clear()
+
+    def equal(self, domain: str) -> set:
+        return set(self.keys.get(domain.lower(), ()))
+
+
+class NoteTextIndex(SubstringIndex):
+    pass
+
+
+class FuzzyNameIndex(PostingIndex):
+    # Names folded to lowercase Latin with the bigrams of each. A name can be
+    # within d edits of a query only if it holds all but 2 * d of the query's
+    # distinct bigrams, so only names passing that count are compared; a
+    # query too short for the count to rule anything out is compared with
+    # every name. A name matches through its whole text or any of its words,
+    # so one of their lengths must also be within d of the query's.
+    def __init__(self, ids: KeyIds = None):
+        super().__init__(ids)
+        self.texts = []
+        self.lengths = []
+
+    def _link(self, id_, text: str) -> None:
+        text = latin(text)
+        _put(self.texts, id_, text)
+        lengths = (len(text), *(len(word) for word in text.split()))
+        _put(self.lengths, id_, bytes(lengths) if max(lengths) < 256 else lengths)
+        for gram in grams(text, size=2, smallest=2):
+            self._insert(self.postings, gram, id_)
+
+    def _unlink(self, id_) -> bool:
+        text = _at(self.texts, id_)
+        if text is None:
+            return False
+        self.texts[id_] = None
+        self.lengths[id_] = None
+        for gram in grams(text, size=2, smallest=2):
+            self._remove(self.postings, gram, id_)
+        return True
+
+    def _renumber(self, live: list, new_ids: dict) -> None:
+        super()._renumber(live, new_ids)
+        self.texts = [_at(self.texts, id_) for id_ in live]
+        self.lengths = [_at(self.lengths, id_) for id_ in live]
+
+    def clear(self) -> None:
+        super().clear()
+        self.texts.clear()
+        self.lengths.clear()
+
+    def candidates(self, query: str, max_distance: int):
+        # ids of the names worth comparing with the query
+        bigrams = grams(query, size=2, smallest=2)
+        needed = len(bigrams) - 2 * max_distance
+        shortest, longest = len(query) - max_distance, len(query) + max_distance
+        lengths = self.lengths
+        if needed <= 0:
+            return [id_ for id_, sizes in enumerate(lengths)
+                    if sizes is not None and any(shortest <= size <= longest for size in sizes)]
+        # a name holding `needed` of the bigrams holds one of any
+        # len - needed + 1 of them, so the rarest ones give every candidate
+        postings = sorted((self.postings.get(gram, ()) for gram in bigrams), key=len)
+        ids = set().union(*postings[:len(bigrams) - needed + 1])
+        texts = self.texts
+        return [id_ for id_ in ids if any(shortest <= size <= longest for size in lengths[id_])
+                and sum(gram in texts[id_] for gram in bigrams) >= needed]
+
+    @staticmethod
+    def distance(query: str, text: str, max_distance: int) -> int:
+        best = edit_distance(query, text, max_distance)
+        for word in text.split():
+            if best == 0:
+                break
+            best = min(best, edit_distance(query, word, max_distance))
+        return best
+
+    def similar(self, query: str, max_distance: int, limit: int = None) -> list:
+        # (distance, key) for names within max_distance of the query. With a
+        # limit, distances are tried from 0 up and the search stops after the
+        # first one that brings the count to the limit: any name not found by
+        # then is further away than all found.
+        query = latin(query.strip())
+        found = []
+        matched = set()
+        scanned = 0
+        for distance in range(max_distance + 1):
+            for id_ in self.candidates(query, distance):
+                if id_ in matched:
+                    continue
+                scanned += 1
+                found_distance = self.distance(query, self.texts[id_], distance)
+                if found_distance <= distance:
+                    found.append((found_distance, id_))
+                    matched.add(id_)
+            if limit is not None and len(found) >= limit:
+                break
+        if METRICS.enabled:
+            METRICS.observe("scanned.FuzzyNameIndex", scanned)
+        keys = self.key_ids.keys
+        return [(distance, keys[id_]) for distance, id_ in found]
@@ -1,11 +1,25 @@
-import pickle
-import difflib
-from Address_Book import sort
-import json
+import argparse
+import sys
+import threading
+from datetime import date
+from Address_Book import contacts_io, paging, sort, validation
+from Address_Book.batch import run_script
 from Address_Book.classes import AddressBook, Name, Phone, Record, Birthday, Address, Email, Note, NoteBook
+from Address_Book.columnar import ColumnarAddressBook
+from Address_Book.router import CommandRouter, install_completion
+from Address_Book.metrics import METRICS, profile_call
+from Address_Book.reminders import BirthdayScheduler
+from Address_Book.server import is_local, serve
+from Address_Book.sharded import ShardedAddressBook
+from Address_Book.storage import BinaryStorage, JournalStorage, PackedStorage, PickleStorage, SqliteStorage
 
 address_book = AddressBook()
 notebook = NoteBook()
+sort_classifier = None
+sort_dedup = None
+page_size = 5
+page_order = "insertion"
+command_router = None
 
 
 def input_error(func):
@@ -124,7 +138,7 @@ def add_birthday():
     birthday = Birthday(input("Enter birthday in format 'DD.MM.YYYY': "))
     rec: Record = address_book.get(str(name))
     if rec:
-        rec.birthday = birthday
+        rec.add_birthday(birthday)
         return f"Birthday updated for contact '{name}'."
     return f"No contact '{name}' in address book"
 
@@ -151,7 +165,7 @@ def edit_birthday():
     rec: Record = address_book.get(str(name))
     if rec:
         new_birthday = Birthday(input("Enter a new birthday (in DD.MM.YYYY format): "))
-        rec.birthday = new_birthday
+        rec.add_birthday(new_birthday)
         return f"Birthday updated for contact '{name}'."
     return f"No contact '{name}' in address book"
 
@@ -162,10 +176,7 @@ def show_birthday_within_days():
     except ValueError:
         return "Invalid input. Please enter a valid number of days."
 
-    birthday_contacts = []
-    for name, record in address_book.data.items():
-        if record.birthday and record.days_to_birthday() == days:
-            birthday_contacts.append(record)
+    birthday_contacts = address_book.birthdays_on(days)
 
     if birthday_contacts:
         output = f"Contacts with birthdays {days} days from now:\n\n"
@@ -179,17 +190,32 @@ def show_birthday_within_days():
         return f"No contacts have birthdays {days} days from now."
 
 
-@input_error
-def show_all():
-    page_number = 1
-    batch_size = 5
+def print_reminder(when, record):
+    days = (when - date.today()).days
+    if days <= 0:
+        print(f"Reminder: today is {record.name}'s birthday!")
+    elif days == 1:
+        print(f"Reminder: tomorrow is {record.name}'s birthday.")
+    else:
+        print(f"Reminder: {record.name}'s birthday is in {days} days, on {when.strftime('%d.%m')}.")
 
-    while True:
-        records_batch = list(address_book.iterator(batch_size, page_number - 1))
-        if not records_batch:
-            print("No more contacts to display.")
-            break
 
+def show_week_birthdays():
+    upcoming = address_book.upcoming_birthdays(7)
+    if not upcoming:
+        return "No birthdays in the next 7 days."
+
+    output = "Birthdays in the next 7 days:\n\n"
+    for day, contacts in upcoming.items():
+        names = ", ".join(str(contact.name) for contact in contacts)
+        output += f"{day.strftime('%A %d.%m')}: {names}\n"
+    return output
+
+
+@input_error
+def show_all():
+    pages = address_book.pages(page_size, page_order)
+    for page_number, records_batch in enumerate(pages, start=1):
         for record in records_batch:
             birthday_info = f"birthday: {record.birthday.value};" if record.birthday else ""  # LS -->
             phones_info = f"phones: {' / '.join(str(phone) for phone in record.phones)};" if record.phones else ""
@@ -203,8 +229,8 @@ def show_all():
 
         if user_input.lower() == 'exit':
             break
-        else:
-            page_number += 1
+    else:
+        print("No more contacts to display.")
     return "Continue...\n"
 
 
@@ -213,9 +239,20 @@ def search_by_name():
     results = address_book.search_by_name(name_query)
     if results:
         return "\n".join(str(record) for record in results)
+    similar = address_book.search_by_name_fuzzy(name_query) if name_query else []
+    if similar:
+        return "No contacts found for the given name. Similar names:\n" + "\n".join(str(r) for r in similar)
     return "No contacts found for the given name."
 
 
+def search_similar():
+    name_query = input("Enter the name, spelled as you remember it: ").strip()
+    results = address_book.search_by_name_fuzzy(name_query)
+    if results:
+        return "\n".join(str(record) for record in results)
+    return "No contacts with a similar name."
+
+
 def search_by_phone():
     phone_query = input("Enter the phone or part of the phone to search: ").strip()
     results = address_book.search_by_phone(phone_query)
@@ -224,12 +261,68 @@ def search_by_phone():
     return "No contacts found for the given phone."
 
 
+def print_sort_progress(report):
+    print(f"Scanned {report.scanned} files, {report.throughput:.0f} files/s...")
+
+
 def sort_directory():
     folder_path = input("Enter the folder path to sort: ")
-    result = sort.sort_folder(folder_path)  
+    result = sort.sort_folder(folder_path, classifier=sort_classifier, dedup=sort_dedup,
+                              progress=print_sort_progress)
     return result
 
 
+def preview_sort_directory():
+    folder_path = input("Enter the folder path to preview sorting: ")
+    return sort.sort_folder(folder_path, dry_run=True, classifier=sort_classifier, dedup=sort_dedup,
+                            progress=print_sort_progress)
+
+
+def import_contacts():
+    path = input("Enter the path of a .csv, .jsonl or .vcf file (may be .gz): ").strip()
+    try:
+        return str(contacts_io.import_contacts(path, address_book))
+    except OSError as error:
+        return f"Cannot read '{path}': {error.strerror}"
+    except ValueError as error:
+        return str(error)
+
+
+def export_contacts():
+    path = input("Enter the path to export to (.csv, .jsonl or .vcf, add .gz to compress): ").strip()
+    try:
+        count = contacts_io.export_contacts(path, address_book)
+    except OSError as error:
+        return f"Cannot write '{path}': {error.strerror}"
+    except ValueError as error:
+        return str(error)
+    return f"Exported {count} contacts to {path}."
+
+
+def check_contacts():
+    problems = validation.find_invalid((key, record.to_dict()) for key, record in address_book.items())
+    return "\n".join(f"{key}: {reason}" for key, reason in problems) or "All contacts are valid."
+
+
+def show_stats():
+    if not METRICS.enabled:
+        return "Metrics are off. Start the book with --metrics to collect them."
+    return METRICS.report()
+
+
+def profile_command():
+    command = input("Enter the command to profile: ").lower().strip()
+    func = command_router.get(command)
+    if func is None:
+        return f"Unknown command '{command}'."
+    mode = input("Profile CPU time or memory? [cpu/memory]: ").lower().strip() or "cpu"
+    try:
+        result, report = profile_call(func, mode)
+    except ValueError as error:
+        return str(error)
+    return f"{result}\n\n{report}"
+
+
 def add_note():
     text = input("Enter the note text: ")
     note = Note(text)
@@ -336,6 +429,7 @@ def helper():
         days_to_birthday: "days to birthday -> shows how many days are left until the birthday",
         show_birthday_within_days: "show birthday -> display a list of contacts whose birthday is a specified number"
                                    " of days from the current date",
+        show_week_birthdays: "week birthdays -> shows contacts with birthdays in the next 7 days, grouped by day",
         edit_phone: "edit phone -> changes the phone number of an existing contact.",
         del_phone: "del phone -> delete number from contact.",
         del_note: "del note -> delete a note.",
@@ -346,10 +440,17 @@ def helper():
         show_notes: "show notes -> display all notes.",
         search_by_name: "search by name -> searches for contacts in which the name coincides",
         search_by_phone: "search by phone -> looking for contacts with a matching phone number",
+        search_similar: "search similar -> finds contacts whose name is spelled similarly (typos, Latin/Cyrillic)",
         search_note_by_tag: "search note by tag -> search for a note with a tag.",
         search_note: "search note -> Search for a note in the text",
         sort_directory: "sort folder -> sorts files into categories,"
                         " removes empty folders in the folder path specified by the user",
+        preview_sort_directory: "sort preview -> shows what 'sort folder' would do without moving anything",
+        import_contacts: "import contacts -> loads contacts from a CSV, JSON Lines or vCard file",
+        export_contacts: "export contacts -> saves all contacts to a CSV, JSON Lines or vCard file",
+        check_contacts: "check contacts -> lists contacts with an invalid phone, e-mail or birthday",
+        show_stats: "stats -> shows timings of commands and saves, and records scanned per search (--metrics)",
+        profile_command: "profile -> runs one command under the CPU or memory profiler",
         helper: "help -> displays the list of available commands.",
         exit: "exit, close, good bye -> exits the program."
     }
@@ -359,29 +460,105 @@ def helper():
     return help_text
 
 
-def find_closest_command(text, commands):
-    available_commands = list(commands.keys())
-    closest_command = difflib.get_close_matches(text.lower(), available_commands, n=1)
-    if closest_command and closest_command[0] != text.lower():
-        return closest_command[0]
-    return None
-
-
-def main():
-    file_path = 'address_book.pkl'
-    file_path_note = 'notebook.txt'
-    try:
-        with open(file_path_note, 'r') as file:
-            notebook_data = json.load(file)
-            notebook = NoteBook.from_dict(notebook_data)
-    except (FileNotFoundError, json.JSONDecodeError):
-        notebook = NoteBook()
-        print("Failed to load the notebook. Starting with an empty notebook.")
-
-    try:
-        address_book.load_from_file(file_path)
-    except pickle.UnpicklingError:
-        print("Failed to load the address book. Starting with an empty address book.")
+STORAGES = {
+    "binary": BinaryStorage,
+    "journal": JournalStorage,
+    "packed": PackedStorage,
+    "pickle": lambda: PickleStorage(legacy=JournalStorage()),
+    "sqlite": SqliteStorage,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="book", description="Personal assistant: contacts, notes and files.")
+    parser.add_argument("--storage", choices=STORAGES, default="journal",
+                        help="where contacts and notes are kept (default: journal)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="keep contacts in compact columns to save memory (journal, pickle or binary storage)")
+    parser.add_argument("--page-size", type=int, default=5, metavar="N",
+                        help="contacts per page of 'show all' (default: 5)")
+    parser.add_argument("--order", choices=paging.ORDERS, default="insertion",
+                        help="order of 'show all': insertion, name or next birthday (default: insertion)")
+    parser.add_argument("--categories", metavar="FILE",
+                        help="JSON file mapping sort categories to file extensions")
+    parser.add_argument("--sniff", action="store_true",
+                        help="when sorting, look at the first bytes of files with unknown extensions")
+    parser.add_argument("--script", metavar="FILE",
+                        help="run the commands from FILE ('-' for stdin) without prompts, then exit")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="serve the book to clients on a Unix socket path or host:port instead of prompting")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="with --serve, accept a TCP address off the loopback interface (no authentication)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="with --script, print only errors and the summary")
+    parser.add_argument("--metrics", action="store_true",
+                        help="time commands and saves and count records scanned per search; see 'stats'")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="collect metrics as with --metrics and write them to FILE as JSON on exit")
+    parser.add_argument("--dedup", choices=("remove", "link"),
+                        help="when sorting, delete duplicate files or replace them with hard links")
+    parser.add_argument("--remind", type=int, metavar="DAYS",
+                        help="remind of birthdays coming within DAYS days (0: on the day) while prompting")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="search contacts in N worker processes at once (for very large books)")
+    args = parser.parse_args(argv)
+    if args.shards and args.storage in ("packed", "sqlite"):
+        parser.error("--shards needs a book kept in memory: journal, pickle or binary storage")
+    if args.columnar and args.storage in ("packed", "sqlite"):
+        parser.error("--columnar needs a book kept in memory: journal, pickle or binary storage")
+    if args.serve and not args.allow_remote and not is_local(args.serve):
+        parser.error("--serve has no authentication: serve on a loopback address or pass --allow-remote")
+    if args.remind is not None and args.remind < 0:
+        parser.error("--remind needs a number of days, 0 or more")
+    return args
+
+
+def main(argv=None):
+    global address_book, notebook, sort_classifier, sort_dedup, page_size, page_order, command_router
+    args = parse_args(argv)
+    METRICS.enabled = args.metrics or bool(args.metrics_file)
+    sort_dedup = args.dedup
+    page_size, page_order = args.page_size, args.order
+    if args.categories:
+        sort_classifier = sort.Classifier.from_file(args.categories, sniff=args.sniff)
+    elif args.sniff:
+        sort_classifier = sort.Classifier(sniff=True)
+    storage = STORAGES[args.storage]()
+    if args.columnar:
+        storage.book_class = ColumnarAddressBook
+    address_book, notebook = storage.open()
+    if args.shards:
+        address_book = ShardedAddressBook(address_book, args.shards)
+
+    if args.serve:
+        try:
+            serve(args.serve, address_book, notebook, storage, allow_remote=args.allow_remote)
+        except ValueError as error:
+            print(error)
+        finally:
+            if args.shards:
+                address_book.close()
+            storage.close()
+        return
+
+    if args.script:
+        storage.bulk = True
+        script = sys.stdin if args.script == "-" else open(args.script, encoding="utf-8")
+        try:
+            report = run_script(script, address_book, notebook, quiet=args.quiet)
+        finally:
+            if args.shards:
+                address_book.close()
+            with METRICS.timed("persist"):
+                storage.close()
+            if script is not sys.stdin:
+                script.close()
+        print(report)
+        if args.metrics_file:
+            METRICS.dump(args.metrics_file)
+        elif METRICS.enabled:
+            print(METRICS.report())
+        return
 
     print("\nWelcome!\n")
     commands = {
@@ -397,6 +574,7 @@ def main():
         "add birthday": add_birthday,
         "edit birthday": edit_birthday,
         "show birthday": show_birthday_within_days,
+        "week birthdays": show_week_birthdays,
         "days to birthday": days_to_birthday,
         "edit phone": edit_phone,
         "del phone": del_phone,
@@ -404,30 +582,60 @@ def main():
         "show all": show_all,
         "search by name": search_by_name,
         "search by phone": search_by_phone,
+        "search similar": search_similar,
         "sort folder": sort_directory,
+        "sort preview": preview_sort_directory,
+        "import contacts": import_contacts,
+        "export contacts": export_contacts,
+        "check contacts": check_contacts,
+        "stats": show_stats,
+        "profile": profile_command,
         "help": helper,
         "exit": exit,
         "good bye": exit,
         "close": exit
     }
+    router = command_router = CommandRouter(commands)
+    install_completion(router)
+    reminders = BirthdayScheduler(address_book, print_reminder, args.remind) if args.remind is not None else None
+    # held while a command runs, so reminders due while waiting at the prompt
+    # are checked, and held-back changes saved, in the background without
+    # reading a book being changed
+    book_lock = threading.Lock()
+    storage.lock = book_lock
+    if reminders is not None:
+        reminders.start(lock=book_lock)
 
-    while True:
-        command = input("\nEnter a command: ").lower().strip()
-
-        closest_command = find_closest_command(command, commands)
-        if closest_command:
-            print(f"Did you mean '{closest_command}'")
-        else:
-            if command in commands:
-                func = commands[command]
-                print(func())
-            else:
-                print("Invalid command. Please try again.")
-
-        address_book.save_to_file(file_path)
-        with open(file_path_note, 'w') as file:
-            json.dump(notebook.to_dict(), file)
-            
+    try:
+        while True:
+            if reminders is not None:
+                with book_lock:
+                    reminders.tick()
+            command = input("\nEnter a command: ").lower().strip()
+
+            with book_lock:
+                with METRICS.timed("dispatch"):
+                    func = router.get(command)
+                    closest_command = router.suggest(command) if func is None else None
+                if func is not None:
+                    with METRICS.timed(f"command.{command}"):
+                        result = func()
+                    print(result)
+                elif closest_command:
+                    print(f"Did you mean '{closest_command}'")
+                else:
+                    print("Invalid command. Please try again.")
+
+                with METRICS.timed("persist"):
+                    storage.commit()
+    finally:
+        if reminders is not None:
+            reminders.stop()
+        if args.shards:
+            address_book.close()
+        storage.close()
+        if args.metrics_file:
+            METRICS.dump(args.metrics_file)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+UNTIMED = nullcontext()
+
+
+class Series:
+    # Count, sum, min and max of observed values, with a histogram in powers
+    # of two: bucket b holds values from 2**(b-1) up to 2**b.
+    __slots__ = ("count", "total", "low", "high", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+        self.buckets = {}
+
+    def add(self, value) -> None:
+        self.count += 1
+        self.total += value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+        bucket = int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, fraction: float):
+        # upper bound of the bucket holding the quantile, capped at the max
+        wanted = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(2 ** bucket, self.high)
+        return self.high
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.low,
+            "max": self.high,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "histogram": {f"<{2 ** bucket}": self.buckets[bucket] for bucket in sorted(self.buckets)},
+        }
+
+
+class Metrics:
+    # Named series of measurements: times in microseconds ("command.add",
+    # "persist", ...) and sizes ("scanned.NameIndex" is the number of
+    # candidates a name search looked at). Code that measures checks
+    # `enabled` first, so switched off the cost is one attribute test.
+    def __init__(self):
+        self.enabled = False
+        self.series = {}
+        self.started = time.time()
+
+    def observe(self, name: str, value) -> None:
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = Series()
+        series.add(value)
+
+    def timed(self, name: str):
+        # wall time and CPU time of the block, the latter as name + ".cpu"
+        # (a handler waiting for input() only shows in the wall time)
+        return self._timed(name) if self.enabled else UNTIMED
+
+    @contextmanager
+    def _timed(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - wall) * 1e6)
+            self.observe(name + ".cpu", (time.process_time() - cpu) * 1e6)
+
+    def clear(self) -> None:
+        self.series = {}
+        self.started = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "dumped": time.time(),
+            "series": {name: series.to_dict() for name, series in sorted(self.series.items())},
+        }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def report(self) -> str:
+        if not self.series:
+            return "No measurements yet."
+        lines = [f"{'series':36} {'count':>7} {'mean':>11} {'p50':>9} {'p99':>9} {'max':>11}"]
+        for name, series in sorted(self.series.items()):
+            lines.append(f"{name:36} {series.count:>7} {series.total / series.count:>11.1f} "
+                         f"{series.quantile(0.5):>9.0f} {series.quantile(0.99):>9.0f} {series.high:>11.1f}")
+        lines.append("Times are in microseconds, scanned.* in records.")
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+
+
+def profile_call(func, mode: str = "cpu", top: int = 20):
+    # runs func() once under cProfile ("cpu") or tracemalloc ("memory") and
+    # returns its result and the report
+    if mode == "cpu":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return result, out.getvalue()
+    if mode == "memory":
+        tracemalloc.start()
+        try:
+            result = func()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        lines = [f"Allocated {current / 1024:.1f} KB still held, peak {peak / 1024:.1f} KB; largest sites:"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+        return result, "\n".join(lines)
+    raise ValueError(f"Unknown profile mode '{mode}', expected 'cpu' or 'memory'")
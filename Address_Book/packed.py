@@ -0,0 +1,348 @@
+import json
+import mmap
+import pickle
+import struct
+import threading
+from collections.abc import Mapping, MutableMapping
+from datetime import date
+from itertools import islice
+from weakref import WeakValueDictionary
+
+from Address_Book.atomic import atomic_write
+from Address_Book.classes import INDEXED, AddressBook, Record
+
+# A pack file is a header, the records (each one its key followed by the JSON
+# of the record) in book order, a table with the offsets of every key and
+# record in the same order, a table of entry numbers sorted by key and the
+# notes as one JSON document.
+MAGIC = b"ABPK"
+VERSION = 1
+# magic, version, journal segment, record count, entry table offset, sorted
+# key table offset, notes offset, notes length
+HEADER = struct.Struct("<4sHxxQQQQQQ")
+# key offset, key length, record offset, record length
+ENTRY = struct.Struct("<QIQI")
+SLOT = struct.Struct("<I")
+
+
+def encode_record(record: Record) -> bytes:
+    return json.dumps(record.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_pack(path, items, notes, segment=0):
+    # items yields (key, encoded record) in book order; while writing only the
+    # keys and their offsets are kept in memory.
+    entries = []
+    keys = []
+    with atomic_write(path) as file:
+        file.write(bytes(HEADER.size))
+        position = HEADER.size
+        for key, blob in items:
+            key_bytes = key.encode("utf-8")
+            file.write(key_bytes)
+            file.write(blob)
+            entries.append(ENTRY.pack(position, len(key_bytes), position + len(key_bytes), len(blob)))
+            keys.append(key_bytes)
+            position += len(key_bytes) + len(blob)
+        entries_offset = position
+        file.write(b"".join(entries))
+        keys_offset = entries_offset + len(entries) * ENTRY.size
+        # UTF-8 bytes sort in the same order as the strings they encode
+        file.write(b"".join(SLOT.pack(n) for n in sorted(range(len(keys)), key=keys.__getitem__)))
+        notes_offset = keys_offset + len(keys) * SLOT.size
+        notes_blob = json.dumps(notes, ensure_ascii=False).encode("utf-8")
+        file.write(notes_blob)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, segment, len(keys), entries_offset, keys_offset,
+                               notes_offset, len(notes_blob)))
+
+
+class PackedFile:
+    # Read-only view of a pack file through mmap. Opening it reads the header
+    # only; keys are found by binary search over the sorted key table.
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.segment, self.count, self.entries_offset, self.keys_offset,
+         self.notes_offset, self.notes_length) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"'{path}' is not an address book pack file")
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self.map, self.entries_offset + position * ENTRY.size)
+
+    def key(self, position) -> str:
+        key_offset, key_length, _, _ = self._entry(position)
+        return self.map[key_offset:key_offset + key_length].decode("utf-8")
+
+    def raw(self, position) -> bytes:
+        _, _, offset, length = self._entry(position)
+        return self.map[offset:offset + length]
+
+    def record(self, position) -> Record:
+        return Record.from_dict(json.loads(self.raw(position)))
+
+    def find(self, key):
+        target = key.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            (position,) = SLOT.unpack_from(self.map, self.keys_offset + middle * SLOT.size)
+            key_offset, key_length, _, _ = self._entry(position)
+            current = self.map[key_offset:key_offset + key_length]
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return position
+        return None
+
+    def notes(self) -> list:
+        return json.loads(self.map[self.notes_offset:self.notes_offset + self.notes_length])
+
+    def close(self):
+        self.map.close()
+
+
+class PackedRecords(MutableMapping):
+    # Mapping over a pack file and the changes made since it was written.
+    # Records of the pack are decoded on first access and shared while
+    # something still holds them. A record replaced in place lives in
+    # `changes`, a removed one is None there, and new records (or records
+    # removed and added again) follow the pack in `appended`. A record is
+    # numbered by its place in the pack, or from the end of the pack on in
+    # the order records were appended.
+    def __init__(self, pack: PackedFile):
+        self.pack = pack
+        self.changes = {}
+        self.appended = {}
+        self.numbers = {}
+        self.cache = WeakValueDictionary()
+        self._size = len(pack)
+        self._next_number = len(pack)
+
+    def loaded(self, key):
+        # the record for key if it is already in memory, without decoding it
+        record = self.appended.get(key) or self.changes.get(key)
+        return record if record is not None else self.cache.get(key)
+
+    def _in_pack(self, key):
+        if key in self.changes:
+            return self.changes[key] is not None
+        return self.pack.find(key) is not None
+
+    def __getitem__(self, key):
+        record = self.loaded(key)
+        if record is not None:
+            return record
+        position = None if key in self.changes else self.pack.find(key)
+        if position is None:
+            raise KeyError(key)
+        record = self.pack.record(position)
+        self.cache[key] = record
+        return record
+
+    def __setitem__(self, key, record):
+        if key in self.appended:
+            self.appended[key] = record
+        elif self._in_pack(key):
+            self.changes[key] = record
+        else:
+            self.appended[key] = record
+            self.numbers[key] = self._next_number
+            self._next_number += 1
+            self._size += 1
+
+    def __delitem__(self, key):
+        if key in self.appended:
+            del self.appended[key]
+            del self.numbers[key]
+        elif self._in_pack(key):
+            self.changes[key] = None
+        else:
+            raise KeyError(key)
+        self.cache.pop(key, None)
+        self._size -= 1
+
+    def discard(self, key):
+        if key in self:
+            del self[key]
+
+    def __contains__(self, key):
+        return key in self.appended or self._in_pack(key)
+
+    def __iter__(self):
+        for position in range(len(self.pack)):
+            key = self.pack.key(position)
+            if key not in self.changes or self.changes[key] is not None:
+                yield key
+        yield from list(self.appended)
+
+    def __len__(self):
+        return self._size
+
+    def number(self, key):
+        # the place of key in book order, or None
+        number = self.numbers.get(key)
+        if number is None and self.changes.get(key, True) is not None:
+            number = self.pack.find(key)
+        return number
+
+    def numbered(self, start=0):
+        # (number, key) in book order, from number `start` on
+        changes = self.changes
+        for position in range(start, len(self.pack)):
+            key = self.pack.key(position)
+            if changes.get(key, True) is not None:
+                yield position, key
+        for key, number in list(self.numbers.items()):
+            if number >= start:
+                yield number, key
+
+    def blobs(self):
+        # (key, encoded record) in book order; records that were not changed
+        # are copied from the pack without decoding them
+        for position in range(len(self.pack)):
+            key = self.pack.key(position)
+            if key not in self.changes:
+                yield key, self.pack.raw(position)
+            elif self.changes[key] is not None:
+                yield key, encode_record(self.changes[key])
+        for key, record in list(self.appended.items()):
+            yield key, encode_record(record)
+
+
+class BookOrder(Mapping):
+    # The insertion numbers of a MappedAddressBook, as AddressBook._order:
+    # looked up in the records instead of held for every contact.
+    def __init__(self, records: PackedRecords):
+        self.records = records
+
+    def __getitem__(self, key):
+        number = self.records.number(key)
+        if number is None:
+            raise KeyError(key)
+        return number
+
+    def __delitem__(self, key):
+        # the records drop the number with the record
+        pass
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+
+class MappedAddressBook(AddressBook):
+    # Address book over a pack file. Opening costs the same for any size of
+    # book: records are decoded when they are touched, and each search index
+    # is built the first time a search needs it. Pages in insertion order
+    # are read straight from the key table of the pack; other orders build
+    # their ordering on first use.
+    def __init__(self, pack: PackedFile):
+        super().__init__()
+        self.data = PackedRecords(pack)
+        self._order = BookOrder(self.data)
+        # only the indexes built so far are kept up to date
+        self._indexed = frozenset()
+        self._indexing = threading.Lock()
+
+    def _build_index(self, name):
+        if name in self._indexed:
+            return
+        # readers sharing the book may all ask at once; one of them builds
+        with self._indexing:
+            if name in self._indexed:
+                return
+            index, value = getattr(self, name), INDEXED[name]
+            for key in self.data:
+                index.add(key, value(self.data[key]))
+            self._indexed = self._indexed | {name}
+
+    def __setitem__(self, key, record):
+        old = self.data.loaded(key)
+        if old is not None and old is not record:
+            self._detach(old)
+        self.data[key] = record
+        record._book = self
+        record._key = key
+        self._index(key, record)
+        self._notify("put", key, record)
+
+    def __delitem__(self, key):
+        record = self.data.loaded(key)
+        del self.data[key]
+        if record is not None:
+            self._detach(record)
+        self._unindex(key)
+        self._notify("delete", key)
+
+    def __getitem__(self, key):
+        record = self.data[key]
+        record._book = self
+        record._key = key
+        return record
+
+    def _record_changed(self, record):
+        if self.data.loaded(record._key) is record:
+            self.data[record._key] = record
+            self._index(record._key, record)
+            self._notify("put", record._key, record)
+
+    def _ordered(self, keys):
+        return [self[key] for key in sorted(keys, key=self._order.__getitem__)]
+
+    def _fetch_page(self, order, lower, upper, after, count):
+        if order != "insertion":
+            return super()._fetch_page(order, lower, upper, after, count)
+        found = []
+        for number, key in self.data.numbered(0 if after is None else after[0] + 1):
+            if len(found) == count:
+                break
+            found.append(((number, key), self[key]))
+        return found
+
+    def _lookup(self, field, operator, args, today):
+        if field == "name":
+            self._build_index("fuzzy_index" if operator == "similar" else "name_index")
+        else:
+            self._build_index(f"{field}_index")
+        return super()._lookup(field, operator, args, today)
+
+    def search_by_name(self, name_query):
+        self._build_index("name_index")
+        return super().search_by_name(name_query)
+
+    def search_by_phone(self, phone_query):
+        self._build_index("phone_index")
+        return super().search_by_phone(phone_query)
+
+    def search_by_name_fuzzy(self, name_query, max_distance=2, limit=10):
+        self._build_index("fuzzy_index")
+        return super().search_by_name_fuzzy(name_query, max_distance, limit)
+
+    def birthdays_within(self, days, today=None):
+        self._build_index("birthday_index")
+        found = self.birthday_index.within(today or date.today(), days)
+        found.sort(key=lambda item: (item[0], self._order[item[1]]))
+        return [(when, self[key]) for when, key in found]
+
+    def clear(self):
+        for key in list(self.data):
+            del self[key]
+
+    def save_to_file(self, file_path):
+        with atomic_write(file_path) as f:
+            pickle.dump(dict(self.data.items()), f)
+
+    def iterator(self, batch_size, page_number):
+        start = page_number * batch_size
+        return [self[key] for key in islice(self.data, start, start + batch_size)]
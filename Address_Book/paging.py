@@ -0,0 +1,82 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+
+ORDERS = ("insertion", "name", "birthday")
+
+# contacts without a birthday come after December
+NO_BIRTHDAY = 13
+
+
+def position(order: str, number: int, key, record) -> tuple:
+    # where a contact stands in an order; `number` is its insertion number,
+    # which keeps positions unique, and the key is always last
+    if order == "name":
+        return str(record.name).lower(), number, key
+    if order == "birthday":
+        born = record.birth_date()
+        if born is None:
+            return NO_BIRTHDAY, 0, number, key
+        return born.month, born.day, number, key
+    return number, key
+
+
+def laps(order: str, today: date) -> list:
+    # the (lower, upper) ranges of positions walked one after another: next
+    # birthdays start today and go round the year, then those without one
+    if order == "birthday":
+        start = (today.month, today.day)
+        return [(start, (NO_BIRTHDAY,)), (None, start), ((NO_BIRTHDAY,), None)]
+    return [(None, None)]
+
+
+class SortedKeys:
+    # Positions of all contacts in one order, kept sorted as contacts are
+    # added, changed and removed.
+    def __init__(self, order: str, items=()):
+        self.order = order
+        self.positions = {key: position(order, number, key, record) for key, number, record in items}
+        self.entries = sorted(self.positions.values())
+
+    def add(self, key, number: int, record) -> None:
+        new = position(self.order, number, key, record)
+        old = self.positions.get(key)
+        if old == new:
+            return
+        if old is not None:
+            del self.entries[bisect_left(self.entries, old)]
+        self.positions[key] = new
+        insort(self.entries, new)
+
+    def remove(self, key) -> None:
+        old = self.positions.pop(key, None)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, old)]
+
+    def between(self, lower, upper, after, count: int) -> list:
+        # up to `count` positions from lower (inclusive) to upper (exclusive)
+        # that come after `after`; None leaves a bound open
+        start = 0 if lower is None else bisect_left(self.entries, lower)
+        if after is not None:
+            start = max(start, bisect_right(self.entries, after))
+        end = len(self.entries) if upper is None else bisect_left(self.entries, upper)
+        return self.entries[start:min(end, start + count)]
+
+
+def pages(fetch, size: int, ranges: list):
+    # Cursor over an order: each page is fetched as the contacts after the
+    # last position shown, so contacts added or removed between pages never
+    # make others repeat or go missing. fetch(lower, upper, after, count)
+    # returns (position, record) pairs.
+    lap, after = 0, None
+    while lap < len(ranges):
+        page = []
+        while len(page) < size and lap < len(ranges):
+            wanted = size - len(page)
+            found = fetch(*ranges[lap], after, wanted)
+            page.extend(record for _, record in found)
+            if len(found) < wanted:
+                lap, after = lap + 1, None
+            else:
+                after = found[-1][0]
+        if page:
+            yield page
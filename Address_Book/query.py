@@ -0,0 +1,289 @@
+from datetime import date
+
+from Address_Book import paging, validation
+from Address_Book.birthdays import next_birthday
+from Address_Book.indexes import FuzzyNameIndex, latin
+
+TEXT_FIELDS = ("name", "phone", "address", "email", "domain")
+FIELDS = TEXT_FIELDS + ("birthday",)
+OPERATORS = {
+    **{field: ("equals", "prefix", "contains", "between", "similar") for field in TEXT_FIELDS},
+    "birthday": ("equals", "between", "upcoming"),
+}
+
+# (field, operator) pairs a book can answer from an index (see
+# AddressBook._lookup), with a rank: the lower, the fewer contacts the index
+# is expected to return. Substrings shorter than SHORT and birthday windows
+# longer than a month are ranked as less selective.
+INDEXED = {
+    ("name", "equals"): 1,
+    ("phone", "equals"): 1,
+    ("domain", "equals"): 2,
+    ("name", "contains"): 3,
+    ("name", "prefix"): 3,
+    ("phone", "contains"): 3,
+    ("phone", "prefix"): 3,
+    ("birthday", "upcoming"): 4,
+    ("name", "similar"): 5,
+}
+SHORT = 3
+LESS_SELECTIVE = 4
+SCAN_PAGE = 256
+
+
+def _texts(record, field: str) -> list:
+    if field == "name":
+        return [str(record.name)]
+    if field == "phone":
+        return [str(phone) for phone in record.phones]
+    email = record.email.value if record.email else None
+    if field == "domain":
+        return [email.rpartition("@")[2]] if email else []
+    value = getattr(record, field)
+    value = value.value if value else None
+    return [value] if value else []
+
+
+def _birthday(value) -> date:
+    if isinstance(value, date) or value is None:
+        return value
+    born = validation.parse_birthday(value)
+    if born is None:
+        raise ValueError(f"Incorrect birthday '{value}', expected DD.MM.YYYY")
+    return born
+
+
+class Predicate:
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+
+class Match(Predicate):
+    # one condition on one field; text compares ignore case, and a contact
+    # with several phones matches when any of them does
+    def __init__(self, field: str, operator: str, *args):
+        if operator not in OPERATORS.get(field, ()):
+            raise ValueError(f"'{operator}' is not supported on '{field}'")
+        self.field = field
+        self.operator = operator
+        if field == "birthday" and operator != "upcoming":
+            args = tuple(_birthday(arg) for arg in args)
+        elif field != "birthday":
+            args = tuple(arg.lower() if isinstance(arg, str) else arg for arg in args)
+        self.args = args
+
+    def matches(self, record, today: date) -> bool:
+        if self.field == "birthday":
+            born = record.birth_date()
+            if born is None:
+                return False
+            if self.operator == "upcoming":
+                days, when = self.args[0], self.args[1] or today
+                return (next_birthday(born, when) - when).days <= days
+            return self._compare(born)
+        return any(self._compare(text.lower()) for text in _texts(record, self.field))
+
+    def _compare(self, value) -> bool:
+        operator, args = self.operator, self.args
+        if operator == "equals":
+            return value == args[0]
+        if operator == "prefix":
+            return value.startswith(args[0])
+        if operator == "contains":
+            return args[0] in value
+        if operator == "between":
+            low, high = args
+            return (low is None or low <= value) and (high is None or value <= high)
+        query, max_distance = latin(args[0]), args[1]
+        return FuzzyNameIndex.distance(query, latin(value), max_distance) <= max_distance
+
+    def rank(self):
+        # None when no index answers this condition
+        rank = INDEXED.get((self.field, self.operator))
+        if rank is None:
+            return None
+        if self.operator in ("contains", "prefix") and len(self.args[0]) < SHORT:
+            rank += LESS_SELECTIVE
+        if self.operator == "upcoming" and self.args[0] > 31:
+            rank += LESS_SELECTIVE
+        return rank
+
+    def access(self):
+        # [(rank, match)] for the indexes giving every contact that matches
+        rank = self.rank()
+        return None if rank is None else [(rank, self)]
+
+    def __str__(self):
+        args = self.args
+        if self.operator == "upcoming" and args[1] is None:
+            args = args[:1]
+        return f"{self.field} {self.operator} {', '.join(repr(arg) for arg in args)}"
+
+
+class And(Predicate):
+    def __init__(self, *parts):
+        self.parts = [part for item in parts for part in (item.parts if isinstance(item, And) else [item])]
+
+    def matches(self, record, today: date) -> bool:
+        return all(part.matches(record, today) for part in self.parts)
+
+    def access(self):
+        # the single most selective part: the others are checked on its result
+        paths = [path for path in (part.access() for part in self.parts) if path is not None]
+        return min(paths, key=lambda path: sum(rank for rank, _ in path), default=None)
+
+    def __str__(self):
+        return " AND ".join(f"({part})" if isinstance(part, Or) else str(part) for part in self.parts)
+
+
+class Or(Predicate):
+    def __init__(self, *parts):
+        self.parts = [part for item in parts for part in (item.parts if isinstance(item, Or) else [item])]
+
+    def matches(self, record, today: date) -> bool:
+        return any(part.matches(record, today) for part in self.parts)
+
+    def access(self):
+        # the union of the parts' indexes, or nothing if one part has none
+        paths = [part.access() for part in self.parts]
+        if any(path is None for path in paths):
+            return None
+        return [step for path in paths for step in path]
+
+    def __str__(self):
+        return " OR ".join(f"({part})" if isinstance(part, And) else str(part) for part in self.parts)
+
+
+class FieldRef:
+    # field("name").contains("ann") and the like build the conditions
+    def __init__(self, name: str):
+        if name not in FIELDS:
+            raise ValueError(f"Unknown field '{name}', expected one of: {', '.join(FIELDS)}")
+        self.name = name
+
+    def equals(self, value):
+        return Match(self.name, "equals", value)
+
+    def prefix(self, text: str):
+        return Match(self.name, "prefix", text)
+
+    def contains(self, text: str):
+        return Match(self.name, "contains", text)
+
+    def between(self, low=None, high=None):
+        # inclusive; either end may be left open
+        return Match(self.name, "between", low, high)
+
+    def similar(self, text: str, max_distance: int = 2):
+        return Match(self.name, "similar", text, max_distance)
+
+    def upcoming(self, days: int, today: date = None):
+        # the next birthday is at most `days` days after today
+        return Match(self.name, "upcoming", days, today)
+
+
+def field(name: str) -> FieldRef:
+    return FieldRef(name)
+
+
+def equal_to(**values):
+    # what search_records(name=..., email=...) looks for
+    return And(*(field(name).equals(value) for name, value in values.items())) if values else None
+
+
+class Query:
+    # Contacts of a book matching a predicate, in one of the paging orders,
+    # at most `limit` of them. The plan is the cheapest set of indexes that
+    # yields every match; without one the book is read page by page in the
+    # wanted order, which lets a limit stop the walk early. Either way the
+    # whole predicate is checked on each candidate.
+    def __init__(self, book, where: Predicate = None, order: str = "insertion", limit: int = None,
+                 today: date = None):
+        if order not in paging.ORDERS:
+            raise ValueError(f"Unknown order '{order}', expected one of: {', '.join(paging.ORDERS)}")
+        self.book = book
+        self.predicate = where
+        self.order = order
+        self.count = limit
+        self.today = today
+        self.stats = None
+
+    def _copy(self, **changes):
+        settings = {"where": self.predicate, "order": self.order, "limit": self.count, "today": self.today}
+        settings.update(changes)
+        return Query(self.book, **settings)
+
+    def where(self, predicate: Predicate):
+        return self._copy(where=predicate if self.predicate is None else And(self.predicate, predicate))
+
+    def order_by(self, order: str):
+        return self._copy(order=order)
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def plan(self):
+        # [(rank, match)] of the indexes to read, or None for a scan
+        return None if self.predicate is None else self.predicate.access()
+
+    def _candidates(self, plan, today):
+        if plan is None:
+            for page in self.book.pages(SCAN_PAGE, self.order, today):
+                yield from page
+            return
+        found = {}
+        for _, match in plan:
+            for record in self.book._lookup(match.field, match.operator, match.args, today):
+                found.setdefault(record._key, record)
+        self.stats["fetched"] = len(found)
+        positions = self.book._positions(found)
+        start = (today.month, today.day)
+
+        def place(record):
+            spot = paging.position(self.order, positions[record._key], record._key, record)
+            if self.order != "birthday":
+                return spot
+            # next birthdays from today round the year, then the rest
+            return (2 if spot[0] == paging.NO_BIRTHDAY else 0 if spot[:2] >= start else 1), spot
+
+        yield from sorted(found.values(), key=place)
+
+    def all(self) -> list:
+        today = self.today or date.today()
+        plan = self.plan()
+        self.stats = {"fetched": None, "scanned": 0, "matched": 0}
+        results = []
+        if self.count is not None and self.count <= 0:
+            return results
+        for record in self._candidates(plan, today):
+            self.stats["scanned"] += 1
+            if self.predicate is None or self.predicate.matches(record, today):
+                results.append(record)
+                if self.count is not None and len(results) >= self.count:
+                    break
+        self.stats["matched"] = len(results)
+        return results
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def explain(self) -> str:
+        # runs the query and tells how it was answered
+        plan = self.plan()
+        self.all()
+        if plan is None:
+            lines = [f"scan all contacts in {self.order} order"]
+        else:
+            lines = [f"index {match} (rank {rank})" for rank, match in plan]
+            if len(plan) > 1:
+                lines.append("union of the indexes above")
+            lines.append(f"fetched {self.stats['fetched']} from the index, sorted in {self.order} order")
+        if self.predicate is not None:
+            lines.append(f"filter {self.predicate}")
+        if self.count is not None:
+            lines.append(f"limit {self.count}")
+        lines.append(f"scanned {self.stats['scanned']}, matched {self.stats['matched']}")
+        return "\n".join(lines)
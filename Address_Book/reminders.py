@@ -0,0 +1,126 @@
+import heapq
+import queue
+import threading
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+from Address_Book.birthdays import next_birthday
+
+# superseded heap entries allowed, beyond the live ones, before a rebuild
+SLACK = 1024
+
+
+class BirthdayScheduler:
+    # Fires (when, record) for every birthday that comes within `days_ahead`
+    # days, once per year and contact. The next birthday of each contact is
+    # kept in a heap, built once from the book; changes to the book push a
+    # new entry for the contact and the old one is skipped when it surfaces.
+    # A tick pops only the entries that are due, so it costs O(log N) per
+    # reminder and O(1) when there is none. Reminders go to `callback` or,
+    # without one, to the `events` queue.
+    def __init__(self, book, callback=None, days_ahead: int = 0, today: date = None):
+        self.book = book
+        self.callback = callback
+        self.events = queue.Queue()
+        self.days_ahead = days_ahead
+        self.today = today or date.today()
+        self._lock = threading.Lock()
+        self._born = {}
+        self._due = {}
+        self._heap = []
+        self._seq = 0
+        self._thread = None
+        self._stop = threading.Event()
+        for key, record in book.items():
+            born = record.birth_date()
+            if born is not None:
+                self._schedule(key, born, next_birthday(born, self.today), push=False)
+        heapq.heapify(self._heap)
+        book.subscribe(self._on_event)
+
+    def _schedule(self, key, born, when, push=True):
+        self._seq += 1
+        self._born[key] = born
+        self._due[key] = (when, self._seq)
+        entry = (when, self._seq, key)
+        if push:
+            heapq.heappush(self._heap, entry)
+        else:
+            self._heap.append(entry)
+
+    def _on_event(self, event, key, record=None):
+        with self._lock:
+            born = record.birth_date() if event == "put" else None
+            if born == self._born.get(key):
+                # e.g. a new phone: the reminder stays as it was
+                return
+            self._born.pop(key, None)
+            self._due.pop(key, None)
+            if born is not None:
+                self._schedule(key, born, next_birthday(born, self.today))
+            if len(self._heap) > 2 * len(self._due) + SLACK:
+                self._heap = [(when, seq, key) for key, (when, seq) in self._due.items()]
+                heapq.heapify(self._heap)
+
+    def next_due(self):
+        # the date of the earliest pending birthday, or None
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self._due.get(heap[0][2]) != heap[0][:2]:
+            heapq.heappop(heap)
+
+    def tick(self, today: date = None) -> list:
+        # fires and returns the reminders due by today + days_ahead; a
+        # birthday already past (no tick ran that day) is only moved on to
+        # the next year
+        today = today or date.today()
+        horizon = today + timedelta(days=self.days_ahead)
+        reminders = []
+        with self._lock:
+            self.today = max(self.today, today)
+            while True:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > horizon:
+                    break
+                when, _, key = heapq.heappop(self._heap)
+                born = self._born[key]
+                if when < today:
+                    self._schedule(key, born, next_birthday(born, today))
+                    continue
+                self._schedule(key, born, next_birthday(born, when + timedelta(days=1)))
+                record = self.book.get(key)
+                if record is not None:
+                    reminders.append((when, record))
+        for when, record in reminders:
+            if self.callback is not None:
+                self.callback(when, record)
+            else:
+                self.events.put((when, record))
+        return reminders
+
+    def start(self, interval: float = 60.0, lock=None):
+        # ticks in a background thread every `interval` seconds until stop();
+        # `lock`, when given, is held around each tick, so the thread does not
+        # read the book while the code owning it changes it
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        guard = lock if lock is not None else nullcontext()
+
+        def run():
+            while not self._stop.wait(interval):
+                with guard:
+                    self.tick()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,72 @@
+from Address_Book.fuzzy import BKTree
+
+END = None
+
+
+class CommandRouter:
+    # Resolves typed lines against a command table: exact names through the
+    # table itself, partly typed names through a prefix trie and typos through
+    # a BK-tree, both built once from the table.
+    def __init__(self, commands: dict):
+        self.commands = commands
+        self.position = {name: position for position, name in enumerate(commands)}
+        self.trie = {}
+        for name in commands:
+            node = self.trie
+            for ch in name:
+                node = node.setdefault(ch, {})
+            node[END] = name
+        self.typos = BKTree(commands)
+        self._matches = []
+
+    def get(self, text: str):
+        return self.commands.get(text)
+
+    def complete(self, prefix: str) -> list:
+        node = self.trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        names = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for ch, child in node.items():
+                if ch is END:
+                    names.append(child)
+                else:
+                    stack.append(child)
+        names.sort(key=self.position.__getitem__)
+        return names
+
+    def suggest(self, text: str, max_distance: int = None):
+        if max_distance is None:
+            max_distance = max(2, len(text) // 3)
+        found = self.typos.search(text, max_distance)
+        if found:
+            return found[0][1]
+        # a command typed only in part
+        names = self.complete(text) if text else []
+        return names[0] if names else None
+
+    def readline_completer(self, text, state):
+        if state == 0:
+            self._matches = self.complete(text.lower().lstrip())
+        return self._matches[state] if state < len(self._matches) else None
+
+
+def install_completion(router: CommandRouter) -> bool:
+    # Tab completes whole command names at the prompt; False where readline
+    # is not available (e.g. Windows without pyreadline).
+    try:
+        import readline
+    except ImportError:
+        return False
+    readline.set_completer(router.readline_completer)
+    readline.set_completer_delims("")
+    if "libedit" in (readline.__doc__ or ""):
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+    return True
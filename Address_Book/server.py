@@ -0,0 +1,274 @@
+import asyncio
+import ipaddress
+import json
+import os
+import stat
+import threading
+from datetime import date
+
+from Address_Book import batch
+from Address_Book.client import parse_address
+from Address_Book.concurrency import RWLock
+
+# Operations served over the socket. Handlers take the address book, the
+# notebook and the arguments of the request, like the batch commands, and
+# return something JSON can carry. Arguments of reads may be strings or
+# numbers; arguments of writes are strings, as typed in a batch script.
+
+
+def _records(records):
+    return [record.to_dict() for record in records]
+
+
+def _notes(notes):
+    return [{"text": note.text, "tags": list(note.tags)} for note in notes]
+
+
+def _get(address_book, notebook, name):
+    record = address_book.get(name)
+    if record is None:
+        raise KeyError(f"No contact '{name}' in address book")
+    return record.to_dict()
+
+
+def _birthdays(address_book, notebook, days, today=None):
+    today = date.fromisoformat(today) if today else None
+    return [[when.isoformat(), record.to_dict()]
+            for when, record in address_book.birthdays_within(int(days), today)]
+
+
+def _page(address_book, notebook, size, number):
+    return _records(address_book.iterator(int(size), int(number)))
+
+
+READS = {
+    "get": _get,
+    "count": lambda address_book, notebook: len(address_book),
+    "page": _page,
+    "search name": lambda address_book, notebook, query: _records(address_book.search_by_name(query)),
+    "search phone": lambda address_book, notebook, query: _records(address_book.search_by_phone(query)),
+    "search similar": lambda address_book, notebook, query, max_distance=2, limit=10: _records(
+        address_book.search_by_name_fuzzy(query, int(max_distance), int(limit))),
+    "birthdays": _birthdays,
+    "birthdays on": lambda address_book, notebook, days: _records(address_book.birthdays_on(int(days))),
+    "notes": lambda address_book, notebook: _notes(notebook.get_notes()),
+    "search notes": lambda address_book, notebook, word: _notes(notebook.search_notes_by_word(word)),
+    "search notes by tags": lambda address_book, notebook, *tags: _notes(notebook.search_notes_by_tags(tags)),
+}
+
+WRITES = {
+    "add": batch.add_contact,
+    "add phone": batch.add_phone,
+    "del phone": batch.del_phone,
+    "change phone": batch.change_phone,
+    "add birthday": batch.add_birthday,
+    "del contact": batch.delete_contact,
+    "add note": batch.add_note,
+    "add tag": batch.add_tag,
+    "change note": batch.change_note,
+    "del note": batch.del_note,
+}
+
+
+def is_local(address: str) -> bool:
+    # a Unix socket or a TCP address on the loopback interface
+    kind, *where = parse_address(address)
+    if kind == "unix" or where[0] == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(where[0]).is_loopback
+    except ValueError:
+        return False
+
+
+def _is_socket(path) -> bool:
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def _is_write(request):
+    return isinstance(request, list) and bool(request) and isinstance(request[0], str) and request[0] in WRITES
+
+
+def _resolve(future, result):
+    # the future of a client that went away may be cancelled already
+    if not future.done():
+        future.set_result(result)
+
+
+class BookServer:
+    # Serves one address book and notebook to many clients. Reads run in
+    # worker threads under the read lock as soon as they arrive, so they
+    # never wait for each other and a slow search does not hold up the event
+    # loop; writes are applied by a single writer task under the write lock,
+    # which commits the storage once for all writes that queued up meanwhile.
+    # Answers on a connection keep the order of its requests, and a read
+    # pipelined after a write on the same connection sees that write.
+    def __init__(self, address_book, notebook, storage=None):
+        self.address_book = address_book
+        self.notebook = notebook
+        self.storage = storage
+        self.lock = RWLock()
+        # held while the book changes or is saved; a storage saving in the
+        # background takes it too
+        self.saving = threading.Lock()
+        if storage is not None:
+            storage.lock = self.saving
+        self.writes = None
+        self.connections = 0
+        self.served = 0
+
+    def execute(self, request):
+        try:
+            if not isinstance(request, list) or not request or not isinstance(request[0], str):
+                raise ValueError("A request is a JSON array: [\"operation\", arguments...]")
+            op, *args = request
+            handler = READS.get(op) or WRITES.get(op)
+            if handler is None:
+                raise ValueError(f"Unknown operation '{op}'")
+            kinds, expected = ((str,), "strings") if op in WRITES else ((str, int, float), "strings or numbers")
+            if any(isinstance(arg, bool) or not isinstance(arg, kinds) for arg in args):
+                raise ValueError(f"Arguments of '{op}' must be {expected}")
+            if not batch.accepts(handler, self.address_book, self.notebook, *args):
+                raise ValueError(f"wrong number of arguments for '{op}'")
+            result = handler(self.address_book, self.notebook, *args)
+        except (KeyError, ValueError) as error:
+            return {"ok": False, "error": error.args[0] if error.args else str(error)}
+        except Exception as error:
+            # a bad request must not take the connection or the writer down
+            return {"ok": False, "error": f"Failed to run '{request[0]}': {error!r}"}
+        return {"ok": True, "result": result}
+
+    def _read(self, request):
+        with self.lock.read():
+            return self.execute(request)
+
+    def _apply(self, requests):
+        with self.lock.write(), self.saving:
+            return [self.execute(request) for request in requests]
+
+    def _commit(self):
+        with self.saving:
+            self.storage.commit()
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            queued = [await self.writes.get()]
+            while not self.writes.empty():
+                queued.append(self.writes.get_nowait())
+            results = await loop.run_in_executor(None, self._apply, [request for request, _, _ in queued])
+            for _, applied, _ in queued:
+                _resolve(applied, None)
+            if self.storage is not None:
+                try:
+                    await loop.run_in_executor(None, self._commit)
+                except Exception as error:
+                    # the writes stay in memory and go out with the next commit
+                    results = [{"ok": False, "error": f"Failed to save the changes: {error}"}] * len(queued)
+            for (_, _, answer), result in zip(queued, results):
+                _resolve(answer, result)
+
+    async def _after(self, write, request):
+        await asyncio.shield(write)
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, request)
+
+    async def _queue_after(self, earlier, item):
+        # a write goes to the writer only once the requests before it on its
+        # connection have run
+        await asyncio.wait(earlier)
+        self.writes.put_nowait(item)
+
+    async def _send(self, answers, writer):
+        while True:
+            answer = await answers.get()
+            if answer is None:
+                break
+            response = await answer
+            self.served += response["ok"]
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            if answers.empty():
+                await writer.drain()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        answers = asyncio.Queue()
+        sender = asyncio.create_task(self._send(answers, writer))
+        last_write = None
+        # reads since the last write, and the task queueing that write if it
+        # still waits for the requests before it
+        pending = []
+        self.connections += 1
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    request = None
+                if _is_write(request):
+                    answer, applied = loop.create_future(), loop.create_future()
+                    earlier = [future for future in pending if not future.done()]
+                    if earlier:
+                        pending = [asyncio.ensure_future(self._queue_after(earlier, (request, applied, answer)))]
+                    else:
+                        self.writes.put_nowait((request, applied, answer))
+                        pending = []
+                    last_write = applied
+                else:
+                    if last_write is not None and not last_write.done():
+                        answer = asyncio.ensure_future(self._after(last_write, request))
+                    else:
+                        answer = loop.run_in_executor(None, self._read, request)
+                    pending.append(answer)
+                answers.put_nowait(answer)
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            # reset by the peer, a line over the stream limit or shutdown
+            pass
+        finally:
+            answers.put_nowait(None)
+            try:
+                await sender
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            writer.close()
+            self.connections -= 1
+
+    async def serve(self, address: str, ready=None, allow_remote=False):
+        # there is no authentication: TCP addresses off the loopback interface
+        # are refused unless allow_remote is set
+        kind, *where = parse_address(address)
+        if not allow_remote and not is_local(address):
+            raise ValueError(f"Refusing to serve on '{address}', which is not a loopback address")
+        if kind == "unix" and os.path.lexists(where[0]):
+            if not _is_socket(where[0]):
+                raise ValueError(f"Refusing to serve on '{where[0]}': the file exists and is not a socket")
+            # left behind by an earlier server
+            os.remove(where[0])
+        self.writes = asyncio.Queue()
+        writer_task = asyncio.create_task(self._writer())
+        if kind == "unix":
+            server = await asyncio.start_unix_server(self.handle, where[0])
+        else:
+            server = await asyncio.start_server(self.handle, *where)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            if kind == "unix" and _is_socket(where[0]):
+                os.remove(where[0])
+
+
+def serve(address, address_book, notebook, storage=None, allow_remote=False):
+    server = BookServer(address_book, notebook, storage)
+    try:
+        asyncio.run(server.serve(address, ready=lambda _: print(f"Serving the address book on {address}"),
+                                 allow_remote=allow_remote))
+    except KeyboardInterrupt:
+        pass
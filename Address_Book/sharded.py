@@ -0,0 +1,152 @@
+import heapq
+import os
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import date
+
+from Address_Book import codec
+from Address_Book.classes import AddressBook, NoteBook
+
+# the part of the book held by a worker process
+_shard = None
+
+
+def _load(path):
+    global _shard
+    _shard = AddressBook()
+    codec.read_into(path, _shard, NoteBook())
+
+
+def _ready():
+    return len(_shard)
+
+
+def _put(key, blob):
+    _, record, _ = codec.decode_record(blob, 0)
+    _shard[key] = record
+
+
+def _delete(key):
+    _shard.pop(key, None)
+
+
+def _contains(index, query):
+    return list(getattr(_shard, index).contains(query))
+
+
+def _similar(query, max_distance, limit):
+    # the shard's own best `limit`: its records keep the relative order they
+    # have in the whole book, so the best of the book are among these
+    found = _shard.fuzzy_index.similar(query, max_distance, limit)
+    return heapq.nsmallest(limit, found, key=lambda item: (item[0], _shard._order[item[1]]))
+
+
+def _within(today, days):
+    return _shard.birthday_index.within(today, days)
+
+
+def _lookup(field, operator, args, today):
+    return [record._key for record in _shard._lookup(field, operator, args, today)]
+
+
+def shard_of(key: str, shards: int) -> int:
+    # stable across processes and runs, unlike hash()
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class ShardedAddressBook:
+    # Searches a big book on several cores: records are split by a hash of
+    # their key between worker processes, each with its own indexes, and a
+    # query goes to all of them at once. The workers return keys only; the
+    # records come from the book in this process, sorted by its insertion
+    # order, so the results are the same as the book's own. Changes made
+    # to the book are forwarded to the shard that owns the record. The book
+    # drops its own indexes, which the shards replace, so queries must go
+    # through this object rather than the book.
+    def __init__(self, book: AddressBook, shards: int = None):
+        self.book = book
+        self.shards = shards or os.cpu_count() or 1
+        self._executors = []
+        with tempfile.TemporaryDirectory() as workdir:
+            keys = [[] for _ in range(self.shards)]
+            for key in book.data:
+                keys[shard_of(key, self.shards)].append(key)
+            for n, part in enumerate(keys):
+                path = os.path.join(workdir, f"shard{n}.bin")
+                with open(path, "wb") as file:
+                    codec.dump(file, ((key, book.data[key]) for key in part))
+                self._executors.append(ProcessPoolExecutor(1, initializer=_load, initargs=(path,)))
+            # the shards load their files and build their indexes in parallel
+            wait([executor.submit(_ready) for executor in self._executors])
+        book._drop_indexes()
+        book.subscribe(self._on_event)
+
+    def _on_event(self, event, key, record=None):
+        executor = self._executors[shard_of(key, self.shards)]
+        if event == "put":
+            blob = bytearray()
+            codec.encode_record(blob, key, record)
+            executor.submit(_put, key, bytes(blob))
+        elif event == "delete":
+            executor.submit(_delete, key)
+
+    def _gather(self, function, *args):
+        # one call per shard; each shard runs its calls in order, so a query
+        # sees every change submitted before it
+        futures = [executor.submit(function, *args) for executor in self._executors]
+        return [future.result() for future in futures]
+
+    def search_by_name(self, name_query):
+        return self.book._ordered(key for part in self._gather(_contains, "name_index", name_query) for key in part)
+
+    def search_by_phone(self, phone_query):
+        return self.book._ordered(key for part in self._gather(_contains, "phone_index", phone_query) for key in part)
+
+    def search_by_name_fuzzy(self, name_query, max_distance=2, limit=10):
+        found = [item for part in self._gather(_similar, name_query, max_distance, limit) for item in part]
+        nearest = heapq.nsmallest(limit, found, key=lambda item: (item[0], self.book._order[item[1]]))
+        return [self.book[key] for _, key in nearest]
+
+    def birthdays_within(self, days, today=None):
+        found = [item for part in self._gather(_within, today or date.today(), days) for item in part]
+        found.sort(key=lambda item: (item[0], self.book._order[item[1]]))
+        return [(when, self.book.data[key]) for when, key in found]
+
+    def _lookup(self, field, operator, args, today):
+        return [self.book.data[key] for part in self._gather(_lookup, field, operator, args, today) for key in part]
+
+    # built on birthdays_within and _lookup
+    birthdays_on = AddressBook.birthdays_on
+    upcoming_birthdays = AddressBook.upcoming_birthdays
+    query = AddressBook.query
+    search_records = AddressBook.search_records
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown(cancel_futures=True)
+        self._executors = []
+
+    def __getattr__(self, name):
+        return getattr(self.book, name)
+
+    def __getitem__(self, key):
+        return self.book[key]
+
+    def __contains__(self, key):
+        return key in self.book
+
+    def __setitem__(self, key, record):
+        self.book[key] = record
+
+    def __delitem__(self, key):
+        del self.book[key]
+
+    def __iter__(self):
+        return iter(self.book)
+
+    def __len__(self):
+        return len(self.book)
+
+    def __str__(self):
+        return str(self.book)
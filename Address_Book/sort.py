@@ -1,3 +1,10 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
 
 CATEGORIES = {
@@ -5,49 +12,365 @@ CATEGORIES = {
     "Documents": [".docx", ".doc", ".txt", ".pdf", ".xls", ".xlsx", ".pptx", ".rtf"],
     "Video": [".avi", ".mp4", ".mov", ".mkv", ".mpeg"],
     "Image": [".jpeg", ".png", ".pcd", ".jpg", ".svg", ".tiff", ".raw", ".gif", ".bmp"],
-    "Archive": [".zip", ".7-zip", ".7zip", ".rar", ".gz", ".tar"],
+    "Archive": [".zip", ".7-zip", ".7zip", ".rar", ".gz", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"],
     "Book": [".fb2", ".mobi"]
 }
 
+# leading bytes of common formats, checked only for files without a known suffix
+SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", "Image"),
+    (0, b"\xff\xd8\xff", "Image"),
+    (0, b"GIF8", "Image"),
+    (0, b"%PDF", "Documents"),
+    (0, b"{\\rtf", "Documents"),
+    (0, b"PK\x03\x04", "Archive"),
+    (0, b"Rar!", "Archive"),
+    (0, b"7z\xbc\xaf\x27\x1c", "Archive"),
+    (0, b"\x1f\x8b", "Archive"),
+    (257, b"ustar", "Archive"),
+    (0, b"ID3", "Audio"),
+    (0, b"fLaC", "Audio"),
+    (0, b"OggS", "Audio"),
+    (8, b"WAVE", "Audio"),
+    (8, b"AVI ", "Video"),
+    (4, b"ftyp", "Video"),
+    (0, b"\x1a\x45\xdf\xa3", "Video"),
+]
+SNIFF_SIZE = max(offset + len(magic) for offset, magic, _ in SIGNATURES)
+
+
+class Classifier:
+    # Built once from a category mapping: every suffix, including multi-part
+    # ones like ".tar.gz", points straight at its category.
+    def __init__(self, categories: dict = None, default: str = "Other", sniff: bool = False):
+        self.categories = CATEGORIES if categories is None else categories
+        self.default = default
+        self.sniff = sniff
+        self.by_suffix = {}
+        for cat, exts in self.categories.items():
+            for ext in exts:
+                self.by_suffix.setdefault("." + ext.lower().lstrip("."), cat)
+        self.max_parts = max((ext.count(".") for ext in self.by_suffix), default=1)
+
+    @classmethod
+    def from_file(cls, path: str, sniff: bool = False) -> "Classifier":
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(json.load(file), sniff=sniff)
+
+    @property
+    def names(self) -> list:
+        return [*self.categories, self.default]
+
+    def suffix(self, name: str) -> str:
+        # the longest known suffix the name ends with, spelled as in the
+        # name, or "" if there is none; only the suffix is lowercased, as
+        # lowercasing can change the length of a string ("İ" becomes two
+        # characters)
+        parts = name.lstrip(".").rsplit(".", self.max_parts)
+        for i in range(1, len(parts)):
+            suffix = "." + ".".join(parts[i:])
+            if suffix.lower() in self.by_suffix:
+                return suffix
+        return ""
+
+    def classify(self, file: Path) -> str:
+        suffix = self.suffix(file.name)
+        if suffix:
+            return self.by_suffix[suffix.lower()]
+        if self.sniff:
+            return self.sniff_content(file)
+        return self.default
+
+    def sniff_content(self, file: Path) -> str:
+        try:
+            with open(file, "rb") as f:
+                head = f.read(SNIFF_SIZE)
+        except OSError:
+            return self.default
+        for offset, magic, cat in SIGNATURES:
+            if head[offset:offset + len(magic)] == magic and cat in self.categories:
+                return cat
+        return self.default
+
+
+DEFAULT_CLASSIFIER = Classifier()
+
 
 def get_category(file: Path) -> str:
-    ext = file.suffix.lower()
-    for cat, exts in CATEGORIES.items():
-        if ext in exts:
-            return cat
-    return "Other"
-
-
-def move_file(file: Path, root_dir: Path, category: str) -> None:
-    target_dir = root_dir.joinpath(category)
-    if not target_dir.exists():
-        target_dir.mkdir(parents=True)
-    new_name = target_dir.joinpath(file.name)
-    file.rename(new_name)
-
-
-def delete_empty_folders(path: Path) -> None:
-    for folder in list(path.glob("**/*"))[::-1]:
-        if folder.is_dir() and not any(folder.iterdir()):
-            is_category_folder = any(cat in CATEGORIES.keys() for cat in folder.name)
-            if not is_category_folder:
+    return DEFAULT_CLASSIFIER.classify(file)
+
+
+def scan_tree(root: Path, skip=()):
+    # Yields (True, file) for files and (False, folder) for folders, every
+    # folder after everything below it. Each folder is listed once with
+    # os.scandir, so moves made meanwhile do not disturb the listing, and in
+    # name order, so the walk is the same on every run.
+    stack = [(root, False)]
+    while stack:
+        folder, listed = stack.pop()
+        if listed:
+            yield False, folder
+            continue
+        stack.append((folder, True))
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subfolders = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if Path(entry.path) not in skip:
+                    subfolders.append((Path(entry.path), False))
+            elif entry.is_file():
+                yield True, Path(entry.path)
+        stack.extend(reversed(subfolders))
+
+
+class SortReport:
+    def __init__(self, root: Path, dry_run: bool = False):
+        self.root = root
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.moved = 0
+        self.in_place = 0
+        self.renamed = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.removed_folders = 0
+        self.categories = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def count(self, field: str, category: str = None) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            if category is not None:
+                self.categories[category] = self.categories.get(category, 0) + 1
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        return self.scanned / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        action = "Would move" if self.dry_run else "Moved"
+        by_category = ", ".join(f"{cat}: {n}" for cat, n in sorted(self.categories.items()))
+        return (f"{action} {self.moved} of {self.scanned} files in {self.elapsed:.2f}s"
+                f" ({self.throughput:.0f} files/s); already sorted: {self.in_place};"
+                f" renamed on collision: {self.renamed}; duplicates collapsed: {self.duplicates};"
+                f" errors: {self.errors}; removed folders: {self.removed_folders}."
+                + (f"\n{by_category}" if by_category else ""))
+
+
+def unique_name(taken: set, name: str, suffix: str = None) -> str:
+    # "photo.jpg", "photo (1).jpg", "photo (2).jpg", ...; the counter goes
+    # before `suffix` (by default the last one), so "arc.tar.gz" gives
+    # "arc (1).tar.gz" when the suffix is ".tar.gz". `taken` holds casefolded
+    # names: "Photo.JPG" and "photo.jpg" are one file on the case-insensitive
+    # file systems of Windows and macOS.
+    if name.casefold() not in taken:
+        taken.add(name.casefold())
+        return name
+    if suffix is None:
+        suffix = Path(name).suffix
+    stem = name[:len(name) - len(suffix)]
+    n = 1
+    while f"{stem} ({n}){suffix}".casefold() in taken:
+        n += 1
+    name = f"{stem} ({n}){suffix}"
+    taken.add(name.casefold())
+    return name
+
+
+def move_no_replace(file: Path, new_path: Path) -> None:
+    # Unlike rename, a hard link never replaces a file already at the new
+    # path. Where hard links are not supported, the path is checked just
+    # before renaming instead.
+    try:
+        os.link(file, new_path, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.lexists(new_path):
+            raise FileExistsError(f"'{new_path}' already exists")
+        file.rename(new_path)
+    else:
+        file.unlink()
+
+
+def file_digest(file: Path, chunk_size: int = 1 << 20):
+    digest = hashlib.blake2b()
+    try:
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def find_duplicates(files: list, workers: int = 8) -> dict:
+    # Maps every duplicate to the first file (in the given order) with the same
+    # content. Only files sharing a size with another file are hashed.
+    order = {file: position for position, file in enumerate(files)}
+    by_size = {}
+    for file in files:
+        try:
+            size = file.stat().st_size
+        except OSError:
+            continue
+        if size:
+            by_size.setdefault(size, []).append(file)
+    candidates = [(size, file) for size, group in by_size.items() if len(group) > 1 for file in group]
+    candidates.sort(key=lambda candidate: order[candidate[1]])
+
+    originals = {}
+    duplicates = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = pool.map(file_digest, [file for _, file in candidates])
+        for (size, file), digest in zip(candidates, digests):
+            if digest is None:
+                continue
+            original = originals.setdefault((size, digest), file)
+            if original is not file:
+                duplicates[file] = original
+    return duplicates
+
+
+def category_folder(root: Path, category: str) -> Path:
+    # the folder for a category; when a file already has its name,
+    # "Image (1)", "Image (2)", ... instead
+    target = root.joinpath(category)
+    n = 1
+    while target.exists() and not target.is_dir():
+        target = root.joinpath(f"{category} ({n})")
+        n += 1
+    return target
+
+
+def sort_tree(root: Path, workers: int = 8, dry_run: bool = False, classifier: Classifier = None,
+              dedup: str = None, progress=None, progress_every: int = 10000) -> SortReport:
+    # dedup: None keeps duplicates, "remove" deletes them and "link" replaces
+    # them with hard links to the copy that is kept. progress(report) is
+    # called after every `progress_every` files.
+    classifier = classifier or DEFAULT_CLASSIFIER
+    report = SortReport(root, dry_run)
+    targets = {category: category_folder(root, category) for category in classifier.names}
+    if not dry_run:
+        for target in targets.values():
+            target.mkdir(exist_ok=True)
+    taken = {target: {name.casefold() for name in os.listdir(target)} if target.is_dir() else set()
+             for target in targets.values()}
+
+    def move(file: Path, new_path: Path, category: str) -> None:
+        try:
+            move_no_replace(file, new_path)
+        except OSError:
+            report.count("errors")
+        else:
+            report.count("moved", category)
+
+    def remove(file: Path) -> None:
+        try:
+            file.unlink()
+        except OSError:
+            report.count("errors")
+
+    # Category folders are walked first, so files moved into them later are
+    # not seen a second time, and a copy that is already sorted is the one
+    # kept when duplicates are collapsed.
+    existing = [target for target in targets.values() if target.is_dir()]
+    walk = chain(*(scan_tree(target) for target in existing), scan_tree(root, skip=set(existing)))
+
+    folders = []
+
+    def files():
+        for is_file, item in walk:
+            if is_file:
+                yield item
+            else:
+                folders.append(item)
+
+    entries = files()
+    duplicates = {}
+    if dedup:
+        entries = list(entries)
+        duplicates = find_duplicates(entries, workers)
+
+    def suffix_of(file: Path) -> str:
+        return classifier.suffix(file.name) or file.suffix
+
+    final = {}
+    links = []
+    slots = threading.BoundedSemaphore(workers * 64)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in entries:
+            report.scanned += 1
+            if progress is not None and report.scanned % progress_every == 0:
+                progress(report)
+            category = classifier.classify(item)
+            target = targets[category]
+            if item in duplicates:
+                report.duplicates += 1
+                if dedup == "link":
+                    new_path = target.joinpath(unique_name(taken[target], item.name, suffix_of(item)))
+                    links.append((item, duplicates[item], new_path))
+                elif not dry_run:
+                    pool.submit(remove, item)
+                continue
+            if item.parent == target:
+                report.in_place += 1
+                final[item] = item
+                continue
+            name = unique_name(taken[target], item.name, suffix_of(item))
+            if name != item.name:
+                report.renamed += 1
+            new_path = target.joinpath(name)
+            if dedup:
+                final[item] = new_path
+            if dry_run:
+                report.count("moved", category)
+            else:
+                slots.acquire()
+                future = pool.submit(move, item, new_path, category)
+                future.add_done_callback(lambda _: slots.release())
+
+    # hard links are made once the kept copies have reached their places
+    for item, original, new_path in links:
+        if dry_run:
+            continue
+        try:
+            os.link(final[original], new_path)
+            item.unlink()
+        except OSError:
+            report.count("errors")
+
+    if not dry_run:
+        # folders come deepest first; a folder that is not empty refuses rmdir
+        for folder in folders:
+            if folder == root and root.name == "":
+                continue
+            try:
                 folder.rmdir()
+            except OSError:
+                continue
+            report.removed_folders += 1
 
-    if path.name != "" and not any(path.iterdir()):
-        path.rmdir()
+    report.elapsed = time.perf_counter() - report.started
+    return report
 
 
-def sort_folder(folder_path: str) -> str:
+def sort_folder(folder_path: str, dry_run: bool = False, classifier: Classifier = None,
+                dedup: str = None, progress=None) -> str:
     path = Path(folder_path)
-    
+
     if not path.exists():
         return f"Folder with path {path} doesn't exist."
-    
-    for item in path.glob("**/*"):
-        if item.is_file():
-            category = get_category(item)
-            move_file(item, path, category)
-
-    delete_empty_folders(path)
-    
-    return f"Sorting and Cleaning Completed in folder: {path}"
+
+    report = sort_tree(path, workers=min(32, (os.cpu_count() or 1) * 4), dry_run=dry_run,
+                       classifier=classifier, dedup=dedup, progress=progress)
+    if dry_run:
+        return f"Dry run for folder: {path}\n{report}"
+    return f"Sorting and Cleaning Completed in folder: {path}\n{report}"
@@ -0,0 +1,466 @@
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from datetime import date
+from weakref import WeakValueDictionary
+
+from Address_Book import paging, validation
+from Address_Book.birthdays import calendar_segments, occurrence
+from Address_Book.classes import AddressBook, Note, NoteBook, Record
+from Address_Book.indexes import GRAM_SIZE, grams, only_digits
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    birthday TEXT,
+    birth_month INTEGER,
+    birth_day INTEGER,
+    address TEXT,
+    email TEXT,
+    email_domain TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_name ON contacts (name_lower);
+CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts (birth_month, birth_day);
+CREATE INDEX IF NOT EXISTS contacts_email_domain ON contacts (email_domain);
+
+CREATE TABLE IF NOT EXISTS phones (
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL,
+    phone_lower TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_contact ON phones (contact_id, position);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone_lower);
+
+CREATE TABLE IF NOT EXISTS name_grams (
+    gram TEXT NOT NULL,
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    PRIMARY KEY (gram, contact_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS name_grams_contact ON name_grams (contact_id);
+
+CREATE TABLE IF NOT EXISTS phone_grams (
+    gram TEXT NOT NULL,
+    contact_id INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    PRIMARY KEY (gram, contact_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS phone_grams_contact ON phone_grams (contact_id);
+
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    text_lower TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_text ON notes (text);
+
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag TEXT,
+    PRIMARY KEY (note_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag, note_id);
+"""
+
+CONTACT_COLUMNS = "c.id, c.key, c.name, c.birthday, c.address, c.email"
+
+# what a page cursor (paging.pages) remembers in each order
+POSITION_COLUMNS = {
+    "insertion": ("c.id",),
+    "name": ("c.name_lower", "c.id"),
+    "birthday": (f"COALESCE(c.birth_month, {paging.NO_BIRTHDAY})", "COALESCE(c.birth_day, 0)", "c.id"),
+}
+
+
+def connect(path):
+    # the book may be shared between threads (see concurrency.py); SQLite
+    # itself serializes the calls
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _birth_month_day(value):
+    born = validation.parse_birthday(value)
+    if born is None:
+        return None, None
+    return born.month, born.day
+
+
+def _gram_filter(column_table, query):
+    # SQL that narrows contacts to those holding every trigram of the query
+    if len(query) <= GRAM_SIZE:
+        return f"SELECT contact_id FROM {column_table} WHERE gram = ?", [query]
+    parts = [query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)]
+    sql = " INTERSECT ".join(f"SELECT contact_id FROM {column_table} WHERE gram = ?" for _ in parts)
+    return sql, parts
+
+
+class SqliteRecords(MutableMapping):
+    # Mapping view over the contacts table. Records are built on first access
+    # and shared while something still holds them, so edits made through a
+    # returned Record reach the same object the book writes back.
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = WeakValueDictionary()
+
+    def hydrate(self, rows):
+        rows = list(rows)
+        missing = [row[0] for row in rows if row[1] not in self.cache]
+        phones = {}
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            marks = ", ".join("?" * len(chunk))
+            for contact_id, phone in self.connection.execute(
+                    f"SELECT contact_id, phone FROM phones WHERE contact_id IN ({marks})"
+                    f" ORDER BY contact_id, position", chunk):
+                phones.setdefault(contact_id, []).append(phone)
+        records = []
+        for contact_id, key, name, birthday, address, email in rows:
+            record = self.cache.get(key)
+            if record is None:
+                record = Record.from_dict({
+                    'name': name,
+                    'phones': phones.get(contact_id, []),
+                    'birthday': birthday,
+                    'address': address,
+                    'email': email,
+                })
+                self.cache[key] = record
+            records.append(record)
+        return records
+
+    def __getitem__(self, key):
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+        rows = self.connection.execute(
+            f"SELECT {CONTACT_COLUMNS} FROM contacts c WHERE c.key = ?", (key,)).fetchall()
+        if not rows:
+            raise KeyError(key)
+        return self.hydrate(rows)[0]
+
+    def __setitem__(self, key, record):
+        data = record.to_dict()
+        month, day = _birth_month_day(data['birthday'])
+        email_domain = data['email'].rpartition("@")[2].lower() if data['email'] else None
+        self.connection.execute(
+            "INSERT INTO contacts (key, name, name_lower, birthday, birth_month, birth_day, address, email,"
+            " email_domain) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET name = excluded.name, name_lower = excluded.name_lower,"
+            " birthday = excluded.birthday, birth_month = excluded.birth_month, birth_day = excluded.birth_day,"
+            " address = excluded.address, email = excluded.email, email_domain = excluded.email_domain",
+            (key, data['name'], data['name'].lower(), data['birthday'], month, day,
+             data['address'], data['email'], email_domain))
+        (contact_id,) = self.connection.execute("SELECT id FROM contacts WHERE key = ?", (key,)).fetchone()
+        for table in ("phones", "name_grams", "phone_grams"):
+            self.connection.execute(f"DELETE FROM {table} WHERE contact_id = ?", (contact_id,))
+        self.connection.executemany(
+            "INSERT INTO phones (contact_id, position, phone, phone_lower) VALUES (?, ?, ?, ?)",
+            [(contact_id, position, phone, phone.lower()) for position, phone in enumerate(data['phones'])])
+        self.connection.executemany(
+            "INSERT INTO name_grams (gram, contact_id) VALUES (?, ?)",
+            [(gram, contact_id) for gram in grams(data['name'].lower())])
+        phone_grams = set()
+        for phone in data['phones']:
+            phone_grams |= grams(only_digits(phone))
+        self.connection.executemany(
+            "INSERT INTO phone_grams (gram, contact_id) VALUES (?, ?)",
+            [(gram, contact_id) for gram in phone_grams])
+        self.cache[key] = record
+
+    def __delitem__(self, key):
+        cursor = self.connection.execute("DELETE FROM contacts WHERE key = ?", (key,))
+        if not cursor.rowcount:
+            raise KeyError(key)
+        self.cache.pop(key, None)
+
+    def __contains__(self, key):
+        return self.connection.execute("SELECT 1 FROM contacts WHERE key = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        for (key,) in self.connection.execute("SELECT key FROM contacts ORDER BY id").fetchall():
+            yield key
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+    def clear(self):
+        self.connection.execute("DELETE FROM contacts")
+        self.cache.clear()
+
+
+class SqliteAddressBook(AddressBook):
+    # Only the fuzzy name index is kept in memory, built on the first fuzzy
+    # search; _order then holds the row order of the contacts.
+    def __init__(self, connection):
+        self.connection = connection
+        super().__init__()
+        self.data = SqliteRecords(connection)
+        self._fuzzy_built = False
+        self._fuzzy_building = threading.Lock()
+
+    def __setitem__(self, key, record):
+        old = self.data.cache.get(key)
+        if old is not None and old is not record:
+            self._detach(old)
+        record._book = self
+        record._key = key
+        self.data[key] = record
+        self._fuzzy_add(key, record)
+        self._notify("put", key, record)
+
+    def __delitem__(self, key):
+        record = self.data.cache.get(key)
+        del self.data[key]
+        if record is not None:
+            self._detach(record)
+        if self._fuzzy_built:
+            self.fuzzy_index.remove(key)
+            self.key_ids.free(key)
+            del self._order[key]
+        self._notify("delete", key)
+
+    def _fuzzy_add(self, key, record):
+        if self._fuzzy_built:
+            if key not in self._order:
+                self._order[key] = self._next_order
+                self._next_order += 1
+            self.fuzzy_index.add(key, str(record.name))
+
+    def __getitem__(self, key):
+        record = self.data[key]
+        record._book = self
+        record._key = key
+        return record
+
+    def _select(self, where="", params=(), tail=""):
+        sql = f"SELECT {CONTACT_COLUMNS} FROM contacts c {where} ORDER BY c.id {tail}"
+        return self._records(self.connection.execute(sql, params).fetchall())
+
+    def _records(self, rows):
+        records = self.data.hydrate(rows)
+        for (_, key, *_), record in zip(rows, records):
+            record._book = self
+            record._key = key
+        return records
+
+    def _record_changed(self, record):
+        if record._key in self.data.cache and self.data.cache[record._key] is record:
+            self.data[record._key] = record
+            self._fuzzy_add(record._key, record)
+            self._notify("put", record._key, record)
+
+    def clear(self):
+        for record in list(self.data.cache.values()):
+            self._detach(record)
+        self.data.clear()
+        self.fuzzy_index.clear()
+        self.key_ids.clear()
+        self._order = {}
+
+    def values(self):
+        return self._select()
+
+    def items(self):
+        return [(record._key, record) for record in self._select()]
+
+    def _lookup(self, field, operator, args, today):
+        if field == "name" and operator == "equals":
+            return self._select("WHERE c.name_lower = ?", [args[0]])
+        if field == "phone" and operator == "equals":
+            return self._select("WHERE c.id IN (SELECT contact_id FROM phones WHERE phone_lower = ?)", [args[0]])
+        if field == "domain":
+            return self._select("WHERE c.email_domain = ?", [args[0]])
+        if field == "name" and operator == "similar":
+            self._build_fuzzy()
+            return [self[key] for _, key in self.fuzzy_index.similar(args[0], args[1])]
+        if field == "birthday":
+            return [record for _, record in self.birthdays_within(args[0], args[1] or today)]
+        if field == "name":
+            return self.search_by_name(args[0])
+        return self.search_by_phone(args[0])
+
+    def _positions(self, keys):
+        # row ids of the given contacts
+        keys = list(keys)
+        positions = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ", ".join("?" * len(chunk))
+            positions.update(self.connection.execute(f"SELECT key, id FROM contacts WHERE key IN ({marks})", chunk))
+        return positions
+
+    def search_by_name(self, name_query):
+        query = name_query.lower()
+        if not query:
+            return self._select()
+        grams_sql, params = _gram_filter("name_grams", query)
+        return self._select(f"WHERE c.id IN ({grams_sql}) AND instr(c.name_lower, ?) > 0", params + [query])
+
+    def search_by_phone(self, phone_query):
+        digits = only_digits(phone_query)
+        where = "WHERE c.id IN (SELECT contact_id FROM phones WHERE instr(phone, ?) > 0"
+        params = [phone_query]
+        if digits:
+            grams_sql, gram_params = _gram_filter("phone_grams", digits)
+            where += f" AND contact_id IN ({grams_sql})"
+            params += gram_params
+        return self._select(where + ")", params)
+
+    def _build_fuzzy(self):
+        if self._fuzzy_built:
+            return
+        with self._fuzzy_building:
+            if not self._fuzzy_built:
+                for contact_id, key, name in self.connection.execute("SELECT id, key, name FROM contacts"):
+                    self._order[key] = contact_id
+                    self.fuzzy_index.add(key, name)
+                self._next_order = max(self._order.values(), default=0) + 1
+                self._fuzzy_built = True
+
+    def search_by_name_fuzzy(self, name_query, max_distance=2, limit=10):
+        self._build_fuzzy()
+        return super().search_by_name_fuzzy(name_query, max_distance, limit)
+
+    def birthdays_within(self, days, today=None):
+        found = []
+        for year, lower, upper in calendar_segments(today or date.today(), days):
+            for record in self._select("WHERE (c.birth_month, c.birth_day) BETWEEN (?, ?) AND (?, ?)",
+                                       (*lower, *upper)):
+                born = record.birth_date()
+                found.append((occurrence(year, born.month, born.day), record))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def iterator(self, batch_size, page_number):
+        return self._select(tail="LIMIT ? OFFSET ?", params=(batch_size, page_number * batch_size))
+
+    def _fetch_page(self, order, lower, upper, after, count):
+        columns = POSITION_COLUMNS[order]
+        clauses, params = [], []
+        for bound, operator in ((lower, ">="), (upper, "<"), (after, ">")):
+            if bound is not None:
+                clauses.append(f"({', '.join(columns[:len(bound)])}) {operator} ({', '.join('?' * len(bound))})")
+                params += bound
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        listed = ", ".join(columns)
+        rows = self.connection.execute(
+            f"SELECT {CONTACT_COLUMNS}, {listed} FROM contacts c {where} ORDER BY {listed} LIMIT ?",
+            (*params, count)).fetchall()
+        width = len(columns)
+        records = self._records([row[:-width] for row in rows])
+        return [(row[-width:], record) for row, record in zip(rows, records)]
+
+    def save_to_file(self, file_path):
+        self.connection.commit()
+
+    def load_from_file(self, file_path):
+        pass
+
+    def __str__(self) -> str:
+        return "\n".join(str(r) for r in self.values())
+
+
+class SqliteNoteBook(NoteBook):
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = WeakValueDictionary()
+        self._listeners = []
+        self.version = 0
+        self.subscribe(self._write)
+
+    @property
+    def notes(self):
+        return self._select()
+
+    def _select(self, where="", params=()):
+        rows = self.connection.execute(f"SELECT n.id, n.text FROM notes n {where} ORDER BY n.id", params).fetchall()
+        missing = [note_id for note_id, _ in rows if note_id not in self.cache]
+        tags = {}
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            marks = ", ".join("?" * len(chunk))
+            for note_id, tag in self.connection.execute(
+                    f"SELECT note_id, tag FROM note_tags WHERE note_id IN ({marks}) ORDER BY note_id, position",
+                    chunk):
+                tags.setdefault(note_id, []).append(tag)
+        notes = []
+        for note_id, text in rows:
+            note = self.cache.get(note_id)
+            if note is None:
+                note = Note(text, tags.get(note_id, []))
+                note._id = note_id
+                note._notebook = self
+                self.cache[note_id] = note
+            notes.append(note)
+        return notes
+
+    def _write(self, event, note, *args):
+        if event == "add":
+            cursor = self.connection.execute(
+                "INSERT INTO notes (text, text_lower) VALUES (?, ?)", (note.text, note.text.lower()))
+            note._id = cursor.lastrowid
+            self.cache[note._id] = note
+            self.connection.executemany(
+                "INSERT INTO note_tags (note_id, position, tag) VALUES (?, ?, ?)",
+                [(note._id, position, tag) for position, tag in enumerate(note.tags)])
+        elif event == "delete":
+            self.connection.execute("DELETE FROM notes WHERE id = ?", (note._id,))
+            self.cache.pop(note._id, None)
+        elif event == "edit":
+            self.connection.execute(
+                "UPDATE notes SET text = ?, text_lower = ? WHERE id = ?", (note.text, note.text.lower(), note._id))
+        elif event == "tag":
+            self.connection.execute(
+                "INSERT INTO note_tags (note_id, position, tag) VALUES (?, ?, ?)",
+                (note._id, len(note.tags) - 1, args[0]))
+
+    def add_note(self, note):
+        note._notebook = self
+        self._notify("add", note)
+
+    def _tag_added(self, note, tag):
+        self._notify("tag", note, tag)
+
+    def get_note_by_text(self, text):
+        notes = self._select("WHERE n.id = (SELECT id FROM notes WHERE text = ? ORDER BY id LIMIT 1)", (text,))
+        return notes[0] if notes else None
+
+    def delete_note_by_text(self, text):
+        note = self.get_note_by_text(text)
+        if note is None:
+            return f"Note with text '{text}' not found."
+        note._notebook = None
+        self._notify("delete", note)
+        return f"Note with text '{text}' removed."
+
+    def edit_note(self, old_text, new_text):
+        note = self.get_note_by_text(old_text)
+        if note is None:
+            return f"Note with text '{old_text}' not found."
+        note.text = new_text
+        return f"Note updated from '{old_text}' to '{new_text}'."
+
+    def _text_changed(self, note, old_text):
+        self._notify("edit", note, old_text)
+
+    def search_notes_by_word(self, word):
+        return self._select("WHERE instr(n.text_lower, ?) > 0", (word.lower(),))
+
+    def search_notes_by_tag(self, tag):
+        return self._select("WHERE n.id IN (SELECT note_id FROM note_tags WHERE tag = ?)", (tag,))
+
+    def search_notes_by_tags(self, tags):
+        tags = list(set(tags))
+        if not tags:
+            return self._select()
+        marks = ", ".join("?" * len(tags))
+        return self._select(
+            f"WHERE n.id IN (SELECT note_id FROM note_tags WHERE tag IN ({marks})"
+            f" GROUP BY note_id HAVING COUNT(DISTINCT tag) = ?)", tags + [len(tags)])
@@ -0,0 +1,526 @@
+import json
+import os
+import pickle
+import threading
+import time
+from contextlib import nullcontext
+
+from Address_Book import codec
+from Address_Book.atomic import atomic_write
+from Address_Book.classes import AddressBook, Note, NoteBook, Record
+from Address_Book.packed import MappedAddressBook, PackedFile, PackedRecords, encode_record, write_pack
+from Address_Book.sqlite_book import SqliteAddressBook, SqliteNoteBook, connect
+
+
+class FlushPolicy:
+    # Decides when a dirty state is written. The first change after a quiet
+    # period is written at once; further changes within `interval` seconds
+    # are held back and written when the interval is over, so a burst of
+    # commands costs two writes instead of one per command. Held-back changes
+    # are written by a timer thread, which holds `lock` while writing; the
+    # code changing the book must hold the same lock. Without a lock they
+    # wait for the next change reported after the interval, or for close().
+    def __init__(self, flush, interval=1.0, lock=None):
+        self.flush = flush
+        self.interval = interval
+        self.lock = lock
+        self.pending = False
+        self._last = None
+        self._timer = None
+
+    def changed(self):
+        if self._last is not None and time.monotonic() - self._last < self.interval:
+            self.pending = True
+            if self.lock is not None and self._timer is None:
+                self._timer = threading.Timer(self._last + self.interval - time.monotonic(), self._flush_pending)
+                self._timer.daemon = True
+                self._timer.start()
+            return
+        self._write()
+
+    def _flush_pending(self):
+        with self.lock:
+            if self._timer is threading.current_thread():
+                self._timer = None
+            if self.pending:
+                self._write()
+
+    def _write(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.flush()
+        self.pending = False
+        self._last = time.monotonic()
+
+    def close(self):
+        # writes what is still pending
+        with self.lock if self.lock is not None else nullcontext():
+            self._write()
+
+
+class PickleStorage:
+    # The address book is pickled to one file and the notebook dumped as JSON
+    # to another. Each is rewritten only when its version moved since it was
+    # last written, through a temporary file so a crash never leaves half of
+    # one behind. When neither file exists yet, the book of `legacy` is
+    # imported.
+    bulk = False
+    book_class = AddressBook
+
+    def __init__(self, book_path='address_book.pkl', notes_path='notebook.txt', flush_interval=1.0, legacy=None):
+        self.book_path = book_path
+        self.notes_path = notes_path
+        self.legacy = legacy
+        self.address_book = None
+        self.notebook = None
+        self.policy = FlushPolicy(self.save, flush_interval)
+        self._saved = (None, None)
+
+    @property
+    def lock(self):
+        # held by the code changing the book; see FlushPolicy
+        return self.policy.lock
+
+    @lock.setter
+    def lock(self, lock):
+        self.policy.lock = lock
+
+    def open(self):
+        if self.legacy is not None and not os.path.exists(self.book_path) and not os.path.exists(self.notes_path):
+            return self._import_legacy()
+        notes_loaded = True
+        try:
+            with open(self.notes_path, 'r') as file:
+                self.notebook = NoteBook.from_dict(json.load(file))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.notebook = NoteBook()
+            notes_loaded = False
+            print("Failed to load the notebook. Starting with an empty notebook.")
+
+        self.address_book = self.book_class()
+        try:
+            self.address_book.load_from_file(self.book_path)
+        except pickle.UnpicklingError:
+            print("Failed to load the address book. Starting with an empty address book.")
+        # a notebook that failed to load is written on the first save, so the
+        # warning is not repeated on every start
+        self._saved = (self.address_book.version, self.notebook.version if notes_loaded else None)
+        return self.address_book, self.notebook
+
+    @property
+    def dirty(self):
+        return self._saved != (self.address_book.version, self.notebook.version)
+
+    def commit(self):
+        if self.bulk or not self.dirty:
+            return
+        self.policy.changed()
+
+    def save(self):
+        # versions are read before writing: a change made meanwhile (from
+        # another thread) leaves the state dirty for the next write
+        book_version, notes_version = self.address_book.version, self.notebook.version
+        saved_book, saved_notes = self._saved
+        if book_version != saved_book:
+            self.address_book.save_to_file(self.book_path)
+            saved_book = book_version
+        if notes_version != saved_notes:
+            with atomic_write(self.notes_path, 'w') as file:
+                json.dump(self.notebook.to_dict(), file)
+            saved_notes = notes_version
+        self._saved = (saved_book, saved_notes)
+
+    def _import_legacy(self):
+        # copies the book out of the storage used before, writes it and
+        # retires the old files, so they cannot be opened again by mistake
+        address_book, notebook = self.legacy.open()
+        self.address_book = self.book_class()
+        for key, record in address_book.items():
+            self.address_book[key] = Record.from_dict(record.to_dict())
+        self.notebook = NoteBook.from_dict(notebook.to_dict())
+        self.legacy.close()
+        self._saved = (None, None)
+        self.save()
+        self.legacy.retire()
+        return self.address_book, self.notebook
+
+    def close(self):
+        if self.address_book is None:
+            return
+        self.policy.close()
+
+    def retire(self):
+        # the files another storage imported are set aside as *.imported
+        for path in (self.book_path, self.notes_path):
+            if os.path.exists(path):
+                os.replace(path, path + '.imported')
+
+
+class BinaryStorage(PickleStorage):
+    # Contacts and notes in one file of the binary format of codec.py,
+    # rewritten as a whole when either of them changed. On the first start
+    # the book of the default storage, JournalStorage, is imported.
+    def __init__(self, path='address_book.bin', compression='zlib', legacy=None, flush_interval=1.0):
+        super().__init__(flush_interval=flush_interval)
+        self.path = path
+        self.compression = compression
+        self.legacy = legacy if legacy is not None else JournalStorage()
+
+    def open(self):
+        if not os.path.exists(self.path):
+            return self._import_legacy()
+
+        self.address_book = self.book_class()
+        self.notebook = NoteBook()
+        try:
+            codec.read_into(self.path, self.address_book, self.notebook)
+        except ValueError as error:
+            print(f"Failed to load the address book ({error}). Starting with an empty address book.")
+            self.address_book.clear()
+            self.notebook = NoteBook()
+        self._saved = (self.address_book.version, self.notebook.version)
+        return self.address_book, self.notebook
+
+    def save(self):
+        versions = (self.address_book.version, self.notebook.version)
+        if versions != self._saved:
+            codec.save(self.path, self.address_book, self.notebook, self.compression)
+            self._saved = versions
+
+
+def empty_state():
+    return {'version': 1, 'segment': 0, 'contacts': {}, 'notes': []}
+
+
+def state_from(address_book, notebook):
+    return {
+        'version': 1,
+        'segment': 0,
+        'contacts': {key: record.to_dict() for key, record in address_book.items()},
+        'notes': notebook.to_dict()['notes'],
+    }
+
+
+def _find_note(notes, note_id):
+    # by id, since several notes may have the same text
+    for note in notes:
+        if note['id'] == note_id:
+            return note
+    return None
+
+
+def _number_notes(notes):
+    # notes written before they had ids get the ones NoteBook.from_dict gives them
+    next_id = 0
+    for note in notes:
+        next_id = note.setdefault('id', next_id) + 1
+
+
+def apply_entry(state, entry):
+    op = entry['op']
+    if op == 'put':
+        state['contacts'][entry['key']] = entry['record']
+    elif op == 'del':
+        state['contacts'].pop(entry['key'], None)
+    elif op == 'note_add':
+        state['notes'].append({'id': entry['id'], 'text': entry['text'], 'tags': list(entry['tags'])})
+    elif op == 'note_del':
+        note = _find_note(state['notes'], entry['id'])
+        if note is not None:
+            state['notes'].remove(note)
+    elif op == 'note_edit':
+        note = _find_note(state['notes'], entry['id'])
+        if note is not None:
+            note['text'] = entry['text']
+    elif op == 'note_tag':
+        note = _find_note(state['notes'], entry['id'])
+        if note is not None and entry['tag'] not in note['tags']:
+            note['tags'].append(entry['tag'])
+
+
+def apply_packed_entry(state, entry):
+    # state['contacts'] is a PackedRecords; removing a record that is still
+    # only in the pack file does not decode it
+    op = entry['op']
+    if op == 'put':
+        state['contacts'][entry['key']] = Record.from_dict(entry['record'])
+    elif op == 'del':
+        state['contacts'].discard(entry['key'])
+    else:
+        apply_entry(state, entry)
+
+
+def replay(state, path, apply=apply_entry):
+    # A journal segment starts with its id; segments already folded into the
+    # snapshot are skipped, so a crash between writing the snapshot and
+    # removing the segment does not apply it twice.
+    _number_notes(state['notes'])
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            segment = None
+            for line in file:
+                if not line.endswith('\n'):
+                    # torn tail of an interrupted write
+                    break
+                entry = json.loads(line)
+                if entry['op'] == 'segment':
+                    segment = entry['id']
+                    if segment <= state.get('segment', 0):
+                        return state
+                    continue
+                apply(state, entry)
+            if segment is not None:
+                state['segment'] = segment
+    except FileNotFoundError:
+        pass
+    return state
+
+
+def read_snapshot(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return empty_state()
+
+
+def write_snapshot(state, path):
+    with atomic_write(path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False)
+
+
+class JournalStorage:
+    # Every mutation of the address book or the notebook is appended to
+    # <base>.journal as one JSON line. A background thread periodically folds
+    # a sealed journal segment into <base>.snapshot. In bulk mode nothing is
+    # synced or compacted until close().
+    bulk = False
+    book_class = AddressBook
+
+    def __init__(self, base_path='address_book', sync_every=64, sync_interval=1.0,
+                 compact_every=1000, legacy=None):
+        self.snapshot_path = base_path + '.snapshot'
+        self.journal_path = base_path + '.journal'
+        self.sealed_path = base_path + '.journal.old'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self.legacy = legacy if legacy is not None else PickleStorage()
+        self.address_book = None
+        self.notebook = None
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._entries = 0
+        self._segment = 0
+        self._compactor = None
+
+    def open(self):
+        paths = (self.snapshot_path, self.journal_path, self.sealed_path)
+        if not any(os.path.exists(path) for path in paths):
+            self.legacy.book_class = self.book_class
+            self.address_book, self.notebook = self.legacy.open()
+            state = state_from(self.address_book, self.notebook)
+            write_snapshot(state, self.snapshot_path)
+            self.legacy.retire()
+        else:
+            state = read_snapshot(self.snapshot_path)
+            replay(state, self.sealed_path)
+            replay(state, self.journal_path)
+            self.address_book, self.notebook = self._build(state)
+            if os.path.exists(self.sealed_path) or os.path.exists(self.journal_path):
+                write_snapshot(state, self.snapshot_path)
+                for path in (self.sealed_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        self._segment = state.get('segment', 0)
+        self._open_journal()
+        self.address_book.subscribe(self._on_book_event)
+        self.notebook.subscribe(self._on_note_event)
+        return self.address_book, self.notebook
+
+    def _open_journal(self):
+        self._segment += 1
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({'op': 'segment', 'id': self._segment}) + '\n')
+
+    def _build(self, state):
+        address_book = self.book_class()
+        for key, data in state['contacts'].items():
+            address_book[key] = Record.from_dict(data)
+        notebook = NoteBook.from_dict({'notes': state['notes']})
+        return address_book, notebook
+
+    def _on_book_event(self, event, key, record=None):
+        if event == 'put':
+            self.append({'op': 'put', 'key': key, 'record': record.to_dict()})
+        elif event == 'delete':
+            self.append({'op': 'del', 'key': key})
+
+    def _on_note_event(self, event, note, *args):
+        if event == 'add':
+            self.append({'op': 'note_add', 'id': note._id, 'text': note.text, 'tags': list(note.tags)})
+        elif event == 'delete':
+            self.append({'op': 'note_del', 'id': note._id})
+        elif event == 'edit':
+            self.append({'op': 'note_edit', 'id': note._id, 'text': note.text})
+        elif event == 'tag':
+            self.append({'op': 'note_tag', 'id': note._id, 'tag': args[0]})
+
+    def append(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._unsynced += 1
+        self._entries += 1
+        if self.bulk:
+            return
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        if self._entries >= self.compact_every:
+            self.compact()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def commit(self):
+        if self.bulk or not self._unsynced:
+            return
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def compact(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        if os.path.exists(self.sealed_path):
+            # the last fold failed; sealing the journal now would overwrite
+            # the segment it left behind
+            self._entries = 0
+            try:
+                self._fold_sealed()
+            except OSError:
+                return
+        self.sync()
+        self._file.close()
+        os.replace(self.journal_path, self.sealed_path)
+        self._open_journal()
+        self._entries = 0
+        self._compactor = threading.Thread(target=self._fold_sealed, daemon=True)
+        self._compactor.start()
+
+    def _fold_sealed(self):
+        state = replay(read_snapshot(self.snapshot_path), self.sealed_path)
+        write_snapshot(state, self.snapshot_path)
+        os.remove(self.sealed_path)
+
+    def close(self):
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def retire(self):
+        # after another storage imported the data: renamed, so opening this
+        # storage again does not bring back the state as it was then
+        for path in (self.snapshot_path, self.journal_path, self.sealed_path):
+            if os.path.exists(path):
+                os.replace(path, path + '.imported')
+
+
+class PackedStorage(JournalStorage):
+    # Contacts and notes are kept in <base>.pack, which is memory-mapped and
+    # read record by record, plus the journal of changes made since it was
+    # written. Folding the journal copies unchanged records into the new pack
+    # byte for byte.
+    def __init__(self, base_path='address_book', legacy=None, **kwargs):
+        super().__init__(base_path, legacy=legacy if legacy is not None else JournalStorage(base_path), **kwargs)
+        self.pack_path = base_path + '.pack'
+        self.journal_path = base_path + '.pack.journal'
+        self.sealed_path = base_path + '.pack.journal.old'
+
+    def open(self):
+        if not os.path.exists(self.pack_path):
+            address_book, notebook = self.legacy.open()
+            write_pack(self.pack_path, ((key, encode_record(record)) for key, record in address_book.items()),
+                       notebook.to_dict()['notes'])
+            self.legacy.close()
+            self.legacy.retire()
+        if os.path.exists(self.sealed_path):
+            # an interrupted fold
+            self._fold_sealed()
+
+        pack = PackedFile(self.pack_path)
+        self.address_book = MappedAddressBook(pack)
+        state = {'segment': pack.segment, 'contacts': self.address_book.data, 'notes': pack.notes()}
+
+        def apply(state, entry):
+            self._entries += 1
+            apply_packed_entry(state, entry)
+
+        replay(state, self.journal_path, apply)
+        self.notebook = NoteBook.from_dict({'notes': state['notes']})
+
+        self._segment = state['segment']
+        self._open_journal()
+        self.address_book.subscribe(self._on_book_event)
+        self.notebook.subscribe(self._on_note_event)
+        return self.address_book, self.notebook
+
+    def _fold_sealed(self):
+        pack = PackedFile(self.pack_path)
+        records = PackedRecords(pack)
+        state = {'segment': pack.segment, 'contacts': records, 'notes': pack.notes()}
+        replay(state, self.sealed_path, apply_packed_entry)
+        write_pack(self.pack_path, records.blobs(), state['notes'], state['segment'])
+        pack.close()
+        os.remove(self.sealed_path)
+
+
+class SqliteStorage:
+    # Contacts and notes live in one SQLite file; records are read on demand
+    # and every command is committed as one transaction.
+    bulk = False
+
+    def __init__(self, path='address_book.db', legacy=None):
+        self.path = path
+        self.legacy = legacy if legacy is not None else JournalStorage()
+        self.connection = None
+        self.address_book = None
+        self.notebook = None
+
+    def open(self):
+        is_new = not os.path.exists(self.path)
+        self.connection = connect(self.path)
+        self.address_book = SqliteAddressBook(self.connection)
+        self.notebook = SqliteNoteBook(self.connection)
+        if is_new:
+            self._import_legacy()
+        return self.address_book, self.notebook
+
+    def _import_legacy(self):
+        address_book, notebook = self.legacy.open()
+        for key, record in address_book.items():
+            self.address_book[key] = Record.from_dict(record.to_dict())
+        for note in notebook.get_notes():
+            self.notebook.add_note(Note(note.text, list(note.tags)))
+        self.legacy.close()
+        self.connection.commit()
+        self.legacy.retire()
+
+    def commit(self):
+        if not self.bulk:
+            self.connection.commit()
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
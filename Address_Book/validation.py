@@ -0,0 +1,96 @@
+import re
+from datetime import date
+
+# Pure checks for the values of contact fields. Nothing here prints or asks
+# for input. The plural functions take a column of values and return one
+# result per value, for imports and for checking a whole book at once.
+
+PHONE_PUNCTUATION = str.maketrans("", "", "() -")
+
+EMAIL = re.compile(r"(^[a-zA-Z0-9_.+-]{2,}@([a-zA-Z0-9-]{2,}\."
+                   r"[a-zA-Z0-9]+$|[a-zA-Z0-9-]{2,}\.[a-zA-Z0-9]+\.[a-zA-Z0-9]+$))")
+
+# DD.MM.YYYY, accepting exactly what datetime.strptime(value, "%d.%m.%Y") does
+BIRTHDAY = re.compile(r"(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])\.(1[0-2]|0[1-9]|[1-9])\.(\d\d\d\d)")
+
+
+def strip_phone(value: str) -> str:
+    return value.translate(PHONE_PUNCTUATION)
+
+
+def normalize_phone(value: str):
+    # Ukrainian numbers in any of the usual spellings -> "+380XXXXXXXXX",
+    # None for anything else
+    digits = value.translate(PHONE_PUNCTUATION)
+    size = len(digits)
+    if size == 13 and digits.startswith("+380"):
+        return digits
+    if size == 12 and digits.startswith("380"):
+        return "+" + digits
+    if size == 11 and value.startswith("80"):
+        return "+3" + digits
+    if size == 10 and digits.startswith("0"):
+        return "+38" + digits
+    return None
+
+
+def normalize_phones(values) -> list:
+    return [normalize_phone(value) for value in values]
+
+
+def is_valid_email(value: str) -> bool:
+    return EMAIL.match(value) is not None
+
+
+def validate_emails(values) -> list:
+    match = EMAIL.match
+    return [match(value) is not None for value in values]
+
+
+def parse_birthday(value):
+    # date for a valid DD.MM.YYYY value, None otherwise
+    if not isinstance(value, str):
+        return None
+    found = BIRTHDAY.fullmatch(value)
+    if found is None:
+        return None
+    day, month, year = found.groups()
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def parse_birthdays(values) -> list:
+    return [parse_birthday(value) for value in values]
+
+
+def is_valid_birthday(value: str) -> bool:
+    return parse_birthday(value) is not None
+
+
+def format_birthday(born: date) -> str:
+    return f"{born.day:02d}.{born.month:02d}.{born.year:04d}"
+
+
+def find_invalid(rows) -> list:
+    # rows: (key, Record.to_dict()) pairs; returns (key, reason) for every
+    # contact with a value that does not pass its check
+    rows = list(rows)
+    phones = [(key, phone) for key, data in rows for phone in data["phones"]]
+    emails = [(key, data["email"]) for key, data in rows if data["email"]]
+    birthdays = [(key, data["birthday"]) for key, data in rows if data["birthday"]]
+
+    problems = []
+    for (key, phone), normal in zip(phones, normalize_phones(phone for _, phone in phones)):
+        if normal is None:
+            problems.append((key, f"invalid phone number '{phone}'"))
+    for (key, email), valid in zip(emails, validate_emails(email for _, email in emails)):
+        if not valid:
+            problems.append((key, f"invalid e-mail address '{email}'"))
+    for (key, birthday), born in zip(birthdays, parse_birthdays(birthday for _, birthday in birthdays)):
+        if born is None:
+            problems.append((key, f"invalid birthday '{birthday}'"))
+    order = {key: position for position, (key, _) in enumerate(rows)}
+    problems.sort(key=lambda problem: order[problem[0]])
+    return problems
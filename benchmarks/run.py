@@ -0,0 +1,363 @@
+"""Benchmarks for the Address_Book package.
+
+Each benchmark runs at every requested scale (number of contacts and notes)
+on seeded synthetic data and reports latency percentiles, throughput and
+the peak memory allocated while it runs. Results go to a JSON file that a
+later run can be compared against:
+
+    python -m benchmarks.run --scale 1k 100k --output before.json
+    python -m benchmarks.run --scale 1k 100k --compare before.json
+
+1M contacts (--scale 1M) takes about half an hour and several GB of memory.
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from Address_Book import codec, sort
+from Address_Book.classes import AddressBook, NoteBook, Record
+from Address_Book.sharded import ShardedAddressBook
+from Address_Book.storage import read_snapshot, state_from, write_snapshot
+from benchmarks import synthetic
+
+BENCHMARKS = {}
+MEMORY_SAMPLE = 100
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+def parse_scale(text: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower()
+    if text[-1:] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(operation, inputs, setup=None) -> dict:
+    # times operation(item) for every input, then runs it again on a few of
+    # them under tracemalloc for the peak memory; setup(), if given, runs
+    # untimed before each call
+    latencies = []
+    for item in inputs:
+        if setup is not None:
+            setup()
+        start = time.perf_counter_ns()
+        operation(item)
+        latencies.append(time.perf_counter_ns() - start)
+    peak = 0
+    for item in inputs[:MEMORY_SAMPLE]:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        operation(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies) / 1e9
+    return {
+        "operations": len(latencies),
+        "seconds": round(total, 6),
+        "ops_per_second": round(len(latencies) / total, 1) if total else None,
+        "p50_us": round(percentile(latencies, 0.50) / 1e3, 1),
+        "p90_us": round(percentile(latencies, 0.90) / 1e3, 1),
+        "p99_us": round(percentile(latencies, 0.99) / 1e3, 1),
+        "max_us": round(latencies[-1] / 1e3, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+class Context:
+    # data shared by the benchmarks of one scale, built once
+    def __init__(self, scale: int, seed: int, queries: int, workdir: Path, max_files: int):
+        self.scale = scale
+        self.seed = seed
+        self.queries = queries
+        self.workdir = workdir
+        self.max_files = max_files
+        self.rng = random.Random(seed)
+        # whole-book operations run three times, once on big books
+        self.repeat = 3 if scale <= 100_000 else 1
+        self.rows = list(synthetic.contact_rows(scale, seed))
+        self.book = synthetic.build_book(AddressBook(), self.rows)
+        self.notebook = synthetic.build_notebook(synthetic.note_rows(scale, seed))
+        self._sharded = None
+
+    def sample(self, population, count=None):
+        return [self.rng.choice(population) for _ in range(count or self.queries)]
+
+    def sharded(self):
+        # a copy of the book split over one worker process per core, started
+        # once; sharding drops the indexes of the book it is given
+        if self._sharded is None:
+            self._sharded = ShardedAddressBook(synthetic.build_book(AddressBook(), self.rows))
+        return self._sharded
+
+    def close(self):
+        if self._sharded is not None:
+            self._sharded.close()
+
+
+@benchmark("build_book")
+def build_book(context):
+    return measure(lambda _: synthetic.build_book(AddressBook(), context.rows), [None] * context.repeat)
+
+
+def name_queries(context):
+    # parts of existing names, a few misses among them
+    queries = []
+    for row in context.sample(context.rows):
+        start = context.rng.randrange(max(1, len(row["name"]) - 3))
+        queries.append(row["name"][start:start + 4])
+    queries[::10] = ["Zzqx"] * len(queries[::10])
+    return queries
+
+
+def misspelled_names(context):
+    # existing names with one letter replaced
+    queries = []
+    for row in context.sample(context.rows, min(context.queries, 200)):
+        position = context.rng.randrange(len(row["name"]))
+        queries.append(row["name"][:position] + "x" + row["name"][position + 1:])
+    return queries
+
+
+@benchmark("search_by_name")
+def search_by_name(context):
+    return measure(context.book.search_by_name, name_queries(context))
+
+
+@benchmark("search_similar")
+def search_similar(context):
+    return measure(context.book.search_by_name_fuzzy, misspelled_names(context))
+
+
+# The same searches on the book split over worker processes; these gain
+# only with several cores.
+
+@benchmark("search_by_name_sharded")
+def search_by_name_sharded(context):
+    return measure(context.sharded().search_by_name, name_queries(context))
+
+
+@benchmark("search_similar_sharded")
+def search_similar_sharded(context):
+    return measure(context.sharded().search_by_name_fuzzy, misspelled_names(context))
+
+
+@benchmark("search_by_phone")
+def search_by_phone(context):
+    phones = [context.rng.choice(row["phones"]) for row in context.sample(context.rows)]
+    digits = ["".join(ch for ch in phone if ch.isdigit())[-7:] for phone in phones]
+    return measure(context.book.search_by_phone, [number[:5] for number in digits])
+
+
+@benchmark("birthdays_on")
+def birthdays_on(context):
+    # what `show birthday` runs
+    return measure(context.book.birthdays_on, context.sample(range(365)))
+
+
+@benchmark("birthdays_within_week")
+def birthdays_within_week(context):
+    return measure(lambda _: context.book.birthdays_within(7), [None] * min(context.queries, 200))
+
+
+@benchmark("search_notes_by_tags")
+def search_notes_by_tags(context):
+    queries = [context.rng.sample(synthetic.TAGS[:8], context.rng.randrange(1, 4)) for _ in range(context.queries)]
+    return measure(context.notebook.search_notes_by_tags, queries)
+
+
+@benchmark("save_to_file")
+def save_to_file(context):
+    # the pickle of PickleStorage; `bytes` is the size of the file written
+    path = context.workdir / "book.pkl"
+    result = measure(lambda _: context.book.save_to_file(path), [None] * context.repeat)
+    result["bytes"] = path.stat().st_size
+    return result
+
+
+@benchmark("load_from_file")
+def load_from_file(context):
+    path = context.workdir / "book.pkl"
+    context.book.save_to_file(path)
+    result = measure(lambda _: AddressBook().load_from_file(path), [None] * context.repeat)
+    result["bytes"] = path.stat().st_size
+    return result
+
+
+# The JSON snapshot of JournalStorage and the binary file of BinaryStorage
+# hold the notes as well as the contacts.
+
+@benchmark("save_json")
+def save_json(context):
+    path = str(context.workdir / "book.snapshot")
+    result = measure(lambda _: write_snapshot(state_from(context.book, context.notebook), path),
+                     [None] * context.repeat)
+    result["bytes"] = Path(path).stat().st_size
+    return result
+
+
+def load_snapshot(path):
+    state = read_snapshot(path)
+    book = AddressBook()
+    for key, data in state["contacts"].items():
+        book[key] = Record.from_dict(data)
+    return book, NoteBook.from_dict({"notes": state["notes"]})
+
+
+@benchmark("load_json")
+def load_json(context):
+    path = str(context.workdir / "book.snapshot")
+    write_snapshot(state_from(context.book, context.notebook), path)
+    result = measure(lambda _: load_snapshot(path), [None] * context.repeat)
+    result["bytes"] = Path(path).stat().st_size
+    return result
+
+
+def binary_benchmarks(suffix, compression):
+    def save(context):
+        path = context.workdir / f"book{suffix}.bin"
+        result = measure(lambda _: codec.save(path, context.book, context.notebook, compression),
+                         [None] * context.repeat)
+        result["bytes"] = path.stat().st_size
+        return result
+
+    def load(context):
+        path = context.workdir / f"book{suffix}.bin"
+        codec.save(path, context.book, context.notebook, compression)
+        result = measure(lambda _: codec.read_into(path, AddressBook(), NoteBook()), [None] * context.repeat)
+        result["bytes"] = path.stat().st_size
+        return result
+
+    benchmark(f"save_binary{suffix}")(save)
+    benchmark(f"load_binary{suffix}")(load)
+
+
+binary_benchmarks("", None)
+binary_benchmarks("_zlib", "zlib")
+
+
+@benchmark("sort_folder")
+def sort_folder(context):
+    # a fresh tree for every run; one file per ten contacts, at most max_files
+    files = max(10, min(context.scale // 10, context.max_files))
+    root = context.workdir / "tree"
+
+    def setup():
+        shutil.rmtree(root, ignore_errors=True)
+        synthetic.make_tree(root, files, context.seed)
+
+    result = measure(lambda _: sort.sort_folder(str(root)), [None] * context.repeat, setup=setup)
+    result["files"] = files
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, names, seed, queries, max_files) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in scales:
+            started = time.perf_counter()
+            context = Context(scale, seed, queries, Path(workdir), max_files)
+            print(f"scale {scale}: data ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for name in names:
+                result = {"benchmark": name, "scale": scale, **BENCHMARKS[name](context)}
+                results.append(result)
+                print(f"  {name:24} p50 {result['p50_us']:>12.1f}us  p99 {result['p99_us']:>12.1f}us  "
+                      f"{result['ops_per_second'] or 0:>12.1f} ops/s  peak {result['peak_kb']:>10.1f} KB",
+                      file=sys.stderr)
+            context.close()
+            del context
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "queries": queries,
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    # (benchmark, scale, old p50, new p50, change) for every benchmark present
+    # in both runs; change > threshold is a regression
+    before = {(result["benchmark"], result["scale"]): result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        previous = before.get((result["benchmark"], result["scale"]))
+        if previous is None or not previous["p50_us"]:
+            continue
+        change = result["p50_us"] / previous["p50_us"] - 1
+        rows.append((result["benchmark"], result["scale"], previous["p50_us"], result["p50_us"], change))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Address_Book package.")
+    parser.add_argument("--scale", nargs="+", default=["1k", "100k"],
+                        help="numbers of contacts and notes, e.g. 1k 100k 1M (default: 1k 100k)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, metavar="NAME",
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000, help="queries per search benchmark")
+    parser.add_argument("--max-files", type=int, default=10000, help="largest tree for sort_folder")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare median latencies with an earlier JSON run")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown of the median counted as a regression (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    report = run([parse_scale(scale) for scale in args.scale], args.only or list(BENCHMARKS),
+                 args.seed, args.queries, args.max_files)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        regressions = 0
+        for name, scale, before, after, change in compare(old, report, args.threshold):
+            regressed = change > args.threshold
+            regressions += regressed
+            print(f"{name:24} {scale:>9}  p50 {before:>12.1f} -> {after:>12.1f}us  {change:+7.1%}"
+                  f"{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Stress test for the shared (thread-safe) address book and notebook.
+
+Writer threads increment a counter kept in a contact's phone and move other
+contacts' phone and birthday together, while reader threads search by name
+and by note tags. At the end the counter must equal the number of increments
+(no lost updates), and no reader may have seen a contact whose phone and
+birthday disagree (no torn multi-field updates).
+
+    python -m benchmarks.stress_concurrency [--readers 1 2 4 8] [--unsafe]
+
+--unsafe runs the same load without locking, to show what the locks prevent.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+from Address_Book.classes import AddressBook, Birthday, Name, Note, NoteBook, Phone, Record
+from Address_Book.concurrency import SharedAddressBook, SharedNoteBook
+
+FIRST = date(1950, 1, 1)
+
+
+class NoLock:
+    read = write = staticmethod(nullcontext)
+
+
+def phone(number):
+    return f"+380{number:09d}"
+
+
+def build(contacts, notes, unsafe):
+    book = AddressBook()
+    for i in range(contacts):
+        book.add_record(Record(Name(f"Contact{i:06d}"), Phone(phone(i))))
+    book.add_record(Record(Name("Counter"), Phone(phone(0))))
+    notebook = NoteBook()
+    for i in range(notes):
+        notebook.add_note(Note(f"note {i}", [f"tag{i % 17}", f"group{i % 5}"]))
+    lock = NoLock() if unsafe else None
+    return SharedAddressBook(book, lock), SharedNoteBook(notebook, lock)
+
+
+def increment(book):
+    with book.change("Counter") as record:
+        count = int(record.phones[0].value[4:])
+        record.edit_phone(phone(count), phone(count + 1))
+
+
+def move(book, key, step):
+    # phone and birthday of a mover always carry the same step number
+    with book.change(key) as record:
+        record.edit_phone(record.phones[0].value, phone(step))
+        record.add_birthday(Birthday((FIRST + timedelta(days=step)).strftime("%d.%m.%Y")))
+
+
+def consistent(record):
+    if record.birthday is None:
+        return True
+    step = (record.birth_date() - FIRST).days
+    return record.phones[0].value == phone(step)
+
+
+def run(readers, writers, increments, contacts, notes, unsafe):
+    book, notebook = build(contacts, notes, unsafe)
+    movers = [f"Contact{i:06d}" for i in range(writers)]
+    stop = threading.Event()
+    reads = [0] * readers
+    torn = []
+    errors = []
+
+    def write(number):
+        try:
+            for step in range(increments):
+                increment(book)
+                move(book, movers[number], step)
+        except Exception as error:
+            errors.append(error)
+
+    def read(number):
+        rng = random.Random(number)
+        try:
+            while not stop.is_set():
+                with book.read():
+                    found = book.search_by_name(f"Contact{rng.randrange(contacts // 100):04d}")
+                    torn.extend(record for record in found if not consistent(record))
+                notebook.search_notes_by_tags([f"tag{rng.randrange(17)}", f"group{rng.randrange(5)}"])
+                reads[number] += 2
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads[readers:]:
+        thread.join()
+    stop.set()
+    for thread in threads[:readers]:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    counted = int(book["Counter"].phones[0].value[4:])
+    lost = writers * increments - counted
+    indexed = book["Counter"] in book.search_by_phone(phone(counted))
+    return {
+        "readers": readers, "seconds": elapsed, "reads/s": sum(reads) / elapsed,
+        "writes/s": 2 * writers * increments / elapsed,
+        "lost": lost, "torn": len(torn), "errors": len(errors), "indexed": indexed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--increments", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=20000)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--unsafe", action="store_true", help="run without locking")
+    args = parser.parse_args(argv)
+    # switch threads as often as possible so races have every chance to show
+    sys.setswitchinterval(1e-5)
+
+    failed = False
+    for readers in args.readers:
+        result = run(readers, args.writers, args.increments, args.contacts, args.notes, args.unsafe)
+        print(f"{result['readers']} readers, {args.writers} writers: {result['reads/s']:9.0f} reads/s "
+              f"{result['writes/s']:8.0f} writes/s  lost updates {result['lost']}, torn reads "
+              f"{result['torn']}, errors {result['errors']}, index {'ok' if result['indexed'] else 'STALE'}")
+        failed |= bool(result["lost"] or result["torn"] or result["errors"] or not result["indexed"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
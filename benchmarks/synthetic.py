@@ -0,0 +1,116 @@
+"""Seeded synthetic data for benchmarks: contacts, notes and file trees.
+
+The same seed always gives the same data, so results of two runs can be
+compared. Phones use every spelling of a Ukrainian mobile number that the
+validation accepts, so they exercise normalization as well.
+"""
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+from Address_Book.classes import Note, NoteBook, Record
+from Address_Book.sort import CATEGORIES
+
+FIRST_NAMES = [
+    "Oleksandr", "Andrii", "Dmytro", "Serhii", "Mykola", "Ivan", "Taras", "Yurii", "Bohdan", "Vasyl",
+    "Olena", "Iryna", "Natalia", "Oksana", "Kateryna", "Tetiana", "Yulia", "Mariia", "Sofiia", "Anna",
+    "Олександр", "Андрій", "Дмитро", "Сергій", "Микола", "Олена", "Ірина", "Наталія", "Оксана", "Катерина",
+]
+LAST_NAMES = [
+    "Melnyk", "Shevchenko", "Boiko", "Kovalenko", "Bondarenko", "Tkachenko", "Kovalchuk", "Kravchenko",
+    "Oliinyk", "Shevchuk", "Koval", "Polishchuk", "Bondar", "Tkachuk", "Moroz", "Marchenko", "Lysenko",
+    "Rudenko", "Savchenko", "Petrenko", "Мельник", "Шевченко", "Бойко", "Коваленко", "Бондаренко",
+    "Ткаченко", "Коваль", "Мороз", "Лисенко", "Петренко",
+]
+OPERATORS = ["050", "066", "095", "099", "063", "073", "093", "067", "068", "096", "097", "098", "091"]
+PHONE_FORMATS = [
+    "+38{operator}{number}",
+    "{operator}{number}",
+    "38{operator}{number}",
+    "8{operator}{number}",
+    "({operator}) {number[0]}{number[1]}{number[2]}-{number[3]}{number[4]}-{number[5]}{number[6]}",
+    "+38 {operator} {number[0]}{number[1]}{number[2]} {number[3]}{number[4]} {number[5]}{number[6]}",
+]
+DOMAINS = ["gmail.com", "ukr.net", "bigmir.net", "meta.ua", "outlook.com", "example.com.ua"]
+TAGS = ["work", "home", "shop", "idea", "todo", "family", "travel", "health", "money", "books",
+        "car", "garden", "kids", "study", "music", "sport", "friends", "urgent", "later", "gift"]
+WORDS = ["buy", "call", "meet", "send", "read", "write", "fix", "plan", "check", "pay", "milk", "bread",
+         "report", "ticket", "doctor", "garage", "school", "birthday", "project", "invoice", "flowers"]
+UNKNOWN_SUFFIXES = [".dat", ".bin", ".log", ".tmp", ""]
+FIRST_BIRTHDAY = date(1940, 1, 1)
+BIRTHDAY_SPAN = (date(2010, 12, 31) - FIRST_BIRTHDAY).days
+
+
+def phone(rng: random.Random) -> str:
+    number = f"{rng.randrange(10 ** 7):07d}"
+    return rng.choice(PHONE_FORMATS).format(operator=rng.choice(OPERATORS), number=number)
+
+
+def contact_rows(count: int, seed: int = 0):
+    # dicts in the Record.to_dict layout, names unique
+    rng = random.Random(seed)
+    taken = set()
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        name = f"{first} {last}"
+        if name in taken:
+            name = f"{first} {last} {i}"
+        taken.add(name)
+        born = FIRST_BIRTHDAY + timedelta(days=rng.randrange(BIRTHDAY_SPAN))
+        yield {
+            "name": name,
+            "phones": [phone(rng) for _ in range(rng.choice((1, 1, 1, 2, 3)))],
+            "birthday": born.strftime("%d.%m.%Y") if rng.random() < 0.8 else None,
+            "address": f"Kyiv, {rng.choice(LAST_NAMES)} st {rng.randrange(1, 200)}" if rng.random() < 0.3 else None,
+            "email": f"user{i}@{rng.choice(DOMAINS)}" if rng.random() < 0.6 else None,
+        }
+
+
+def build_book(book, rows):
+    for row in rows:
+        book[row["name"]] = Record.from_dict(row)
+    return book
+
+
+def note_rows(count: int, seed: int = 0):
+    # (text, tags) pairs; a few tags are much more common than the rest
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(TAGS) + 1)]
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(2, 8))) + f" #{i}"
+        tags = sorted(set(rng.choices(TAGS, weights, k=rng.randrange(1, 5))))
+        yield text, tags
+
+
+def build_notebook(rows, notebook=None):
+    notebook = notebook if notebook is not None else NoteBook()
+    for text, tags in rows:
+        notebook.add_note(Note(text, list(tags)))
+    return notebook
+
+
+def make_tree(root, files: int, seed: int = 0, depth: int = 3, fanout: int = 4,
+              duplicates: float = 0.1, size: int = 256) -> list:
+    # `files` small files spread over nested folders, with suffixes from all
+    # sort categories and some unknown ones; about `duplicates` of them copy
+    # the content of an earlier file
+    rng = random.Random(seed)
+    root = Path(root)
+    folders = [root]
+    for level in range(depth):
+        folders += [folder / f"dir{level}_{i}" for folder in folders[-fanout ** level:] for i in range(fanout)]
+    suffixes = [suffix for category in CATEGORIES.values() for suffix in category] + UNKNOWN_SUFFIXES
+    contents = []
+    paths = []
+    for i in range(files):
+        folder = rng.choice(folders)
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"file{i}{rng.choice(suffixes)}"
+        if contents and rng.random() < duplicates:
+            content = rng.choice(contents)
+        else:
+            content = rng.randbytes(size)
+            contents.append(content)
+        path.write_bytes(content)
+        paths.append(path)
+    return paths
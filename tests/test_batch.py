@@ -0,0 +1,37 @@
+import pytest
+
+from Address_Book import batch
+from Address_Book.classes import AddressBook, Name, NoteBook, Phone, Record
+
+
+@pytest.fixture
+def book():
+    address_book = AddressBook()
+    record = Record(Name("Ivan"))
+    record.add_phone(Phone("0501234567"))
+    record.add_phone(Phone("+380661234567"))
+    address_book.add_record(record)
+    return address_book
+
+
+def phones(book):
+    return [str(phone) for phone in book["Ivan"].phones]
+
+
+def test_change_phone_finds_any_of_the_phones(book):
+    batch.change_phone(book, NoteBook(), "Ivan", "0661234567", "0671234567")
+    assert phones(book) == ["0501234567", "+380671234567"]
+    assert book.search_by_phone("067") == [book["Ivan"]]
+
+
+def test_del_phone_matches_the_number_however_written(book):
+    batch.del_phone(book, NoteBook(), "Ivan", "+380501234567")
+    assert phones(book) == ["+380661234567"]
+
+
+@pytest.mark.parametrize("command", [batch.del_phone, batch.change_phone])
+def test_an_absent_phone_is_an_error(book, command):
+    args = ("0991234567", "0671234567")[:2 if command is batch.change_phone else 1]
+    with pytest.raises(ValueError, match="not one of contact 'Ivan'"):
+        command(book, NoteBook(), "Ivan", *args)
+    assert phones(book) == ["0501234567", "+380661234567"]
@@ -0,0 +1,98 @@
+import io
+import random
+
+import pytest
+
+from Address_Book import codec
+from Address_Book.classes import Address, AddressBook, Birthday, Email, Name, Note, NoteBook, Phone, Record
+from benchmarks.synthetic import build_book, contact_rows
+
+
+def sample_book(size):
+    address_book = build_book(AddressBook(), contact_rows(size))
+    # fields the codec keeps as given rather than packed
+    odd = Record(Name("Ім'я, with \"quotes\""), birthday=Birthday("29.02.2000"),
+                 address=Address("вул. Хрещатик, 1"), email=Email("a@b.ua"))
+    odd.phones = [Phone("+380501234567"), Phone("12-34")]
+    address_book.add_record(odd)
+    notebook = NoteBook()
+    notebook.add_note(Note("buy milk", ["shop", "home"]))
+    notebook.add_note(Note("buy milk"))
+    return address_book, notebook
+
+
+@pytest.fixture
+def book():
+    return sample_book(300)
+
+
+def dumped(address_book, notebook, compression=None, block_size=codec.BLOCK_SIZE):
+    file = io.BytesIO()
+    codec.dump(file, address_book.items(), notebook.get_notes(), compression, block_size)
+    return file.getvalue()
+
+
+def loaded(blob):
+    address_book, notebook = AddressBook(), NoteBook()
+    for kind, item in codec.load(io.BytesIO(blob)):
+        if kind == codec.RECORDS:
+            address_book[item[0]] = item[1]
+        else:
+            notebook.add_note(item)
+    return address_book, notebook
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+@pytest.mark.parametrize("block_size", [7, codec.BLOCK_SIZE])
+def test_round_trip(book, compression, block_size):
+    address_book, notebook = book
+    copy, notes = loaded(dumped(address_book, notebook, compression, block_size))
+    assert list(copy) == list(address_book)
+    assert [record.to_dict() for record in copy.values()] == [record.to_dict() for record in address_book.values()]
+    assert notes.to_dict() == notebook.to_dict()
+
+
+def test_save_and_read_into(book, tmp_path):
+    address_book, notebook = book
+    path = str(tmp_path / "book.bin")
+    codec.save(path, address_book, notebook, "zlib")
+    copy, notes = codec.read_into(path, AddressBook(), NoteBook())
+    assert [record.to_dict() for record in copy.values()] == [record.to_dict() for record in address_book.values()]
+    assert copy.search_by_phone("12-3") == [copy["Ім'я, with \"quotes\""]]
+
+
+@pytest.mark.parametrize("blob, message", [
+    (b"", "Not an address book file"),
+    (b"PK\x03\x04\x00\x00", "Not an address book file"),
+    (codec.HEADER.pack(codec.MAGIC, codec.VERSION + 1, 0), "Unsupported address book file version"),
+    (codec.HEADER.pack(codec.MAGIC, codec.VERSION, 9), codec.CORRUPT),
+    (codec.HEADER.pack(codec.MAGIC, codec.VERSION, 0), "Truncated address book file"),
+])
+def test_malformed_headers_are_rejected(blob, message):
+    with pytest.raises(ValueError, match=message):
+        loaded(blob)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_corrupt_input_raises_value_error_only(compression):
+    # truncated or with a few bytes changed, a file either still loads or
+    # raises ValueError, never anything else
+    blob = dumped(*sample_book(40), compression, block_size=8)
+    rng = random.Random(1)
+    for trial in range(800):
+        data = bytearray(blob)
+        if trial % 3 == 0:
+            data = data[:rng.randrange(len(data))]
+        else:
+            for _ in range(rng.randint(1, 4)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+        try:
+            loaded(bytes(data))
+        except ValueError:
+            pass
+
+
+def test_truncated_file_is_not_taken_for_a_shorter_book(book):
+    blob = dumped(*book)
+    with pytest.raises(ValueError, match="Truncated"):
+        loaded(blob[:-1])
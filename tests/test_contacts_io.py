@@ -0,0 +1,76 @@
+import pytest
+
+from Address_Book import contacts_io
+from Address_Book.classes import AddressBook, Birthday, Name, Phone, Record
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_jsonl_rows_of_the_wrong_type_are_rejected(tmp_path):
+    path = write(tmp_path / "contacts.jsonl", "\n".join([
+        '{"name": "Ivan Petrenko", "phones": ["0501234567"]}',
+        '{"name": 5}',
+        '{"name": "Olena", "phones": [501234567]}',
+        '{"name": "Petro", "phones": 501234567}',
+        '{"name": "Taras", "email": 7}',
+        '{"name": "Maria", "birthday": ["01.02.1990"]}',
+        '[1, 2]',
+        '{"name": "Anna", "phone": "0661234567"}',
+    ]))
+    book = AddressBook()
+    report = contacts_io.import_contacts(path, book)
+    assert sorted(book) == ["Anna", "Ivan Petrenko"]
+    assert report.imported == 2
+    assert report.errors == [
+        (2, "name must be a string"),
+        (3, "phones must be a string or a list of strings"),
+        (4, "phones must be a string or a list of strings"),
+        (5, "email must be a string"),
+        (6, "birthday must be a string"),
+        (7, "not a contact record"),
+    ]
+
+
+def test_invalid_values_are_rejected_with_their_line(tmp_path):
+    path = write(tmp_path / "contacts.csv", "name,phones,birthday,address,email\n"
+                                            "Ivan,0501234567,,,\n"
+                                            ",0501234567,,,\n"
+                                            "Olena,12,,,\n"
+                                            "Petro,,31.02.1990,,\n"
+                                            "Taras,,,,not-an-email\n"
+                                            "Ivan,0661234567,,,\n")
+    book = AddressBook()
+    report = contacts_io.import_contacts(path, book)
+    assert list(book) == ["Ivan"]
+    assert [number for number, _ in report.errors] == [3, 4, 5, 6, 7]
+    assert report.errors[-1] == (7, "contact 'Ivan' already exists")
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl", ".vcf", ".jsonl.gz"])
+def test_export_and_import_round_trip(tmp_path, suffix):
+    book = AddressBook()
+    record = Record(Name("Ivan Petrenko"), birthday=Birthday("15.03.1990"))
+    # numbers as the import normalizes them
+    record.add_phone(Phone("+380501234567"))
+    record.add_phone(Phone("+380661234567"))
+    book.add_record(record)
+    book.add_record(Record(Name("Olena, the neighbour")))
+    path = str(tmp_path / f"contacts{suffix}")
+    assert contacts_io.export_contacts(path, book) == 2
+    copy = AddressBook()
+    report = contacts_io.import_contacts(path, copy)
+    assert report.rejected == 0
+    assert [r.to_dict() for r in copy.values()] == [r.to_dict() for r in book.values()]
+
+
+@pytest.mark.parametrize("escaped, text", [
+    (r"a\nb", "a\nb"),
+    (r"a\\nb", "a\\nb"),
+    (r"Doe\, John", "Doe, John"),
+    (r"x\;y\\", "x;y\\"),
+])
+def test_vcf_unescape(escaped, text):
+    assert contacts_io._vcf_unescape(escaped) == text
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from Address_Book import indexes
+from Address_Book.classes import AddressBook, Name, Phone, Record
+from Address_Book.indexes import FuzzyNameIndex, latin
+from benchmarks.synthetic import build_book, contact_rows
+
+
+@pytest.fixture
+def book(monkeypatch):
+    # a small SLACK renumbers the ids several times while the book churns
+    monkeypatch.setattr(indexes, "SLACK", 8)
+    rng = random.Random(1)
+    book = build_book(AddressBook(), contact_rows(600))
+    keys = list(book)
+    for _ in range(300):
+        key = rng.choice(keys)
+        if key in book:
+            record = book[key]
+            del book[key]
+            if rng.random() < 0.5:
+                book[key] = record
+    for key in list(book)[:40]:
+        book[key].add_phone(Phone("0501234567"))
+    book.add_record(Record(Name("No Phones")))
+    return book
+
+
+def by_name(book, query):
+    return {key for key, record in book.items() if query.lower() in str(record.name).lower()}
+
+
+def by_phone(book, query):
+    return {key for key, record in book.items() if any(query in str(phone) for phone in record.phones)}
+
+
+def keys(records):
+    return {record._key for record in records}
+
+
+def test_substring_search_matches_brute_force(book):
+    rng = random.Random(2)
+    for _ in range(300):
+        key = rng.choice(list(book))
+        name = str(book[key].name)
+        start = rng.randrange(len(name))
+        query = name[start:start + rng.randrange(1, 7)]
+        assert keys(book.search_by_name(query)) == by_name(book, query), query
+        phone = str(rng.choice(book[key].phones)) if book[key].phones else "050"
+        start = rng.randrange(len(phone))
+        query = phone[start:start + rng.randrange(1, 8)]
+        assert keys(book.search_by_phone(query)) == by_phone(book, query), query
+
+
+@pytest.mark.parametrize("query", ["", "+", "0", "50", "+3", "zz", "Iv", "і"])
+def test_short_queries_match_brute_force(book, query):
+    assert keys(book.search_by_name(query)) == by_name(book, query)
+    assert keys(book.search_by_phone(query)) == by_phone(book, query)
+
+
+def test_contacts_without_phones_match_no_phone_query(book):
+    assert "No Phones" not in keys(book.search_by_phone(""))
+    assert "No Phones" in keys(book.search_by_name(""))
+
+
+def test_whole_name_lookup(book):
+    for key in list(book)[:50]:
+        assert keys(book.search_records(name=str(book[key].name))) == {key}
+
+
+def test_fuzzy_search_matches_brute_force(book):
+    for key in list(book)[:100]:
+        query = str(book[key].name)[:-1] + "x"
+        expected = {other for other, record in book.items()
+                    if FuzzyNameIndex.distance(latin(query), latin(str(record.name)), 2) <= 2}
+        assert {found for _, found in book.fuzzy_index.similar(query, 2)} == expected, query
+
+
+def test_key_ids_are_freed_and_renumbered(book):
+    assert len(book.key_ids.keys) <= 2 * len(book.key_ids.ids) + indexes.SLACK
+    assert set(book.key_ids.ids) == set(book)
+    for key in list(book):
+        del book[key]
+    assert not book.search_by_name("a")
+    assert not book.key_ids.ids
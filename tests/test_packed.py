@@ -0,0 +1,97 @@
+import json
+import random
+from datetime import date
+
+import pytest
+
+from Address_Book import packed
+from Address_Book.classes import AddressBook, Birthday, Name, Phone, Record
+from Address_Book.packed import MappedAddressBook, PackedFile, encode_record, write_pack
+from Address_Book.query import field
+from benchmarks.synthetic import build_book, contact_rows
+
+TODAY = date(2024, 3, 1)
+
+
+@pytest.fixture
+def books(tmp_path):
+    # the same contacts in a plain book and in a book over a pack file
+    plain = build_book(AddressBook(), contact_rows(300))
+    path = str(tmp_path / "book.pack")
+    write_pack(path, ((key, encode_record(record)) for key, record in plain.items()), [])
+    return plain, MappedAddressBook(PackedFile(path))
+
+
+def change_both(plain, mapped):
+    rng = random.Random(3)
+    keys = list(plain)
+    for n in range(60):
+        key = rng.choice(keys)
+        for book in (plain, mapped):
+            if key in book:
+                del book[key]
+            if n % 2:
+                record = Record(Name(key), birthday=Birthday("29.02.2000"))
+                record.add_phone(Phone("0501234567"))
+                book[key] = record
+    for book in (plain, mapped):
+        book.add_record(Record(Name("Zed New")))
+        book["Zed New"].add_phone(Phone("0991112233"))
+
+
+def names(records):
+    return [str(record.name) for record in records]
+
+
+def walk(book, order):
+    return [names(page) for page in book.pages(7, order, TODAY)]
+
+
+def test_opening_decodes_nothing(books, monkeypatch):
+    _, mapped = books
+    decoded = []
+    monkeypatch.setattr(packed.Record, "from_dict", lambda data: decoded.append(data) or Record(Name(data["name"])))
+    assert len(mapped) == 300
+    assert not decoded
+
+
+def test_first_page_in_insertion_order_decodes_one_page(books, monkeypatch):
+    _, mapped = books
+    loads = []
+    real_loads = json.loads
+    monkeypatch.setattr(packed.json, "loads", lambda blob: loads.append(blob) or real_loads(blob))
+    first = next(mapped.pages(5))
+    assert len(first) == 5
+    assert len(loads) == 5
+    assert not mapped._indexed
+
+
+def test_a_search_builds_only_its_index(books):
+    plain, mapped = books
+    assert names(mapped.search_by_phone("050")) == names(plain.search_by_phone("050"))
+    assert mapped._indexed == {"phone_index"}
+    mapped.query(field("name").contains("ko")).all()
+    assert mapped._indexed == {"phone_index", "name_index"}
+
+
+@pytest.mark.parametrize("order", ["insertion", "name", "birthday"])
+def test_pages_match_a_plain_book(books, order):
+    plain, mapped = books
+    assert walk(mapped, order) == walk(plain, order)
+    change_both(plain, mapped)
+    assert walk(mapped, order) == walk(plain, order)
+
+
+def test_searches_match_a_plain_book_after_changes(books):
+    plain, mapped = books
+    mapped.search_by_name("a")
+    change_both(plain, mapped)
+    for query in ("ko", "ol", "Zed"):
+        assert names(mapped.search_by_name(query)) == names(plain.search_by_name(query))
+    for query in ("050", "099", "12"):
+        assert names(mapped.search_by_phone(query)) == names(plain.search_by_phone(query))
+    assert names(mapped.search_by_name_fuzzy("Melnik")) == names(plain.search_by_name_fuzzy("Melnik"))
+    assert ([(when, str(r.name)) for when, r in mapped.birthdays_within(30, TODAY)]
+            == [(when, str(r.name)) for when, r in plain.birthdays_within(30, TODAY)])
+    condition = field("phone").contains("050") & field("name").contains("o")
+    assert names(mapped.query(condition, order="name").all()) == names(plain.query(condition, order="name").all())
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from Address_Book.classes import AddressBook, NoteBook
+from Address_Book.client import BookClient
+from Address_Book.server import BookServer, is_local
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "book.sock")
+    server = BookServer(AddressBook(), NoteBook())
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve(path, ready=lambda _: ready.set())),
+                              daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    return server, path
+
+
+def test_a_write_waits_for_the_reads_before_it(server, monkeypatch):
+    server, path = server
+    read = BookServer._read
+
+    def slow_read(self, request):
+        time.sleep(0.2)
+        return read(self, request)
+
+    monkeypatch.setattr(BookServer, "_read", slow_read)
+    with BookClient(path, timeout=5) as book:
+        answers = book.pipeline([("get", "Ann"), ("add", "Ann", "0501234567"), ("get", "Ann")])
+    assert isinstance(answers[0], ValueError)
+    assert not isinstance(answers[1], ValueError)
+    assert "0501234567" in str(answers[2])
+
+
+def test_answers_come_in_request_order(server):
+    _, path = server
+    with BookClient(path, timeout=5) as book:
+        requests = []
+        for n in range(50):
+            requests += [("add", f"Contact {n}"), ("count",)]
+        answers = book.pipeline(requests)
+    assert answers[1::2] == list(range(1, 51))
+
+
+def test_a_file_in_the_way_of_the_socket_is_kept(tmp_path):
+    path = tmp_path / "book.sock"
+    path.write_text("not a socket")
+    server = BookServer(AddressBook(), NoteBook())
+    with pytest.raises(ValueError, match="not a socket"):
+        asyncio.run(server.serve(str(path)))
+    assert path.read_text() == "not a socket"
+
+
+@pytest.mark.parametrize("address, local", [
+    ("127.0.0.1:8765", True), ("localhost:8765", True), ("::1:8765", True), ("8765", True),
+    ("/tmp/book.sock", True), ("0.0.0.0:8765", False), ("192.168.1.5:8765", False),
+])
+def test_only_loopback_tcp_is_local(address, local):
+    assert is_local(address) == local
+
+
+def test_remote_addresses_are_refused_by_default():
+    server = BookServer(AddressBook(), NoteBook())
+    with pytest.raises(ValueError, match="loopback"):
+        asyncio.run(server.serve("0.0.0.0:8765"))
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from Address_Book.classes import AddressBook, Name, Phone, Record
+from Address_Book.query import field
+from Address_Book.sharded import ShardedAddressBook
+from benchmarks.synthetic import build_book, contact_rows
+
+TODAY = date(2024, 3, 1)
+
+
+@pytest.fixture
+def books():
+    # the same contacts in a plain book and in a sharded one
+    plain = build_book(AddressBook(), contact_rows(400))
+    sharded = ShardedAddressBook(build_book(AddressBook(), contact_rows(400)), 3)
+    yield plain, sharded
+    sharded.close()
+
+
+def keys(records):
+    return [record._key for record in records]
+
+
+def test_the_book_drops_its_indexes(books):
+    _, sharded = books
+    assert not sharded.book.key_ids.ids
+    assert not sharded.book.name_index.contains("a")
+
+
+def test_searches_match_a_plain_book_after_changes(books):
+    plain, sharded = books
+    for book in (plain, sharded):
+        book.add_record(Record(Name("Zed Neu"), Phone("0509998877")))
+        del book[next(iter(book))]
+        book[list(book)[5]].add_phone(Phone("0991112233"))
+    for query in ("an", "Mel", "Zed", "xx"):
+        assert keys(sharded.search_by_name(query)) == keys(plain.search_by_name(query))
+    for query in ("0509998", "99111", "050"):
+        assert keys(sharded.search_by_phone(query)) == keys(plain.search_by_phone(query))
+    assert keys(sharded.search_by_name_fuzzy("Melnik")) == keys(plain.search_by_name_fuzzy("Melnik"))
+    assert keys(sharded.birthdays_on(3, TODAY)) == keys(plain.birthdays_on(3, TODAY))
+    assert keys(sharded.search_records(name="Zed Neu")) == ["Zed Neu"]
+    condition = field("phone").contains("050") & field("name").contains("o")
+    assert keys(sharded.query(condition, order="name").all()) == keys(plain.query(condition, order="name").all())
@@ -0,0 +1,54 @@
+import pytest
+
+from Address_Book import sort
+
+
+def make(root, *paths):
+    for path in paths:
+        file = root / path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(path)
+
+
+def test_names_differing_in_case_do_not_collide(tmp_path):
+    make(tmp_path, "a/Photo.JPG", "b/photo.jpg", "Image/PHOTO.jpg")
+    report = sort.sort_tree(tmp_path, workers=2)
+    names = sorted(path.name for path in (tmp_path / "Image").iterdir())
+    assert names == ["PHOTO.jpg", "Photo (1).JPG", "photo (2).jpg"]
+    assert report.renamed == 2
+    assert (tmp_path / "Image" / "PHOTO.jpg").read_text() == "Image/PHOTO.jpg"
+
+
+def test_a_move_never_replaces_a_file(tmp_path):
+    make(tmp_path, "new.txt", "old.txt")
+    with pytest.raises(FileExistsError):
+        sort.move_no_replace(tmp_path / "new.txt", tmp_path / "old.txt")
+    assert (tmp_path / "old.txt").read_text() == "old.txt"
+    assert (tmp_path / "new.txt").exists()
+    sort.move_no_replace(tmp_path / "new.txt", tmp_path / "moved.txt")
+    assert not (tmp_path / "new.txt").exists()
+    assert (tmp_path / "moved.txt").read_text() == "new.txt"
+
+
+def test_unique_name_keeps_multi_part_suffixes():
+    taken = {"arc.tar.gz"}
+    assert sort.unique_name(taken, "ARC.tar.gz", ".tar.gz") == "ARC (1).tar.gz"
+    assert sort.unique_name(taken, "arc.tar.gz", ".tar.gz") == "arc (2).tar.gz"
+
+
+@pytest.mark.parametrize("name, suffix", [
+    ("photo.JPG", ".JPG"),
+    ("arc.Tar.GZ", ".Tar.GZ"),
+    ("İSTANBUL.JPG", ".JPG"),
+    ("İ.İ.tar.gz", ".tar.gz"),
+    ("notes", ""),
+    (".bashrc", ""),
+])
+def test_suffix_is_spelled_as_in_the_name(name, suffix):
+    assert sort.Classifier().suffix(name) == suffix
+
+
+def test_a_suffix_longer_when_lowercased_is_cut_correctly():
+    classifier = sort.Classifier({"Dotted": [".İz"]})
+    assert classifier.suffix("file.İZ") == ".İZ"
+    assert classifier.classify(sort.Path("file.İZ")) == "Dotted"
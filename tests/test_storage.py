@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+
+import pytest
+
+from Address_Book.classes import Birthday, Name, Note, Phone, Record
+from Address_Book.storage import BinaryStorage, JournalStorage, PickleStorage
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # the storages keep their files in the working directory by default
+    monkeypatch.chdir(tmp_path)
+
+
+def contact(name, *phones):
+    record = Record(Name(name))
+    for phone in phones:
+        record.add_phone(Phone(phone))
+    return record
+
+
+def fill_journal():
+    storage = JournalStorage()
+    address_book, notebook = storage.open()
+    address_book.add_record(contact("Ivan", "0501234567"))
+    notebook.add_note(Note("buy milk", ["shop"]))
+    storage.close()
+
+
+def test_binary_storage_imports_and_retires_the_journal():
+    fill_journal()
+    storage = BinaryStorage()
+    address_book, notebook = storage.open()
+    assert list(address_book) == ["Ivan"]
+    assert [note.text for note in notebook.get_notes()] == ["buy milk"]
+    storage.close()
+    assert not os.path.exists("address_book.snapshot")
+    assert os.path.exists("address_book.snapshot.imported")
+
+    address_book, _ = BinaryStorage().open()
+    assert list(address_book) == ["Ivan"]
+
+
+def reopen():
+    storage = JournalStorage()
+    return storage, *storage.open()
+
+
+def test_journal_replays_contacts_and_notes():
+    storage, address_book, notebook = reopen()
+    address_book.add_record(contact("Ivan", "0501234567"))
+    address_book.add_record(contact("Olena"))
+    address_book["Olena"].add_phone(Phone("0661234567"))
+    del address_book["Ivan"]
+    notebook.add_note(Note("call", ["work"]))
+    notebook.add_note(Note("call"))
+    # the second of two notes with the same text
+    notebook.get_notes()[1].add_tag("home")
+    notebook.edit_note("call", "call back")
+    # a crash: the journal is flushed but the storage never closed
+    storage.sync()
+
+    _, address_book, notebook = reopen()
+    assert list(address_book) == ["Olena"]
+    assert [str(phone) for phone in address_book["Olena"].phones] == ["0661234567"]
+    assert [(note.text, note.tags) for note in notebook.get_notes()] == [("call back", ["work"]), ("call", ["home"])]
+
+
+def test_notes_with_the_same_text_replay_by_id():
+    storage, _, notebook = reopen()
+    for tags in (["a"], ["b"], ["c"]):
+        notebook.add_note(Note("same", tags))
+    storage.close()
+    storage, _, notebook = reopen()
+    notebook.delete_note_by_text("same")
+    notebook.get_notes()[1].add_tag("d")
+    storage.sync()
+    _, _, notebook = reopen()
+    assert [note.tags for note in notebook.get_notes()] == [["b"], ["c", "d"]]
+
+
+def test_compaction_folds_the_journal_into_the_snapshot():
+    storage = JournalStorage(compact_every=10)
+    address_book, _ = storage.open()
+    for n in range(35):
+        address_book.add_record(contact(f"Contact {n}"))
+    storage.close()
+    assert not os.path.exists("address_book.journal.old")
+    _, address_book, _ = reopen()
+    assert len(address_book) == 35
+
+
+def fail_to_fold(self):
+    raise OSError("disk full")
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_a_failed_fold_is_not_overwritten(monkeypatch):
+    storage = JournalStorage(compact_every=10)
+    address_book, _ = storage.open()
+    fold = JournalStorage._fold_sealed
+    monkeypatch.setattr(JournalStorage, "_fold_sealed", fail_to_fold)
+    for n in range(10):
+        address_book.add_record(contact(f"Contact {n}"))
+    storage._compactor.join()
+    assert os.path.exists("address_book.journal.old")
+    # the next compaction folds what the failed one left first
+    monkeypatch.setattr(JournalStorage, "_fold_sealed", fold)
+    for n in range(10, 20):
+        address_book.add_record(contact(f"Contact {n}"))
+    storage.close()
+    _, address_book, _ = reopen()
+    assert len(address_book) == 20
+
+
+def test_a_torn_journal_tail_is_ignored():
+    storage, address_book, _ = reopen()
+    address_book.add_record(contact("Ivan"))
+    storage.sync()
+    with open("address_book.journal", "a", encoding="utf-8") as file:
+        file.write('{"op": "put", "key": "Ol')
+    _, address_book, _ = reopen()
+    assert list(address_book) == ["Ivan"]
+
+
+def test_the_pickle_book_is_imported_once_and_retired():
+    storage = PickleStorage()
+    address_book, notebook = storage.open()
+    address_book.add_record(contact("Ivan"))
+    notebook.add_note(Note("buy milk"))
+    storage.close()
+    _, address_book, notebook = reopen()
+    assert list(address_book) == ["Ivan"]
+    assert os.path.exists("address_book.pkl.imported")
+    assert not os.path.exists("address_book.pkl")
+    assert not os.path.exists("notebook.txt")
+
+
+def test_direct_changes_reach_the_journal():
+    storage, address_book, notebook = reopen()
+    address_book.add_record(contact("Ivan", "0501234567"))
+    notebook.add_note(Note("buy milk"))
+    storage.close()
+    storage, address_book, notebook = reopen()
+    record = address_book["Ivan"]
+    record.birthday = Birthday("01.02.1990")
+    record.phones[0].value = "0661234567"
+    notebook.get_notes()[0].text = "buy bread"
+    storage.sync()
+    _, address_book, notebook = reopen()
+    assert address_book["Ivan"].to_dict()["birthday"] == "01.02.1990"
+    assert address_book.search_by_phone("066") == [address_book["Ivan"]]
+    assert notebook.get_note_by_text("buy bread") is not None
+
+
+def test_held_back_changes_are_saved_without_another_command():
+    storage = PickleStorage(flush_interval=0.1)
+    storage.lock = threading.Lock()
+    address_book, _ = storage.open()
+    for name in ("Ivan", "Olena"):
+        with storage.lock:
+            address_book.add_record(contact(name))
+            storage.commit()
+    assert storage.policy.pending
+    time.sleep(0.3)
+    assert not storage.policy.pending
+    address_book, _ = PickleStorage().open()
+    assert list(address_book) == ["Ivan", "Olena"]
+
+
+def test_pickle_storage_imports_the_journal_once():
+    fill_journal()
+    storage = PickleStorage(legacy=JournalStorage())
+    address_book, notebook = storage.open()
+    assert list(address_book) == ["Ivan"]
+    assert [note.text for note in notebook.get_notes()] == ["buy milk"]
+    storage.close()
+    assert os.path.exists("address_book.snapshot.imported")
+    assert list(PickleStorage(legacy=JournalStorage()).open()[0]) == ["Ivan"]